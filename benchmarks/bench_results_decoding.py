@@ -0,0 +1,92 @@
+"""
+Benchmark of BeePop+ results decoding: the previous pandas text parser against the
+NumPy columnar decoder used by BeePopModel.run_beepop.
+
+Runs a 12 year simulation with the cedar_grove_NC_weather.txt example weather and times
+fetching and decoding the results both ways.
+
+Usage:
+    python benchmarks/bench_results_decoding.py [--repeat N]
+"""
+
+import os
+import io
+import sys
+import time
+import ctypes
+import argparse
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.abspath(os.path.join(BENCH_DIR, os.pardir))
+sys.path.insert(0, PROJECT_DIR)
+
+from pybeepop import PyBeePop
+from pybeepop.results import colnames, decode_results, N_HEADER_LINES
+
+WEATHER_FILE = os.path.join(PROJECT_DIR, "example_data/cedar_grove_NC_weather.txt")
+
+
+def legacy_parse(lib):
+    """Fetch and parse results the way run_beepop did before the columnar decoder."""
+    theCount = ctypes.c_int(0)
+    p_Results = ctypes.POINTER(ctypes.c_char_p)()
+    lib.GetResultsCPA(ctypes.byref(p_Results), ctypes.byref(theCount))
+    n_result_lines = int(theCount.value)
+    out_lines = []
+    for j in range(0, n_result_lines - 1):
+        out_lines.append(p_Results[j].decode("utf-8", errors="strict"))
+    out_str = io.StringIO("\n".join(out_lines))
+    return pd.read_csv(out_str, sep="\\s+", skiprows=3, names=colnames, dtype={"Date": str})
+
+
+def columnar_parse(model):
+    """Fetch and decode results with BeePopModel.get_result_lines and decode_results."""
+    lines = model.get_result_lines()
+    return decode_results(lines[N_HEADER_LINES:-1]).to_dataframe()
+
+
+def run_simulation(model):
+    if not model.lib.RunSimulation():
+        raise RuntimeError("Error running BeePop+ simulation.")
+
+
+def best_time(func, repeat, setup=None):
+    """Return the fastest of several timed calls of func, and the last result."""
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=10, help="timed repetitions (best is reported)")
+    args = parser.parse_args()
+
+    beepop = PyBeePop()
+    beepop.load_weather(WEATHER_FILE)
+    beepop.set_parameters({"SimStart": "01/01/2010", "SimEnd": "12/31/2021"})
+    model = beepop.beepop
+
+    # the pandas path does not clear the results buffer, so one simulation serves all repeats;
+    # get_result_lines clears it, so the columnar path re-runs the (untimed) simulation
+    run_simulation(model)
+    legacy_time, legacy_df = best_time(lambda: legacy_parse(model.lib), args.repeat)
+    columnar_df = columnar_parse(model)
+    pd.testing.assert_frame_equal(legacy_df, columnar_df, check_exact=True)
+    columnar_time, columnar_df = best_time(
+        lambda: columnar_parse(model), args.repeat, setup=lambda: run_simulation(model)
+    )
+    print("rows decoded: {}".format(len(columnar_df)))
+    print("pandas text parse:  {:8.2f} ms".format(legacy_time * 1000))
+    print("columnar decode:    {:8.2f} ms".format(columnar_time * 1000))
+    print("speedup:            {:8.2f}x".format(legacy_time / columnar_time))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+"""
+Benchmark suite for pybeepop and the BeePop+ run path.
+
+Times cold import and library initialization, weather loading, parameter setting, 1 and 10 year
+runs, result decoding alone, JSON export and batch throughput against the number of worker
+processes. Inputs are the example_data/cedar_grove_NC_weather.txt weather and the
+example_data/example_parameters.txt parameters.
+
+Results are written as JSON, so runs from different releases can be compared:
+
+Usage:
+    python benchmarks/run_benchmarks.py [--repeat N] [--output results.json]
+        [--only NAME [NAME ...]] [--batch-size N] [--workers 1 2 4]
+    python benchmarks/run_benchmarks.py --compare baseline.json [--threshold 0.2]
+
+With --compare, the new medians are compared with the baseline file and the script exits with
+status 1 if any benchmark became slower by more than the threshold (a fraction, default 0.2).
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import datetime
+import statistics
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.abspath(os.path.join(BENCH_DIR, os.pardir))
+sys.path.insert(0, PROJECT_DIR)
+
+from pybeepop import PyBeePop
+from pybeepop.tools import BeePopModel
+from pybeepop.inputs import input_cache
+from pybeepop.results import decode_results, N_HEADER_LINES
+
+WEATHER_FILE = os.path.join(PROJECT_DIR, "example_data/cedar_grove_NC_weather.txt")
+PARAMETER_FILE = os.path.join(PROJECT_DIR, "example_data/example_parameters.txt")
+ONE_YEAR = {"SimStart": "01/01/2015", "SimEnd": "12/31/2015"}
+TEN_YEARS = {"SimStart": "01/01/2010", "SimEnd": "12/31/2019"}
+
+BENCHMARKS = []  # (name, function) in run order
+
+
+def benchmark(func):
+    """Register a benchmark. The function takes the repeat count and returns a list of times."""
+    BENCHMARKS.append((func.__name__, func))
+    return func
+
+
+def time_calls(func, repeat, setup=None):
+    """Return the wall times of repeated calls of func, running setup untimed before each."""
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def time_subprocess(code, repeat):
+    """Return the times printed by a Python snippet run in fresh interpreters."""
+    times = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=PROJECT_DIR,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        times.append(float(output.strip().splitlines()[-1]))
+    return times
+
+
+def new_model(parameters):
+    """Return a PyBeePop object with the example weather and parameters plus extra ones."""
+    beepop = PyBeePop(weather_file=WEATHER_FILE)
+    beepop.load_parameter_file(PARAMETER_FILE)
+    beepop.set_parameters(parameters)
+    return beepop
+
+
+@benchmark
+def cold_import(repeat):
+    return time_subprocess(
+        "import time; t = time.perf_counter(); from pybeepop import PyBeePop; "
+        "print(time.perf_counter() - t)",
+        repeat,
+    )
+
+
+@benchmark
+def cold_library_init(repeat):
+    return time_subprocess(
+        "import time; from pybeepop import PyBeePop; t = time.perf_counter(); PyBeePop(); "
+        "print(time.perf_counter() - t)",
+        repeat,
+    )
+
+
+@benchmark
+def cold_first_run(repeat):
+    """Import, initialization, weather loading and a 1 year run in a fresh interpreter."""
+    return time_subprocess(
+        "import time; t = time.perf_counter(); from pybeepop import PyBeePop; "
+        "beepop = PyBeePop(weather_file={!r}); beepop.set_parameters({!r}); "
+        "beepop.run_model(); print(time.perf_counter() - t)".format(WEATHER_FILE, ONE_YEAR),
+        repeat,
+    )
+
+
+@benchmark
+def model_init(repeat):
+    lib_file = PyBeePop().lib_file
+    return time_calls(lambda: BeePopModel(lib_file), repeat)
+
+
+@benchmark
+def weather_load(repeat):
+    beepop = PyBeePop()
+
+    def forget_weather():
+        input_cache.clear()
+        beepop.beepop.session().pop("weather", None)
+
+    return time_calls(lambda: beepop.load_weather(WEATHER_FILE), repeat, setup=forget_weather)
+
+
+@benchmark
+def weather_reload(repeat):
+    beepop = PyBeePop(weather_file=WEATHER_FILE)
+    return time_calls(lambda: beepop.load_weather(WEATHER_FILE), repeat)
+
+
+@benchmark
+def parameter_set(repeat):
+    beepop = PyBeePop(weather_file=WEATHER_FILE)
+    return time_calls(
+        lambda: beepop.load_parameter_file(PARAMETER_FILE), repeat, setup=beepop.reset_parameters
+    )
+
+
+@benchmark
+def run_1_year(repeat):
+    beepop = new_model(ONE_YEAR)
+    return time_calls(beepop.run_model, repeat)
+
+
+@benchmark
+def run_10_years(repeat):
+    beepop = new_model(TEN_YEARS)
+    return time_calls(beepop.run_model, repeat)
+
+
+@benchmark
+def simulate_10_years(repeat):
+    """The native RunSimulation call alone."""
+    model = new_model(TEN_YEARS).beepop
+    return time_calls(model.lib.RunSimulation, repeat, setup=model.lib.ClearResultsBuffer)
+
+
+@benchmark
+def result_parse_10_years(repeat):
+    """Decoding the result lines of a 10 year run into a DataFrame, without the simulation."""
+    model = new_model(TEN_YEARS).beepop
+    model.lib.RunSimulation()
+    lines = model.get_result_lines()[N_HEADER_LINES:-1]
+    return time_calls(lambda: decode_results(lines).to_dataframe(), repeat)
+
+
+@benchmark
+def json_export_10_years(repeat):
+    beepop = new_model(TEN_YEARS)
+    beepop.run_model()
+    return time_calls(lambda: beepop.get_output(format="json"), repeat)
+
+
+def batch_throughput(batch_size, worker_counts):
+    """Return runs/sec of run_batch with 1 year scenarios for each worker count."""
+    beepop = new_model(ONE_YEAR)
+    scenarios = [{"ICWorkerAdults": 5000 + 100 * i} for i in range(batch_size)]
+    throughput = dict()
+    for n_workers in worker_counts:
+        start = time.perf_counter()
+        results = beepop.run_batch(scenarios, n_workers=n_workers)
+        elapsed = time.perf_counter() - start
+        if not all(result.ok for result in results):
+            raise RuntimeError("Batch benchmark runs failed.")
+        throughput[str(n_workers)] = {"seconds": elapsed, "runs_per_sec": batch_size / elapsed}
+    return throughput
+
+
+def summarize(times):
+    return {
+        "unit": "seconds",
+        "repeat": len(times),
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.mean(times),
+        "stdev": statistics.stdev(times) if len(times) > 1 else 0.0,
+        "times": times,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=PROJECT_DIR,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metadata():
+    beepop = PyBeePop()
+    return {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "beepop_version": beepop.version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def compare(results, baseline, threshold):
+    """Print the change of each median against a baseline and return the regressed names."""
+    regressions = []
+    print("\n{:<26} {:>12} {:>12} {:>9}".format("benchmark", "baseline", "current", "change"))
+    for name, current in results["benchmarks"].items():
+        old = baseline.get("benchmarks", {}).get(name)
+        if old is None:
+            continue
+        change = current["median"] / old["median"] - 1
+        flag = "  REGRESSION" if change > threshold else ""
+        print(
+            "{:<26} {:>10.2f}ms {:>10.2f}ms {:>+8.1%}{}".format(
+                name, old["median"] * 1000, current["median"] * 1000, change, flag
+            )
+        )
+        if change > threshold:
+            regressions.append(name)
+    for n_workers, current in results.get("batch_throughput", {}).items():
+        old = baseline.get("batch_throughput", {}).get(n_workers)
+        if old is None:
+            continue
+        change = old["runs_per_sec"] / current["runs_per_sec"] - 1
+        name = "batch_{}_workers".format(n_workers)
+        flag = "  REGRESSION" if change > threshold else ""
+        print(
+            "{:<26} {:>8.1f}run/s {:>8.1f}run/s {:>+8.1%}{}".format(
+                name, old["runs_per_sec"], current["runs_per_sec"], change, flag
+            )
+        )
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=5, help="timed repetitions per benchmark")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--only", nargs="+", help="run only these benchmarks (and 'batch')")
+    parser.add_argument("--batch-size", type=int, default=32, help="scenarios per batch")
+    parser.add_argument(
+        "--workers", type=int, nargs="+", help="worker counts for batch throughput"
+    )
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    parser.add_argument(
+        "--threshold", type=float, default=0.2, help="slowdown counted as a regression"
+    )
+    args = parser.parse_args()
+
+    results = {"metadata": metadata(), "benchmarks": dict()}
+    for name, func in BENCHMARKS:
+        if args.only and name not in args.only:
+            continue
+        summary = summarize(func(args.repeat))
+        results["benchmarks"][name] = summary
+        print(
+            "{:<26} median {:>10.2f} ms   min {:>10.2f} ms".format(
+                name, summary["median"] * 1000, summary["min"] * 1000
+            )
+        )
+    if not args.only or "batch" in args.only:
+        worker_counts = args.workers
+        if worker_counts is None:
+            cpus = os.cpu_count() or 1
+            worker_counts = sorted({1, 2, 4, cpus} & set(range(1, cpus + 1)))
+        results["batch_throughput"] = batch_throughput(args.batch_size, worker_counts)
+        for n_workers, values in results["batch_throughput"].items():
+            print(
+                "batch, {:>2} workers         {:>10.1f} runs/sec".format(
+                    int(n_workers), values["runs_per_sec"]
+                )
+            )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,40 @@
-from .pybeepop import PyBeePop
+"""
+pybeepop - BeePop+ Wrapper for Python
+
+The public classes and functions are imported from their submodules on first use, so that
+`import pybeepop` stays cheap for short-lived processes.
+"""
+
+import importlib
+
+_exports = {
+    "PyBeePop": ".pybeepop",
+    "ScenarioResult": ".batch",
+    "run_batch": ".batch",
+    "iter_batch": ".batch",
+    "ResultStore": ".store",
+    "LibraryPool": ".pool",
+    "AsyncPyBeePop": ".async_pybeepop",
+    "PoolFullError": ".async_pybeepop",
+    "ResultCache": ".cache",
+    "Campaign": ".campaign",
+    "Ensemble": ".ensemble",
+    "ProcessExecutor": ".executors",
+    "SocketExecutor": ".executors",
+    "SupervisedExecutor": ".executors",
+    "run_worker": ".executors",
+}
+
+__all__ = list(_exports)
+
+
+def __getattr__(name):
+    if name not in _exports:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    value = getattr(importlib.import_module(_exports[name], __name__), name)
+    globals()[name] = value  # later lookups skip this function
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,437 @@
+"""
+pybeepop - asyncio interface to BeePop+
+
+AsyncPyBeePop offers the PyBeePop interface as coroutines for use in asyncio services.
+Parameters and inputs are kept on the AsyncPyBeePop object and sent with each run to an
+isolated BeePop+ instance from a LibraryPool, so simulations run on worker threads without
+blocking the event loop and concurrent requests do not share state.
+"""
+
+import os
+import asyncio
+import functools
+import weakref
+import concurrent.futures
+from .pool import LibraryPool
+from .batch import ScenarioResult, _enumerate_scenarios
+from .inputs import input_cache, is_path, format_weather_arrays, format_residue_arrays
+from .parameters import read_parameter_file, validate_parameter
+
+_limiters = weakref.WeakKeyDictionary()  # the _Limiter of each LibraryPool used asynchronously
+
+
+class PoolFullError(RuntimeError):
+    """Raised when a request arrives while the pool is busy and its wait queue is full."""
+
+
+class _Limiter:
+    """Limits concurrent simulations to the pool size and the number of queued requests.
+
+    There is one per pool, shared by every AsyncPyBeePop object that runs on it.
+    """
+
+    def __init__(self, size, max_queue):
+        self.size = size
+        self.max_queue = max_queue
+        self.waiting = 0
+        self.running = 0
+        self.semaphore = None
+
+    def check(self):
+        if self.semaphore is None:  # created lazily so it binds to the running event loop
+            self.semaphore = asyncio.Semaphore(self.size)
+        if (
+            self.max_queue is not None
+            and self.semaphore.locked()
+            and self.waiting >= self.max_queue
+        ):
+            raise PoolFullError(
+                "All {} BeePop+ instances are busy and {} requests are already waiting.".format(
+                    self.size, self.waiting
+                )
+            )
+
+
+class AsyncPyBeePop:
+    """Asyncio wrapper for the BeePop+ honey bee colony simulation model.
+
+    Example:
+        model = AsyncPyBeePop(weather_file=weather, pool_size=8)
+        await model.set_parameters({"ICWorkerAdults": 20000})
+        output = await model.run_model(timeout=30)
+    """
+
+    def __init__(
+        self,
+        lib_file=None,
+        parameter_file=None,
+        weather_file=None,
+        residue_file=None,
+        verbose=False,
+        pool=None,
+        pool_size=None,
+        max_queue=None,
+    ):
+        """Create an AsyncPyBeePop object.
+
+        Args:
+            lib_file (str, optional): Path to the BeePop+ shared library (.dll or .so).
+            parameter_file (str, optional): Path to a txt file of BeePop+ parameters where each
+                line specifies parameter=value. Defaults to None.
+            weather_file (str, optional): Path to a weather file, or in-memory weather rows.
+                Defaults to None.
+            residue_file (str, optional): Path to a residue file, or in-memory residue rows.
+                Defaults to None.
+            verbose (bool, optional): Print additional debugging statements? Defaults to False.
+            pool (LibraryPool, optional): Pool of BeePop+ instances to run on. Several
+                AsyncPyBeePop objects can share one pool, and then share its slots and wait
+                queue. Defaults to a new pool.
+            pool_size (int, optional): Number of instances of a new pool, which is also the
+                number of simulations run at once. Defaults to the CPU count.
+            max_queue (int, optional): Number of requests that may wait for a free instance,
+                across all objects sharing the pool. Further requests raise PoolFullError
+                straight away. Defaults to no limit, or the limit already set on the pool.
+
+        Raises:
+            FileNotFoundError: If a provided file does not exist at the specified path.
+            ValueError: If max_queue differs from the limit already set on a shared pool.
+        """
+        self.verbose = verbose
+        self._owns_pool = pool is None
+        self.pool = pool if pool is not None else LibraryPool(lib_file, pool_size, verbose)
+        self.lib_file = self.pool.lib_file
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.pool.size)
+        self._limiter = _limiters.get(self.pool)
+        if self._limiter is None:
+            self._limiter = _limiters[self.pool] = _Limiter(self.pool.size, max_queue)
+        elif max_queue is not None and max_queue != self._limiter.max_queue:
+            raise ValueError(
+                "The pool already has a wait queue of {} requests.".format(
+                    self._limiter.max_queue
+                )
+            )
+        self.parameters = None
+        self.parameter_file = None
+        self.weather_file = None
+        self.residue_file = None
+        self.output = None
+        self.error_log = None
+        self.info_log = None
+        if parameter_file is not None:
+            self._read_parameter_file(parameter_file)
+        if weather_file is not None:
+            self._check_input(weather_file, "Weather")
+            self.weather_file = weather_file
+        if residue_file is not None:
+            self._check_input(residue_file, "Residue")
+            self.residue_file = residue_file
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.exit()
+
+    @property
+    def running(self):
+        """Number of simulations currently running."""
+        return self._limiter.running
+
+    @property
+    def waiting(self):
+        """Number of requests waiting for a free instance."""
+        return self._limiter.waiting
+
+    async def _call(self, func, *args, timeout=None):
+        """Run a blocking function on a worker thread once a pool slot is free.
+
+        A timeout or cancellation stops the caller from waiting, but a simulation that has
+        already started cannot be interrupted; its slot is freed when it finishes.
+        """
+        return await asyncio.wait_for(self._call_in_slot(func, *args), timeout)
+
+    async def _call_in_slot(self, func, *args):
+        limiter = self._limiter
+        limiter.check()
+        limiter.waiting += 1
+        try:
+            await limiter.semaphore.acquire()
+        finally:
+            limiter.waiting -= 1
+        loop = asyncio.get_running_loop()
+        try:
+            future = loop.run_in_executor(self._executor, functools.partial(func, *args))
+        except BaseException:
+            limiter.semaphore.release()
+            raise
+        limiter.running += 1
+
+        def finished(_):
+            limiter.running -= 1
+            limiter.semaphore.release()
+
+        future.add_done_callback(finished)
+        return await asyncio.shield(future)
+
+    def _check_input(self, source, name):
+        if is_path(source) and not os.path.isfile(source):
+            raise FileNotFoundError("{} file does not exist at path: {}!".format(name, source))
+
+    def _read_parameter_file(self, parameter_file):
+        if not os.path.isfile(parameter_file):
+            raise FileNotFoundError(
+                "Paramter file does not exist at path: {}!".format(parameter_file)
+            )
+        self._update_parameters(read_parameter_file(parameter_file))
+        self.parameter_file = parameter_file
+
+    def _update_parameters(self, parameters):
+        for name, value in parameters.items():  # validate before changing any state
+            validate_parameter(name, value)
+        if self.parameters is None:
+            self.parameters = dict()
+        self.parameters.update((k.lower(), v) for k, v in parameters.items())
+
+    async def set_parameters(self, parameters):
+        """Set BeePop+ parameters based on a dictionary {parameter: value}.
+
+        Parameters are checked straight away and sent to BeePop+ with each run.
+
+        Args:
+            parameters (dict): dictionary of parameteres {parameter: value}.
+
+        Raises:
+            TypeError: If parameters is not a dict.
+            ValueError: If the parameter is not a valid BeePop+ parameter listed in the docs, or its
+                value does not match the parameter's type.
+        """
+        if (parameters is not None) and (not isinstance(parameters, dict)):
+            raise TypeError("parameters must be a named dictionary of BeePop+ parameters")
+        if parameters:
+            self._update_parameters(parameters)
+
+    def get_parameters(self):
+        """Return all parameters that have been set by the user."""
+        return dict(self.parameters or {})
+
+    async def reset_parameters(self):
+        """Return all BeePop+ parameters to their default values, keeping the loaded inputs."""
+        self.parameters = None
+        self.parameter_file = None
+
+    async def load_parameter_file(self, parameter_file):
+        """Load a .txt file of parameter values to set. Each row of the file is a string with the
+        format 'paramter=value'.
+
+        Raises:
+            FileNotFoundError: If the provided file does not exist at the specified path.
+            ValueError: If a line is not of the form name=value, or a listed parameter is not a
+                valid BeePop+ parameter.
+        """
+        self._read_parameter_file(parameter_file)
+
+    async def load_weather(self, weather_file):
+        """Load a weather file, or in-memory weather rows, for the following runs.
+
+        The weather is read and prepared on a worker thread, so the first run with it does not
+        have to.
+
+        Raises:
+            FileNotFoundError: If the provided file does not exist at the specified path.
+            OSError: If the weather file cannot be read.
+        """
+        self._check_input(weather_file, "Weather")
+        await self._prepare_input(weather_file, "Weather")
+        self.weather_file = weather_file
+
+    async def load_residue_file(self, residue_file):
+        """Load a residue file, or in-memory residue rows, for the following runs.
+
+        Raises:
+            FileNotFoundError: If the provided file does not exist at the specified path.
+            OSError: If the residue file cannot be read.
+        """
+        self._check_input(residue_file, "Residue")
+        await self._prepare_input(residue_file, "Residue")
+        self.residue_file = residue_file
+
+    async def load_weather_array(
+        self, dates, tmax, tmin, tavg, wind, rain, daylight=None, decimals=2
+    ):
+        """Load daily weather held as arrays for the following runs, without a weather file.
+
+        The rows are formatted on a worker thread. See PyBeePop.load_weather_array for the
+        arguments.
+
+        Raises:
+            ValueError: If the series differ in length or contain missing or non-finite values.
+        """
+        format_weather = functools.partial(
+            format_weather_arrays, daylight=daylight, decimals=decimals
+        )
+        self.weather_file = await asyncio.get_running_loop().run_in_executor(
+            self._executor, format_weather, dates, tmax, tmin, tavg, wind, rain
+        )
+
+    async def load_residue_array(self, dates, nectar, pollen, significant_digits=6):
+        """Load daily pesticide residues held as arrays for the following runs, without a
+        residue file. See PyBeePop.load_residue_array for the arguments.
+
+        Raises:
+            ValueError: If the series differ in length or contain missing or non-finite values.
+        """
+        format_residue = functools.partial(
+            format_residue_arrays, significant_digits=significant_digits
+        )
+        self.residue_file = await asyncio.get_running_loop().run_in_executor(
+            self._executor, format_residue, dates, nectar, pollen
+        )
+
+    async def _prepare_input(self, source, name):
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                self._executor, input_cache.get, source
+            )
+        except (OSError, UnicodeDecodeError):
+            raise OSError("{} file is invalid.".format(name))
+
+    def _simulate(self, parameters, weather_file, residue_file):
+        """Run one simulation on a pooled instance. Returns (output, error_log, info_log)."""
+        with self.pool.model() as model:
+            model.clear_buffers()
+            try:
+                if residue_file is None:
+                    model.contam_file = None
+                model.reset_parameters()
+                model.load_weather(weather_file)
+                if residue_file is not None:
+                    model.load_contam_file(residue_file)
+                if parameters:
+                    model.set_parameters(parameters)
+                output = model.run_beepop()
+            except Exception as e:
+                e.error_log, e.info_log = model.get_errors(), model.get_info()
+                raise
+            return output, model.get_errors(), model.get_info()
+
+    async def run_model(self, parameters=None, timeout=None):
+        """Run BeePop+ with the current parameters and inputs.
+
+        Args:
+            parameters (dict, optional): Parameters for this run only, applied on top of the
+                parameters set on this object. Defaults to None.
+            timeout (float, optional): Seconds to wait, including time queued for a free
+                instance. Defaults to waiting indefinitely.
+
+        Raises:
+            RuntimeError: If the weather file has not yet been set.
+            PoolFullError: If all instances are busy and the wait queue is full.
+            asyncio.TimeoutError: If the run did not finish within the timeout.
+
+        Returns:
+            DataFrame: A DataFrame of the model results for the BeePop+ run.
+        """
+        if self.weather_file is None:
+            raise RuntimeError("Weather must be set before running BeePop+!")
+        run_parameters = self.get_parameters()
+        if parameters:
+            for name, value in parameters.items():
+                validate_parameter(name, value)
+            run_parameters.update((k.lower(), v) for k, v in parameters.items())
+        try:
+            output, self.error_log, self.info_log = await self._call(
+                self._simulate,
+                run_parameters,
+                self.weather_file,
+                self.residue_file,
+                timeout=timeout,
+            )
+        except Exception as e:
+            self.error_log = getattr(e, "error_log", None)
+            self.info_log = getattr(e, "info_log", None)
+            raise
+        self.output = output
+        return output
+
+    async def run_batch(self, parameter_sets, timeout=None):
+        """Run many scenarios concurrently on the pool.
+
+        Args:
+            parameter_sets (list or dict): Parameter dicts, one per scenario, applied on top of
+                the parameters set on this object. If a dict is given, its keys are used as
+                scenario ids; otherwise the scenario id is the list index.
+            timeout (float, optional): Seconds to wait for each scenario. Defaults to waiting
+                indefinitely.
+
+        Returns:
+            list: A ScenarioResult for each scenario, in input order.
+        """
+        if self.weather_file is None:
+            raise RuntimeError("Weather must be set before running BeePop+!")
+        base = self.get_parameters()
+
+        async def run(scenario_id, parameters):
+            run_parameters = dict(base)
+            try:
+                for name, value in (parameters or {}).items():
+                    validate_parameter(name, value)
+                    run_parameters[name.lower()] = value
+                output, _, _ = await self._call(
+                    self._simulate,
+                    run_parameters,
+                    self.weather_file,
+                    self.residue_file,
+                    timeout=timeout,
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                return ScenarioResult(
+                    scenario_id,
+                    error="{}: {}".format(type(e).__name__, e),
+                    error_log=getattr(e, "error_log", None),
+                    info_log=getattr(e, "info_log", None),
+                )
+            return ScenarioResult(scenario_id, output=output)
+
+        scenarios = _enumerate_scenarios(parameter_sets)
+        return await asyncio.gather(*(run(*scenario) for scenario in scenarios))
+
+    def get_output(self, format="DataFrame"):
+        """Get the output from the last BeePop+ run.
+
+        Args:
+            format (str, optional): Return results as DataFrame ('DataFrame') or
+                JSON string ('json')? Defaults to "DataFrame".
+
+        Returns:
+            DataFrame or json str: A DataFrame or JSON string of the model results.
+        """
+        if format == "json":
+            import json
+
+            return json.dumps(self.output.to_dict(orient="list"))
+        return self.output
+
+    def get_error_log(self):
+        """Return the BeePop+ error log of the last run as a string for debugging."""
+        return self.error_log
+
+    def get_info_log(self):
+        """Return the BeePop+ info log of the last run as a string for debugging."""
+        return self.info_log
+
+    async def version(self):
+        """Return the BeePop+ version as a string."""
+
+        def get_version():
+            with self.pool.model() as model:
+                return model.get_version()
+
+        return await self._call(get_version)
+
+    async def exit(self):
+        """Stop the worker threads and, if this object created its pool, unload the pool."""
+        await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
+        if self._owns_pool:
+            self.pool.close()
@@ -0,0 +1,278 @@
+"""
+pybeepop - parallel batch execution of BeePop+ scenarios
+
+The BeePop+ shared library keeps a single global simulation session per process, so
+scenarios are fanned out to a pool of worker processes. Each worker loads the library
+and the weather (and residue) inputs once, then reuses them for every scenario it is
+given.
+"""
+
+import os
+import concurrent.futures
+from .tools import BeePopModel
+from .results import output_columns
+
+
+class ScenarioResult:
+    """Outcome of a single scenario from a batch of BeePop+ runs.
+
+    Attributes:
+        scenario_id: Identifier of the scenario (its key or position in the batch).
+        output (DataFrame): Daily BeePop+ outputs (or the batch reducer's summary of them), or
+            None if the run failed.
+        error (str): Description of the exception raised by the run, or None on success.
+        error_log (str): BeePop+ error log captured when the run failed.
+        info_log (str): BeePop+ info log captured when the run failed.
+        stats (dict): Per-phase timings and sizes of the run (see RunStats.to_dict) if the batch
+            was instrumented, otherwise None.
+    """
+
+    def __init__(
+        self, scenario_id, output=None, error=None, error_log=None, info_log=None, stats=None
+    ):
+        self.scenario_id = scenario_id
+        self.output = output
+        self.error = error
+        self.error_log = error_log
+        self.info_log = info_log
+        self.stats = stats
+
+    @property
+    def ok(self):
+        """True if the scenario ran successfully."""
+        return self.error is None
+
+    def __repr__(self):
+        status = "ok" if self.ok else "failed: {}".format(self.error)
+        return "ScenarioResult({!r}, {})".format(self.scenario_id, status)
+
+
+class BatchWorker:
+    """A BeePop+ session that runs many scenarios against the same inputs.
+
+    The library, weather and residue inputs are loaded once. Each scenario is applied on top of
+    the base parameters, and only values that differ from the previous scenario are sent to
+    the library. The library is reset when a scenario would otherwise inherit a value set by
+    an earlier one, so scenarios do not leak into each other.
+    """
+
+    def __init__(
+        self,
+        lib_file,
+        weather_file,
+        residue_file=None,
+        parameters=None,
+        reducer=None,
+        verbose=False,
+        instrument=False,
+        output_options=None,
+    ):
+        """
+        Args:
+            lib_file (str): Path to the BeePop+ shared library.
+            weather_file (str): Path to the weather file shared by all scenarios.
+            residue_file (str, optional): Path to a residue file shared by all scenarios.
+                Defaults to None.
+            parameters (dict, optional): Base parameters applied before each scenario's own
+                parameters. Defaults to None.
+            reducer (callable, optional): Function applied to each run's output DataFrame in
+                the worker; its return value replaces the output. Defaults to None.
+            verbose (bool, optional): Print debugging messages? Defaults to False.
+            instrument (bool, optional): Record per-phase timings of each scenario?
+                Defaults to False.
+            output_options (dict, optional): "columns", "start" and "end" options passed to
+                BeePopModel.run_beepop to limit the output of each run. Defaults to None.
+        """
+        self.reducer = reducer
+        self.output_options = dict(output_options or {})
+        self.model = BeePopModel(lib_file, verbose=verbose)
+        self.model.load_weather(weather_file)
+        self.residue_file = residue_file
+        if residue_file is not None:
+            self.model.load_contam_file(residue_file)
+        self.base_parameters = dict(parameters) if parameters else {}
+        self._needs_reset = True
+        if instrument:  # enabled after loading, so the shared inputs are not charged to a run
+            self.model.enable_instrumentation()
+
+    def reset(self):
+        """Return the library to the base parameter set, keeping weather and residues loaded.
+
+        The simulation dates return to the span of the weather, so a scenario without dates
+        runs the same whichever scenarios the worker ran before it.
+        """
+        self.model.reset_parameters()
+        if self.base_parameters:
+            self.model.set_parameters(self.base_parameters)
+        self._needs_reset = False
+
+    def apply(self, parameters):
+        """Set the base parameters plus a scenario's own parameters on the library."""
+        combined = dict((k.lower(), v) for k, v in self.base_parameters.items())
+        if parameters:
+            combined.update((k.lower(), v) for k, v in parameters.items())
+        if self._needs_reset or not set(self.model.parameters) <= set(combined):
+            self.reset()
+        self._needs_reset = True  # until the scenario has run cleanly
+        self.model.set_parameters(combined)
+
+    def run(self, scenario_id, parameters):
+        """Run one scenario and return a ScenarioResult. Errors are captured, not raised."""
+        simulated = False
+        try:
+            self.apply(parameters)
+            simulated = True  # run_beepop closes the instrumented run, even if it fails
+            output = self.model.run_beepop(**self.output_options)
+            self._needs_reset = False
+            if self.reducer is not None:
+                output = self.reducer(output)
+        except Exception as e:
+            try:
+                error_log = self.model.get_errors()
+                info_log = self.model.get_info()
+                self.model.clear_buffers()  # so the logs do not carry over to later scenarios
+            except Exception:
+                error_log, info_log = None, None
+            return ScenarioResult(
+                scenario_id,
+                error="{}: {}".format(type(e).__name__, e),
+                error_log=error_log,
+                info_log=info_log,
+                stats=self._stats(simulated),
+            )
+        return ScenarioResult(scenario_id, output=output, stats=self._stats(simulated))
+
+    def _stats(self, simulated):
+        """Return the instrumented measurements of the last scenario as a dict, or None."""
+        instrumentation = self.model.instrumentation
+        if instrumentation is None:
+            return None
+        if not simulated:
+            instrumentation.finish_run()  # close the failed run
+        return instrumentation.last_run.to_dict()
+
+
+_worker = None  # BatchWorker owned by the current pool process
+
+
+def _init_worker(
+    lib_file, weather_file, residue_file, parameters, reducer, verbose, instrument, output_options
+):
+    global _worker
+    _worker = BatchWorker(
+        lib_file,
+        weather_file,
+        residue_file,
+        parameters,
+        reducer,
+        verbose,
+        instrument,
+        output_options,
+    )
+
+
+def _run_scenario(scenario):
+    scenario_id, parameters = scenario
+    return _worker.run(scenario_id, parameters)
+
+
+def _enumerate_scenarios(parameter_sets):
+    """Return a list of (scenario_id, parameters) pairs from a list or dict of parameter dicts."""
+    if isinstance(parameter_sets, dict):
+        scenarios = list(parameter_sets.items())
+    else:
+        scenarios = list(enumerate(parameter_sets))
+    for scenario_id, parameters in scenarios:
+        if (parameters is not None) and (not isinstance(parameters, dict)):
+            raise TypeError(
+                "Scenario {!r}: parameters must be a named dictionary of BeePop+ parameters".format(
+                    scenario_id
+                )
+            )
+    return scenarios
+
+
+def iter_batch(
+    lib_file,
+    parameter_sets,
+    weather_file,
+    residue_file=None,
+    parameters=None,
+    n_workers=None,
+    chunksize=1,
+    reducer=None,
+    verbose=False,
+    instrument=False,
+    columns=None,
+    start=None,
+    end=None,
+):
+    """Run a batch of BeePop+ scenarios in worker processes, yielding results as they complete.
+
+    Results are yielded in the same order as the scenarios. A scenario that raises an error
+    yields a failed ScenarioResult instead of stopping the batch.
+
+    Args:
+        lib_file (str): Path to the BeePop+ shared library.
+        parameter_sets (list or dict): Parameter dicts, one per scenario. If a dict is given,
+            its keys are used as scenario ids; otherwise the scenario id is the list index.
+        weather_file (str): Path to the weather file used for all scenarios.
+        residue_file (str, optional): Path to a residue file used for all scenarios.
+            Defaults to None.
+        parameters (dict, optional): Base parameters applied before each scenario's own
+            parameters. Defaults to None.
+        n_workers (int, optional): Number of worker processes. Defaults to the CPU count.
+        chunksize (int, optional): Number of scenarios sent to a worker at a time.
+            Defaults to 1.
+        reducer (callable, optional): Picklable function applied to each run's output DataFrame
+            inside the worker, e.g. a sensitivity.SummaryReducer. Only its return value is sent
+            back, so full outputs never leave the workers. Defaults to None.
+        verbose (bool, optional): Print debugging messages? Defaults to False.
+        instrument (bool, optional): Record per-phase timings of each scenario in the
+            ScenarioResult's stats? Defaults to False.
+        columns (list, optional): Output columns to return for each scenario. "Date" is always
+            included. Defaults to None (all columns).
+        start (optional): First date of each scenario's output. Defaults to None.
+        end (optional): Last date of each scenario's output. Defaults to None.
+
+    Raises:
+        ValueError: If a column is not a BeePop+ output column.
+
+    Yields:
+        ScenarioResult: The outcome of each scenario, in input order.
+    """
+    scenarios = _enumerate_scenarios(parameter_sets)
+    if not scenarios:
+        return
+    output_columns(columns)  # fail before starting the workers
+    output_options = {"columns": columns, "start": start, "end": end}
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    n_workers = max(1, min(n_workers, len(scenarios)))
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=n_workers,
+        initializer=_init_worker,
+        initargs=(
+            lib_file,
+            weather_file,
+            residue_file,
+            parameters,
+            reducer,
+            verbose,
+            instrument,
+            output_options,
+        ),
+    ) as pool:
+        for result in pool.map(_run_scenario, scenarios, chunksize=chunksize):
+            yield result
+
+
+def run_batch(*args, **kwargs):
+    """Run a batch of BeePop+ scenarios in worker processes.
+
+    Takes the same arguments as iter_batch.
+
+    Returns:
+        list: A ScenarioResult for each scenario, in input order.
+    """
+    return list(iter_batch(*args, **kwargs))
@@ -0,0 +1,247 @@
+"""
+pybeepop - memoized BeePop+ results
+
+A ResultCache remembers the outputs of simulations by a hash of everything that determines
+them: the BeePop+ library version, the parameters set, the weather and residue content, and
+the latitude. Repeated scenarios are then answered from memory, or from an optional directory
+on disk, instead of running the simulation again.
+"""
+
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from .results import BeePopResults, parse_dates, text_columns
+from .parameters import get_parameter_spec
+
+
+def result_key(version, parameters, weather_key, residue_key=None, latitude=None):
+    """Return the cache key of a simulation.
+
+    Args:
+        version (str): BeePop+ library version.
+        parameters (dict): Parameters set for the run. Names are matched without case and
+            values are normalized, so e.g. 10000 and "10000.0" give the same key.
+        weather_key (str): Content hash of the loaded weather.
+        residue_key (str, optional): Content hash of the loaded residues, or None if residue
+            input is disabled. Defaults to None.
+        latitude (float, optional): Latitude set for the run, if any. Defaults to None.
+
+    Returns:
+        str: A hex digest identifying the simulation.
+    """
+    normalized = sorted(
+        (name.lower(), get_parameter_spec(name).normalize(value))
+        for name, value in parameters.items()
+    )
+    canonical = json.dumps(
+        [version, normalized, weather_key, residue_key, latitude], separators=(",", ":")
+    )
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+def _nbytes(results):
+    return sum(
+        column.nbytes if column.dtype != object else len(column) * 64
+        for column in results.columns.values()
+    )
+
+
+class ResultCache:
+    """Two-tier least-recently-used cache of BeePop+ results.
+
+    BeePop+ results can differ slightly between repeated runs with the same inputs, so a cached
+    result is one valid outcome of the scenario rather than a bit-exact rerun.
+
+    Example:
+        cache = ResultCache(directory="beepop_cache/")
+        beepop = PyBeePop(weather_file=weather, result_cache=cache)
+        beepop.run_model()  # simulated
+        beepop.run_model()  # returned from the cache
+        print(cache.stats())
+    """
+
+    def __init__(
+        self, max_entries=1024, max_bytes=256 * 1024**2, directory=None, max_disk_bytes=1024**3
+    ):
+        """
+        Args:
+            max_entries (int, optional): Maximum number of results kept in memory.
+                Defaults to 1024.
+            max_bytes (int, optional): Approximate memory cap for the results kept in memory.
+                Defaults to 256 MB.
+            directory (str, optional): Directory for the on-disk tier. Results evicted from or
+                added to memory are also kept here, and survive between sessions.
+                Defaults to None (memory only).
+            max_disk_bytes (int, optional): Size cap of the on-disk tier. The least recently
+                used files are removed beyond it. Defaults to 1 GB.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.nbytes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries or (
+            self.directory is not None and os.path.isfile(self._path(key))
+        )
+
+    @property
+    def hits(self):
+        """Number of lookups answered from either tier."""
+        return self.memory_hits + self.disk_hits
+
+    def stats(self):
+        """Return a dict of hit/miss counts and the size of each tier."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            disk_files = self._disk_files()
+            return {
+                "hits": self.hits,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "nbytes": self.nbytes,
+                "disk_entries": len(disk_files),
+                "disk_bytes": sum(size for _, _, size in disk_files),
+            }
+
+    def get(self, key):
+        """Return the cached BeePopResults for a key, or None if it has not been cached."""
+        entry = self._find(key)
+        return None if entry is None else entry[0]
+
+    def get_dataframe(self, key):
+        """Return the cached results for a key as (BeePopResults, DataFrame), or None.
+
+        The DataFrame is a copy, so changing it does not change the cache. It is copied from a
+        consolidated DataFrame kept with the entry, which is much faster than building a new
+        one from the column arrays.
+        """
+        entry = self._find(key)
+        if entry is None:
+            return None
+        if entry[1] is None:
+            entry[1] = entry[0].to_dataframe(copy=True)  # copying consolidates the columns
+        return entry[0], entry[1].copy()
+
+    def put(self, key, results):
+        """Cache the BeePopResults of a simulation."""
+        with self._lock:
+            self._remember(key, results)
+        self._save(key, results)
+
+    def _find(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return entry
+        results = self._load(key)
+        with self._lock:
+            if results is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            return self._remember(key, results)
+
+    def clear(self):
+        """Remove all results from memory and from the on-disk tier."""
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+            for path, _, _ in self._disk_files():
+                os.remove(path)
+
+    def _remember(self, key, results):
+        """Add results to the memory tier and return their [results, DataFrame] entry."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return entry
+        entry = [results, None]
+        self._entries[key] = entry
+        self.nbytes += 2 * _nbytes(results)  # the arrays and, once built, the DataFrame
+        while self._entries and (
+            len(self._entries) > self.max_entries or self.nbytes > self.max_bytes
+        ):
+            _, (evicted, _) = self._entries.popitem(last=False)
+            self.nbytes -= 2 * _nbytes(evicted)
+        return entry
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".npz")
+
+    def _disk_files(self):
+        """Return (path, last use, size) of each file of the on-disk tier."""
+        if self.directory is None:
+            return []
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npz"):
+                stat = entry.stat()
+                files.append((entry.path, stat.st_mtime, stat.st_size))
+        return files
+
+    def _save(self, key, results):
+        if self.directory is None:
+            return
+        path = self._path(key)
+        if os.path.isfile(path):
+            return
+        arrays = dict()
+        for i, (name, column) in enumerate(results.columns.items()):
+            arrays["c{}".format(i)] = column.astype(str) if column.dtype == object else column
+        arrays["names"] = np.array(list(results.columns))
+        temp_path = "{}.{}.tmp".format(path, threading.get_ident())
+        with open(temp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(temp_path, path)  # other processes never see a partial file
+        with self._lock:
+            files = sorted(self._disk_files(), key=lambda file: file[1])
+            total = sum(size for _, _, size in files)
+            for old_path, _, size in files:
+                if total <= self.max_disk_bytes:
+                    break
+                try:
+                    os.remove(old_path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+    def _load(self, key):
+        if self.directory is None:
+            return None
+        path = self._path(key)
+        try:
+            with np.load(path) as stored:
+                names = stored["names"].tolist()
+                columns = dict()
+                for i, name in enumerate(names):
+                    column = stored["c{}".format(i)]
+                    if name in text_columns:
+                        column = column.astype(object)
+                    columns[name] = column
+            os.utime(path)  # mark as recently used for eviction
+        except (OSError, KeyError, ValueError):
+            return None
+        dates = np.empty(0, dtype="datetime64[D]")
+        if "Date" in columns:
+            dates = parse_dates(np.char.strip(columns["Date"].astype("S10")))
+        return BeePopResults(columns, dates)
@@ -0,0 +1,389 @@
+"""
+pybeepop - calibration of BeePop+ parameters against observed colony data
+
+Parameters are fitted with differential evolution: every generation of candidate parameter
+sets is run at once with run_batch, so a calibration uses as many cores (or hosts, through an
+executor) as are available. Each worker returns only the simulated values on the observed dates,
+and the losses of the whole generation are computed from them in one vectorized step. Candidates
+that were already evaluated, which is common once integer parameters converge, are answered from
+a cache, and the optimizer state can be checkpointed to a file after each generation.
+"""
+
+import os
+import pickle
+import numpy as np
+from .inputs import input_cache
+from .parameters import get_parameter_spec
+from .results import output_columns, parse_dates, to_date
+from .sensitivity import latin_hypercube, scale_samples
+from .sweep import _weather_date
+
+
+def sse(simulated, observed):
+    """Sum of squared errors of each candidate."""
+    return ((simulated - observed) ** 2).sum(axis=-1)
+
+
+def rmse(simulated, observed):
+    """Root mean squared error of each candidate."""
+    return np.sqrt(((simulated - observed) ** 2).mean(axis=-1))
+
+
+def mae(simulated, observed):
+    """Mean absolute error of each candidate."""
+    return np.abs(simulated - observed).mean(axis=-1)
+
+
+def log_rmse(simulated, observed):
+    """Root mean squared error of log(1 + x), for counts that span orders of magnitude."""
+    return rmse(np.log1p(np.maximum(simulated, 0)), np.log1p(np.maximum(observed, 0)))
+
+
+LOSSES = {  # loss functions available by name
+    "sse": sse,
+    "rmse": rmse,
+    "mae": mae,
+    "log_rmse": log_rmse,
+}
+
+
+def _observation_arrays(observations):
+    """Return (dates, columns, values) of a table of observations.
+
+    values has shape (columns, dates) and is NaN where a column was not observed on a date.
+    """
+    if "Date" in observations:
+        dates = observations["Date"]
+        values = observations.drop(columns="Date")
+    else:
+        dates = observations.index
+        values = observations
+    dates = np.array([to_date(date) for date in dates], dtype="datetime64[D]")
+    order = np.argsort(dates, kind="stable")
+    if len(np.unique(dates)) != len(dates):
+        raise ValueError("Observation dates must be unique.")
+    columns = [str(name) for name in values.columns]
+    values = values.to_numpy(dtype=np.float64)[order].T
+    return dates[order], columns, values
+
+
+class ObservationReducer:
+    """Reduce the daily output of a run to its values on the observed dates.
+
+    Returns a float64 array of shape (columns * dates,), column by column, with NaN for dates
+    the run does not cover.
+    """
+
+    def __init__(self, dates, columns):
+        self.dates = np.asarray(dates, dtype="datetime64[D]")
+        self.columns = list(columns)
+
+    def __call__(self, output):
+        days = parse_dates(np.asarray(output["Date"], dtype="S10"))
+        dated = np.flatnonzero(~np.isnat(days))
+        position = np.searchsorted(days[dated], self.dates)
+        position = np.minimum(position, max(len(dated) - 1, 0))
+        found = days[dated][position] == self.dates if len(dated) else np.zeros(0, bool)
+        values = np.full((len(self.columns), len(self.dates)), np.nan)
+        for i, name in enumerate(self.columns):
+            column = np.asarray(output[name], dtype=np.float64)[dated]
+            values[i, found] = column[position[found]]
+        return values.ravel()
+
+
+def _check_simulated_dates(beepop, dates):
+    """Raise a ValueError if an observation date is not in the output of beepop's runs."""
+    if beepop.weather_file is None:
+        raise RuntimeError("Weather must be set before running BeePop+!")
+    first, last = (_weather_date(day) for day in input_cache.get(beepop.weather_file).date_range())
+    parameters = beepop.get_parameters()
+    if parameters.get("simstart"):
+        first = to_date(parameters["simstart"])
+    if parameters.get("simend"):
+        last = to_date(parameters["simend"])
+    last = last - np.timedelta64(1, "D")  # the output omits the last simulated day
+    outside = dates[(dates < first) | (dates > last)]
+    if len(outside):
+        raise ValueError(
+            "Observations on {} are outside the simulated dates {} to {}.".format(
+                ", ".join(str(date) for date in outside), first, last
+            )
+        )
+
+
+def _check_losses(losses, errors, what):
+    if not np.isfinite(losses).any():
+        reason = next(iter(errors.values()), "no run covered the observed dates")
+        raise ValueError("No candidate of {} could be evaluated: {}".format(what, reason))
+
+
+class CalibrationResult:
+    """Outcome of a calibration.
+
+    Attributes:
+        names (list): Names of the calibrated parameters.
+        parameters (dict): Best parameter values found.
+        loss (float): Loss of the best parameters.
+        population (ndarray): Parameter values of the final population, shape (size, names).
+        losses (ndarray): Loss of each member of the final population.
+        history (list): Best loss after each generation.
+        evaluations (int): Number of model runs made (cached candidates are not counted).
+        errors (dict): Error message of each failed candidate, by its parameter values.
+    """
+
+    def __init__(self, names, population, losses, history, evaluations, errors):
+        best = int(np.argmin(losses))
+        self.names = names
+        self.parameters = _parameter_set(names, population[best])
+        self.loss = float(losses[best])
+        self.population = population
+        self.losses = losses
+        self.history = history
+        self.evaluations = evaluations
+        self.errors = errors
+
+    def to_dataframe(self):
+        """Return the final population and its losses as a DataFrame, best first."""
+        import pandas as pd
+
+        frame = pd.DataFrame(self.population, columns=self.names)
+        frame["loss"] = self.losses
+        return frame.sort_values("loss", kind="stable").reset_index(drop=True)
+
+
+def _parameter_set(names, row):
+    return dict(
+        (name, int(value) if get_parameter_spec(name).type == "Integer" else float(value))
+        for name, value in zip(names, row)
+    )
+
+
+class _Objective:
+    """Runs candidates in parallel and turns their simulated values into losses."""
+
+    def __init__(self, beepop, names, bounds, observations, loss, weights, run_options):
+        self.beepop = beepop
+        self.names = names
+        self.bounds = bounds
+        self.dates, self.columns, self.observed = _observation_arrays(observations)
+        unknown = [name for name in weights or {} if name not in self.columns]
+        if unknown:
+            raise ValueError("Weights given for unobserved columns: {}".format(unknown))
+        self.weights = np.array([(weights or {}).get(name, 1.0) for name in self.columns])
+        if isinstance(loss, str):
+            if loss not in LOSSES:
+                raise ValueError(
+                    "{} is not a known loss. Choose from: {}".format(loss, ", ".join(LOSSES))
+                )
+            loss = LOSSES[loss]
+        self.loss = loss
+        self.reducer = ObservationReducer(self.dates, self.columns)
+        self.run_options = dict(
+            run_options,
+            columns=self.columns,
+            start=self.dates[0],
+            end=self.dates[-1],
+            reducer=self.reducer,
+        )
+        self.cache = dict()  # simulated values by candidate
+        self.errors = dict()
+        self.evaluations = 0
+
+    def values(self, unit):
+        """Return the parameter values of candidates given in the unit cube."""
+        return scale_samples(unit, self.names, self.bounds)
+
+    def __call__(self, values):
+        keys = [tuple(row) for row in values.tolist()]
+        new = list(dict.fromkeys(key for key in keys if key not in self.cache))
+        if new:
+            parameter_sets = [_parameter_set(self.names, key) for key in new]
+            results = self.beepop.run_batch(parameter_sets, stream=True, **self.run_options)
+            for result in results:
+                key = new[result.scenario_id]
+                if result.ok:
+                    self.cache[key] = result.output
+                else:
+                    self.cache[key] = None
+                    self.errors[key] = result.error
+            self.evaluations += len(new)
+        failed = np.full(self.observed.size, np.nan)
+        simulated = np.stack(
+            [failed if self.cache[key] is None else self.cache[key] for key in keys]
+        ).reshape((len(keys),) + self.observed.shape)
+        losses = np.zeros(len(keys))
+        for i, observed in enumerate(self.observed):
+            present = ~np.isnan(observed)
+            losses += self.weights[i] * self.loss(simulated[:, i, present], observed[present])
+        losses[np.isnan(losses)] = np.inf  # failed runs and runs missing observed dates
+        return losses
+
+
+def _save_checkpoint(path, state):
+    """Write the optimizer state so that a crash while writing keeps the previous one."""
+    temporary = "{}.tmp".format(path)
+    with open(temporary, "wb") as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary, path)
+
+
+def calibrate(
+    beepop,
+    parameters,
+    observations,
+    bounds=None,
+    loss="rmse",
+    weights=None,
+    population_size=None,
+    generations=50,
+    mutation=0.7,
+    crossover=0.9,
+    strategy="rand1bin",
+    tol=None,
+    seed=None,
+    checkpoint=None,
+    n_workers=None,
+    chunksize=1,
+    executor=None,
+    callback=None,
+):
+    """Fit BeePop+ parameters to observed colony data with differential evolution.
+
+    Each generation is run in parallel with run_batch, using the weather, residues and
+    parameters already set on beepop. With a checkpoint file, the optimizer state is saved
+    after every generation, and a calibration restarted with the same file resumes from it.
+
+    BeePop+ results can differ slightly between repeated runs with the same inputs, so the
+    losses of cached candidates are those of their first run.
+
+    Args:
+        beepop (PyBeePop): Model with weather (and optionally residues and fixed parameters) set.
+        parameters (list): Names of the Float or Integer parameters to fit.
+        observations (DataFrame): Observed values, with a "Date" column (or a date index) and
+            one column per BeePop+ output column, e.g. "Colony Size". Missing observations may
+            be NaN.
+        bounds (dict, optional): name: (low, high) bounds that replace the Min/Max of the
+            parameter file. Required for parameters without a Max. Defaults to None.
+        loss (str or callable, optional): Name of a loss in LOSSES, or a function taking
+            simulated values of shape (candidates, observations) and the observed values and
+            returning the loss of each candidate. Defaults to "rmse".
+        weights (dict, optional): Weight of each observed column's loss in the total.
+            Defaults to 1 for every column.
+        population_size (int, optional): Candidates per generation. Defaults to 10 times the
+            number of parameters, and at least 5.
+        generations (int, optional): Number of generations after the initial one.
+            Defaults to 50.
+        mutation (float, optional): Differential weight F, between 0 and 2. Defaults to 0.7.
+        crossover (float, optional): Crossover probability CR, between 0 and 1. Defaults to 0.9.
+        strategy (str, optional): "rand1bin" mutates random members, which explores more;
+            "best1bin" mutates the best member, which converges faster. Defaults to "rand1bin".
+        tol (float, optional): Stop early once the standard deviation of the population's
+            losses is at most tol times their mean. Defaults to None (run every generation).
+        seed (int, optional): Seed for the random number generator. Defaults to None.
+        checkpoint (str, optional): Path of a file to save the optimizer state to and resume
+            from. Defaults to None.
+        n_workers (int, optional): Number of worker processes. Defaults to the CPU count.
+        chunksize (int, optional): Number of runs sent to a worker at a time. Defaults to 1.
+        executor (Executor, optional): Executor that runs the candidates, as in run_batch.
+            Defaults to None.
+        callback (callable, optional): Function called with (generation, best loss, best
+            parameters) after every generation. Defaults to None.
+
+    Raises:
+        ValueError: If a parameter cannot be fitted, a setting is out of range, an observed
+            column is not a BeePop+ output, an observation date is outside the simulated dates,
+            the checkpoint is of another calibration or no candidate of a generation could be
+            evaluated.
+
+    Returns:
+        CalibrationResult: The best parameters, the final population and the loss history.
+    """
+    names = [get_parameter_spec(name).name for name in parameters]
+    d = len(names)
+    if strategy not in ("rand1bin", "best1bin"):
+        raise ValueError("strategy must be 'rand1bin' or 'best1bin'.")
+    if not 0 <= crossover <= 1 or not 0 < mutation <= 2:
+        raise ValueError("crossover must be in [0, 1] and mutation in (0, 2].")
+    size = max(5, population_size or 10 * d)
+    run_options = dict(n_workers=n_workers, chunksize=chunksize, executor=executor)
+    objective = _Objective(beepop, names, bounds, observations, loss, weights, run_options)
+    objective.values(np.zeros((1, d)))  # check the parameters and bounds before running
+    output_columns(objective.columns)
+    _check_simulated_dates(beepop, objective.dates)
+
+    def save():
+        if checkpoint is not None:
+            _save_checkpoint(
+                checkpoint,
+                {
+                    "names": names,
+                    "population": population,
+                    "losses": losses,
+                    "history": history,
+                    "rng": rng.bit_generator.state,
+                    "cache": objective.cache,
+                    "errors": objective.errors,
+                    "evaluations": objective.evaluations,
+                },
+            )
+
+    state = None
+    if checkpoint is not None and os.path.isfile(checkpoint):
+        with open(checkpoint, "rb") as f:
+            state = pickle.load(f)
+        if state["names"] != names or len(state["population"]) != size:
+            raise ValueError(
+                "The checkpoint {} is of a calibration of other parameters.".format(checkpoint)
+            )
+        objective.cache = state["cache"]
+        objective.errors = state["errors"]
+        objective.evaluations = state["evaluations"]
+        rng = np.random.default_rng()
+        rng.bit_generator.state = state["rng"]
+        population, losses, history = state["population"], state["losses"], state["history"]
+    else:
+        rng = np.random.default_rng(seed)
+        population = latin_hypercube(size, d, seed=rng)
+        losses = objective(objective.values(population))
+        _check_losses(losses, objective.errors, "the initial population")
+        history = [float(losses.min())]
+        save()
+
+    top = np.nextafter(1.0, 0.0)
+    while len(history) <= generations:
+        if tol is not None and np.isfinite(losses).all():
+            if losses.std() <= tol * abs(losses.mean()):
+                break
+        # three distinct members other than the target for each candidate
+        others = np.argsort(rng.random((size, size)) + 2 * np.eye(size), axis=1)[:, :3]
+        if strategy == "best1bin":
+            base = population[np.argmin(losses)]
+        else:
+            base = population[others[:, 0]]
+        difference = population[others[:, 1]] - population[others[:, 2]]
+        mutant = np.clip(base + mutation * difference, 0, top)
+        cross = rng.random((size, d)) < crossover
+        cross[np.arange(size), rng.integers(d, size=size)] = True
+        trial = np.where(cross, mutant, population)
+        trial_losses = objective(objective.values(trial))
+        _check_losses(trial_losses, objective.errors, "generation {}".format(len(history)))
+        better = trial_losses <= losses
+        population[better] = trial[better]
+        losses[better] = trial_losses[better]
+        history.append(float(losses.min()))
+        save()
+        if callback is not None:
+            best = np.argmin(losses)
+            callback(
+                len(history) - 1,
+                float(losses[best]),
+                _parameter_set(names, objective.values(population[best : best + 1])[0]),
+            )
+    return CalibrationResult(
+        names,
+        objective.values(population),
+        losses,
+        history,
+        objective.evaluations,
+        objective.errors,
+    )
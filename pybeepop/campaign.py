@@ -0,0 +1,294 @@
+"""
+pybeepop - long batch campaigns that can be stopped and resumed
+
+A Campaign keeps a manifest of its scenarios in a SQLite file: the parameters of each scenario,
+whether it has completed, how many attempts it took, and the error and BeePop+ logs of failed
+attempts. Running the campaign again after a crash or restart skips the completed scenarios and
+retries failed ones up to a limit, so only unfinished work is repeated.
+"""
+
+import json
+import time
+import pickle
+import sqlite3
+from concurrent.futures.process import BrokenProcessPool
+from .batch import ScenarioResult, _enumerate_scenarios
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scenarios (
+    id TEXT PRIMARY KEY,
+    parameters TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    error_log TEXT,
+    info_log TEXT,
+    output BLOB,
+    updated REAL
+)
+"""
+
+
+def _json_default(value):
+    if hasattr(value, "item"):  # NumPy scalars
+        return value.item()
+    if hasattr(value, "strftime"):
+        return value.strftime("%m/%d/%Y")
+    return str(value)
+
+
+def _encode_parameters(parameters):
+    return json.dumps(parameters or {}, sort_keys=True, default=_json_default)
+
+
+class Campaign:
+    """A resumable batch of BeePop+ scenarios recorded in a SQLite manifest.
+
+    Outputs are kept in the manifest, or appended to a ResultStore if one is given. Results are
+    committed in groups of `checkpoint_every` scenarios; at most that many completed scenarios
+    are run again after a crash.
+
+    Example:
+        with Campaign("campaign.sqlite", max_retries=2) as campaign:
+            campaign.run(beepop, scenarios, reducer=SummaryReducer())  # safe to rerun
+            print(campaign.status())
+            summaries = dict((r.scenario_id, r.output) for r in campaign.results())
+    """
+
+    def __init__(self, path, max_retries=2, checkpoint_every=100):
+        """
+        Args:
+            path (str): Path to the SQLite manifest. It is created if it does not exist.
+            max_retries (int, optional): Times a failed scenario is run again, in this run or
+                later ones, before it is left as failed. Defaults to 2.
+            checkpoint_every (int, optional): Number of finished scenarios between commits of
+                the manifest. Defaults to 100.
+        """
+        self.path = path
+        self.max_retries = max_retries
+        self.checkpoint_every = max(1, checkpoint_every)
+        self._connection = sqlite3.connect(path)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        with self._connection:
+            self._connection.execute(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self):
+        return self._connection.execute("SELECT COUNT(*) FROM scenarios").fetchone()[0]
+
+    def close(self):
+        """Close the manifest."""
+        self._connection.close()
+
+    def add(self, parameter_sets):
+        """Add scenarios to the manifest. Scenarios it already holds are left as they are.
+
+        Args:
+            parameter_sets (list or dict): Parameter dicts, one per scenario. If a dict is given,
+                its keys are used as scenario ids; otherwise the scenario id is the list index.
+
+        Raises:
+            ValueError: If a scenario id is already in the manifest with other parameters.
+        """
+        rows = [
+            (json.dumps(scenario_id), _encode_parameters(parameters))
+            for scenario_id, parameters in _enumerate_scenarios(parameter_sets)
+        ]
+        now = time.time()
+        with self._connection:
+            known = dict(self._connection.execute("SELECT id, parameters FROM scenarios"))
+            for scenario_id, parameters in rows:
+                if scenario_id in known and known[scenario_id] != parameters:
+                    raise ValueError(
+                        "Scenario {} is already in the manifest with other parameters.".format(
+                            scenario_id
+                        )
+                    )
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO scenarios (id, parameters, status, updated) "
+                "VALUES (?, ?, ?, ?)",
+                [(scenario_id, parameters, PENDING, now) for scenario_id, parameters in rows],
+            )
+
+    def status(self):
+        """Return the number of scenarios that are pending, done and failed."""
+        counts = {PENDING: 0, DONE: 0, FAILED: 0}
+        for status, count in self._connection.execute(
+            "SELECT status, COUNT(*) FROM scenarios GROUP BY status"
+        ):
+            counts[status] = count
+        return counts
+
+    def _unfinished(self):
+        """Return (scenario_id, parameters) of the scenarios to run, in the order added."""
+        rows = self._connection.execute(
+            "SELECT id, parameters FROM scenarios WHERE status != ? AND attempts <= ? "
+            "ORDER BY rowid",
+            (DONE, self.max_retries),
+        )
+        return [
+            (json.loads(scenario_id), json.loads(parameters)) for scenario_id, parameters in rows
+        ]
+
+    def run(
+        self,
+        beepop,
+        parameter_sets=None,
+        store=None,
+        n_workers=None,
+        chunksize=1,
+        reducer=None,
+        columns=None,
+        start=None,
+        end=None,
+        executor=None,
+    ):
+        """Run every scenario that has not completed, retrying failures up to max_retries times.
+
+        The scenarios run in worker processes with PyBeePop.run_batch, using the weather,
+        residues and base parameters of `beepop`. Failed scenarios are recorded with their
+        error and the BeePop+ error and info logs. If a worker process dies, the unfinished
+        scenarios are run again in supervised workers (see executors.SupervisedExecutor), so
+        that the crash is charged only to the scenario that caused it.
+
+        Args:
+            beepop (PyBeePop): Model with the weather (and residues and base parameters) loaded.
+            parameter_sets (list or dict, optional): Scenarios to add to the manifest before
+                running, as in add(). Defaults to None (run the scenarios already added).
+            store (ResultStore, optional): Store that outputs are appended to instead of the
+                manifest. The store is flushed before each commit of the manifest, so a crash
+                between the two can leave the output of a rerun scenario in the store twice.
+                Defaults to None.
+            n_workers (int, optional): Number of worker processes. Defaults to the CPU count.
+            chunksize (int, optional): Number of scenarios sent to a worker at a time.
+                Defaults to 1.
+            reducer (callable, optional): Picklable function applied to each output in the
+                workers, as in run_batch. Defaults to None.
+            columns (list, optional): Output columns to keep, as in run_batch.
+                Defaults to None (all columns).
+            start (optional): First date of each output. Defaults to None.
+            end (optional): Last date of each output. Defaults to None.
+            executor (Executor, optional): Executor that runs the scenarios, as in run_batch.
+                Defaults to worker processes on this machine.
+
+        Returns:
+            dict: The number of scenarios pending, done and failed after the run.
+        """
+        if parameter_sets is not None:
+            self.add(parameter_sets)
+        supervised = None
+        try:
+            while True:
+                scenarios = self._unfinished()
+                if not scenarios:
+                    break
+                results = beepop.run_batch(
+                    dict(scenarios),
+                    n_workers=n_workers,
+                    chunksize=chunksize,
+                    stream=True,
+                    reducer=reducer,
+                    columns=columns,
+                    start=start,
+                    end=end,
+                    executor=executor if supervised is None else supervised,
+                )
+                try:
+                    for finished, result in enumerate(results, 1):
+                        self._record(result, store)
+                        if finished % self.checkpoint_every == 0:
+                            self._commit(store)
+                except BrokenProcessPool:
+                    # the pool cannot tell which scenario killed its worker, so no attempt is
+                    # charged; the unfinished scenarios run again in supervised workers, which
+                    # report a crash against the scenario that caused it
+                    if supervised is None:
+                        from .executors import SupervisedExecutor
+
+                        supervised = SupervisedExecutor(
+                            n_workers, lib_file=beepop.lib_file, verbose=beepop.verbose
+                        )
+                finally:
+                    self._commit(store)
+        finally:
+            if supervised is not None:
+                supervised.close()
+        return self.status()
+
+    def _record(self, result, store):
+        """Record the outcome of a scenario in the open transaction."""
+        scenario_id = json.dumps(result.scenario_id)
+        if result.ok:
+            output = None
+            if store is not None:
+                store.append(result.scenario_id, result.output)
+            else:
+                output = pickle.dumps(result.output, protocol=pickle.HIGHEST_PROTOCOL)
+            self._connection.execute(
+                "UPDATE scenarios SET status = ?, attempts = attempts + 1, error = NULL, "
+                "error_log = NULL, info_log = NULL, output = ?, updated = ? WHERE id = ?",
+                (DONE, output, time.time(), scenario_id),
+            )
+        else:
+            self._connection.execute(
+                "UPDATE scenarios SET status = ?, attempts = attempts + 1, error = ?, "
+                "error_log = ?, info_log = ?, updated = ? WHERE id = ?",
+                (
+                    FAILED,
+                    result.error,
+                    result.error_log,
+                    result.info_log,
+                    time.time(),
+                    scenario_id,
+                ),
+            )
+
+    def _commit(self, store):
+        if store is not None:
+            store.flush()  # outputs reach disk before the manifest marks them done
+        self._connection.commit()
+
+    def retry_failed(self):
+        """Allow scenarios that used up their retries to run again on the next run()."""
+        with self._connection:
+            self._connection.execute(
+                "UPDATE scenarios SET attempts = 0 WHERE status = ?", (FAILED,)
+            )
+
+    def failures(self):
+        """Return a ScenarioResult, with its error and logs, for each failed scenario."""
+        rows = self._connection.execute(
+            "SELECT id, error, error_log, info_log FROM scenarios WHERE status = ? "
+            "ORDER BY rowid",
+            (FAILED,),
+        )
+        return [
+            ScenarioResult(
+                json.loads(scenario_id), error=error, error_log=error_log, info_log=info_log
+            )
+            for scenario_id, error, error_log, info_log in rows
+        ]
+
+    def results(self):
+        """Yield a ScenarioResult for each completed scenario whose output is in the manifest.
+
+        Outputs are unpickled one at a time, so campaigns with many outputs can be read back
+        without holding them all in memory.
+        """
+        rows = self._connection.execute(
+            "SELECT id, output FROM scenarios WHERE status = ? AND output IS NOT NULL "
+            "ORDER BY rowid",
+            (DONE,),
+        )
+        for scenario_id, output in rows:
+            yield ScenarioResult(json.loads(scenario_id), output=pickle.loads(output))
@@ -0,0 +1,195 @@
+"""
+pybeepop - command line interface
+
+    pybeepop run scenarios.csv --weather weather.txt --output results/ --workers 16
+    pybeepop validate scenarios.csv
+    pybeepop worker coordinator:6000
+
+"run" validates a scenario table, runs every scenario in parallel and streams the outputs to a
+ResultStore directory as they complete. With --timeout or --recycle-after the workers are
+supervised, so that hung or crashed runs are reported as failures. With --manifest the run is
+recorded in a Campaign, so that running the same command again after an interruption only runs
+unfinished scenarios.
+With --listen the scenarios are handed to "pybeepop worker" processes on other hosts; both
+sides read the shared key from the PYBEEPOP_AUTHKEY environment variable.
+"""
+
+import os
+import sys
+import time
+import argparse
+import warnings
+
+AUTHKEY_VARIABLE = "PYBEEPOP_AUTHKEY"
+
+
+def _address(text):
+    host, separator, port = text.rpartition(":")
+    if not separator or not port.isdigit():
+        raise argparse.ArgumentTypeError("expected HOST:PORT, not {!r}".format(text))
+    return (host or "127.0.0.1", int(port))
+
+
+def _authkey():
+    key = os.environ.get(AUTHKEY_VARIABLE)
+    if not key:
+        raise SystemExit(
+            "Set the {} environment variable to a shared secret.".format(AUTHKEY_VARIABLE)
+        )
+    return key.encode("utf-8")
+
+
+def _parser():
+    parser = argparse.ArgumentParser(prog="pybeepop", description="Run BeePop+ simulations.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="run a table of scenarios and store their outputs")
+    run.add_argument("table", help="scenario table (.csv or .parquet), one row per scenario")
+    run.add_argument("--weather", required=True, help="weather file used by every scenario")
+    run.add_argument("--residue", help="pesticide residue file used by every scenario")
+    run.add_argument("--parameters", help="file of name=value base parameters")
+    run.add_argument("--output", required=True, help="ResultStore directory for the outputs")
+    run.add_argument("--workers", type=int, help="worker processes (default: CPU count)")
+    run.add_argument("--chunksize", type=int, default=1, help="scenarios sent to a worker at once")
+    run.add_argument(
+        "--column",
+        action="append",
+        dest="columns",
+        help="output column to keep; repeat for several (default: all)",
+    )
+    run.add_argument("--start", help="first output date to keep, MM/DD/YYYY")
+    run.add_argument("--end", help="last output date to keep, MM/DD/YYYY")
+    run.add_argument("--id-column", default="scenario_id", help="column of scenario ids")
+    run.add_argument("--manifest", help="SQLite manifest that makes the run resumable")
+    run.add_argument(
+        "--max-retries", type=int, default=2, help="retries of failed scenarios with --manifest"
+    )
+    run.add_argument(
+        "--listen", type=_address, help="HOST:PORT to serve scenarios to pybeepop workers on"
+    )
+    run.add_argument(
+        "--timeout", type=float, help="seconds after which a run is killed and reported failed"
+    )
+    run.add_argument(
+        "--recycle-after", type=int, help="replace each worker process after this many runs"
+    )
+    run.add_argument("--lib-file", help="BeePop+ shared library to use")
+    run.add_argument("--quiet", action="store_true", help="do not report progress")
+
+    validate = commands.add_parser("validate", help="check a scenario table without running it")
+    validate.add_argument("table", help="scenario table (.csv or .parquet)")
+    validate.add_argument("--id-column", default="scenario_id", help="column of scenario ids")
+
+    worker = commands.add_parser("worker", help="run scenarios for a 'pybeepop run --listen'")
+    worker.add_argument("address", type=_address, help="HOST:PORT of the coordinator")
+    worker.add_argument("--lib-file", help="BeePop+ shared library to use")
+    return parser
+
+
+def _validate(args):
+    from .scenarios import read_scenario_table, validate_scenario_table
+
+    table = read_scenario_table(args.table)
+    specs = validate_scenario_table(table, args.id_column)
+    print("{}: {} scenarios of {} parameters are valid.".format(args.table, len(table), len(specs)))
+    return 0
+
+
+def _report(done, total, started):
+    elapsed = time.perf_counter() - started
+    print(
+        "{}/{} scenarios, {:.1f} runs/s".format(done, total, done / elapsed if elapsed else 0.0),
+        file=sys.stderr,
+    )
+
+
+def _run(args):
+    from .pybeepop import PyBeePop
+    from .scenarios import scenario_parameters
+    from .store import ResultStore
+
+    scenarios = scenario_parameters(args.table, args.id_column)
+    beepop = PyBeePop(lib_file=args.lib_file)
+    if args.parameters:
+        beepop.load_parameter_file(args.parameters)
+    beepop.load_weather(args.weather)
+    if args.residue:
+        beepop.load_residue_file(args.residue)
+    executor = None
+    if args.listen:
+        from .executors import SocketExecutor
+
+        executor = SocketExecutor(args.listen, authkey=_authkey())
+        print("Serving scenarios on {}:{}".format(*executor.address), file=sys.stderr)
+    elif args.timeout or args.recycle_after:
+        from .executors import SupervisedExecutor
+
+        executor = SupervisedExecutor(
+            args.workers, args.timeout, args.recycle_after, lib_file=args.lib_file
+        )
+    options = dict(
+        n_workers=args.workers,
+        chunksize=args.chunksize,
+        columns=args.columns,
+        start=args.start,
+        end=args.end,
+        executor=executor,
+    )
+    started = time.perf_counter()
+    try:
+        with ResultStore(args.output) as store:
+            if args.manifest:
+                from .campaign import Campaign
+
+                with Campaign(args.manifest, max_retries=args.max_retries) as campaign:
+                    status = campaign.run(beepop, scenarios, store=store, **options)
+                    failures = campaign.failures()
+            else:
+                failures = []
+                every = max(1, len(scenarios) // 20)
+                results = beepop.run_batch(scenarios, stream=True, store=store, **options)
+                for done, result in enumerate(results, 1):
+                    if not result.ok:
+                        failures.append(result)
+                    if not args.quiet and (done % every == 0 or done == len(scenarios)):
+                        _report(done, len(scenarios), started)
+                status = {"done": len(scenarios) - len(failures), "failed": len(failures)}
+    finally:
+        if executor is not None:
+            executor.close()
+    for result in failures:
+        print("{}: {}".format(result.scenario_id, result.error), file=sys.stderr)
+    print(
+        "{} scenarios done, {} failed in {:.0f} s; outputs in {}".format(
+            status["done"], status["failed"], time.perf_counter() - started, args.output
+        )
+    )
+    return 1 if failures else 0
+
+
+def _worker(args):
+    from .executors import run_worker
+
+    run_worker(args.address, _authkey(), lib_file=args.lib_file)
+    return 0
+
+
+def main(argv=None):
+    """Entry point of the pybeepop command.
+
+    Returns:
+        int: 0 on success, 1 if any scenario failed and 2 if the input was invalid.
+    """
+    args = _parser().parse_args(argv)
+    command = {"run": _run, "validate": _validate, "worker": _worker}[args.command]
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("always")  # report every out-of-range column
+            return command(args)
+    except (ValueError, FileNotFoundError, ImportError) as e:
+        print("error: {}".format(e), file=sys.stderr)
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,360 @@
+"""
+pybeepop - fast emulators of BeePop+ output trajectories
+
+An Emulator is trained on a batch of BeePop+ runs over a box of parameter values. The daily
+trajectories of one output column are compressed with principal component analysis, and the
+scores of the leading components are predicted from the parameters by ridge regression on
+quadratic features. A prediction is then two small matrix products, which takes microseconds,
+against seconds for a BeePop+ run. Part of the runs is held out to estimate the emulator's
+error, and queries outside the training box can be answered by running BeePop+ instead.
+"""
+
+import json
+import numpy as np
+from .parameters import get_parameter_spec
+from .results import output_columns
+from .sensitivity import latin_hypercube, parameter_bounds, scale_samples, _daily_values
+
+
+class TrajectoryReducer:
+    """Reduce the output of a run to the daily values of one column, as a float64 array."""
+
+    def __init__(self, column="Colony Size"):
+        self.column = column
+
+    def __call__(self, output):
+        return _daily_values(output, self.column)
+
+
+def _features(unit):
+    """Quadratic features of points in the unit cube: 1, x_i and x_i * x_j for i <= j."""
+    unit = np.atleast_2d(unit)
+    i, j = np.triu_indices(unit.shape[1])
+    return np.hstack([np.ones((len(unit), 1)), unit, unit[:, i] * unit[:, j]])
+
+
+def _error_estimates(predicted, actual):
+    """Return the error measures of predicted trajectories against BeePop+ runs."""
+    errors = predicted - actual
+    rmse = float(np.sqrt(np.mean(errors**2)))
+    return {
+        "rmse": rmse,
+        "max": float(np.abs(errors).max()),
+        "relative_rmse": rmse / max(float(np.abs(actual).mean()), np.finfo(float).tiny),
+        "daily_rmse": np.sqrt(np.mean(errors**2, axis=0)),
+        "n_test": len(actual),
+    }
+
+
+class Emulator:
+    """Emulator of the daily values of one BeePop+ output column.
+
+    Attributes:
+        names (list): Names of the emulated parameters.
+        bounds (ndarray): Low and high value of each parameter in the training runs, shape
+            (parameters, 2). Queries outside these bounds are outside the training domain.
+        column (str): The emulated output column.
+        base_parameters (dict): Parameters that were fixed in the training runs.
+        n_components (int): Number of principal components kept.
+        errors (dict): Errors on the held-out runs: "rmse", "max" (largest absolute error),
+            "relative_rmse" (rmse over the mean absolute value), "daily_rmse" (array with the
+            rmse of each day) and "n_test". None if no runs were held out.
+    """
+
+    def __init__(
+        self, names, bounds, column, base_parameters, mean, components, weights, errors=None
+    ):
+        self.names = list(names)
+        self.bounds = np.asarray(bounds, dtype=np.float64)
+        self.column = column
+        self.base_parameters = dict(base_parameters)
+        self.mean = mean
+        self.components = components
+        self.weights = weights
+        self.errors = errors
+        self._low = self.bounds[:, 0]
+        self._span = self.bounds[:, 1] - self.bounds[:, 0]
+        self._index = dict((name.lower(), i) for i, name in enumerate(self.names))
+
+    @property
+    def n_components(self):
+        return len(self.components)
+
+    @classmethod
+    def fit(
+        cls,
+        names,
+        samples,
+        trajectories,
+        bounds=None,
+        column="Colony Size",
+        base_parameters=None,
+        n_components=None,
+        variance=0.9999,
+        alpha=1e-6,
+        test_fraction=0.2,
+        seed=None,
+    ):
+        """Fit an emulator to parameter samples and the trajectories BeePop+ gave for them.
+
+        Args:
+            names (list): Names of the parameters, one per column of samples.
+            samples (ndarray): Parameter values of each run, shape (runs, parameters).
+            trajectories (ndarray): Daily output of each run, shape (runs, days).
+            bounds (dict, optional): name: (low, high) of the training domain. Defaults to the
+                Min/Max of the parameter file.
+            column (str, optional): The output column emulated. Defaults to "Colony Size".
+            base_parameters (dict, optional): Parameters fixed in the runs. Defaults to None.
+            n_components (int, optional): Number of principal components to keep. Defaults to
+                the fewest that explain the given fraction of variance.
+            variance (float, optional): Fraction of the variance of the trajectories that the
+                kept components must explain. Defaults to 0.9999.
+            alpha (float, optional): Ridge penalty, relative to the mean squared feature.
+                Defaults to 1e-6.
+            test_fraction (float, optional): Fraction of the runs held out to estimate the
+                errors. The final emulator is refitted on all runs. Defaults to 0.2.
+            seed (int, optional): Seed for choosing the held-out runs. Defaults to None.
+
+        Raises:
+            ValueError: If the shapes do not match or there are too few runs.
+
+        Returns:
+            Emulator: The fitted emulator.
+        """
+        names = [get_parameter_spec(name).name for name in names]
+        limits = parameter_bounds(names, bounds)
+        samples = np.asarray(samples, dtype=np.float64).reshape(-1, len(names))
+        trajectories = np.asarray(trajectories, dtype=np.float64)
+        if trajectories.ndim != 2 or len(trajectories) != len(samples):
+            raise ValueError("trajectories must have one row of daily values per sample.")
+        unit = (samples - limits[:, 0]) / (limits[:, 1] - limits[:, 0])
+        n_test = int(round(len(samples) * test_fraction))
+        if len(samples) - n_test < 2:
+            raise ValueError("At least 2 runs are needed to fit an emulator.")
+
+        def train(rows):
+            features = _features(unit[rows])
+            mean = trajectories[rows].mean(axis=0)
+            _, singular, components = np.linalg.svd(trajectories[rows] - mean, full_matrices=False)
+            k = n_components
+            if k is None:
+                explained = np.cumsum(singular**2) / max((singular**2).sum(), np.finfo(float).tiny)
+                k = int(np.searchsorted(explained, variance) + 1)
+            components = components[: min(k, len(components))]
+            scores = (trajectories[rows] - mean) @ components.T
+            gram = features.T @ features
+            penalty = alpha * np.trace(gram) / len(gram)
+            weights = np.linalg.solve(gram + penalty * np.eye(len(gram)), features.T @ scores)
+            return mean, components, weights
+
+        errors = None
+        if n_test:
+            order = np.random.default_rng(seed).permutation(len(samples))
+            test, rows = order[:n_test], order[n_test:]
+            mean, components, weights = train(rows)
+            predicted = mean + (_features(unit[test]) @ weights) @ components
+            errors = _error_estimates(predicted, trajectories[test])
+        mean, components, weights = train(np.arange(len(samples)))
+        return cls(
+            names,
+            limits,
+            column,
+            base_parameters or {},
+            mean,
+            components,
+            weights,
+            errors,
+        )
+
+    @classmethod
+    def train(
+        cls,
+        beepop,
+        parameters,
+        n_samples=200,
+        bounds=None,
+        column="Colony Size",
+        seed=None,
+        n_workers=None,
+        chunksize=1,
+        executor=None,
+        **fit_options
+    ):
+        """Run BeePop+ over a Latin hypercube of the parameters and fit an emulator to the runs.
+
+        The runs use the weather, residues and parameters already set on beepop, and the
+        workers return only the emulated column.
+
+        Args:
+            beepop (PyBeePop): Model with weather (and optionally residues and fixed
+                parameters) set.
+            parameters (list): Names of the Float or Integer parameters to emulate.
+            n_samples (int, optional): Number of training runs. Defaults to 200.
+            bounds (dict, optional): name: (low, high) bounds of the training domain, replacing
+                the Min/Max of the parameter file. Defaults to None.
+            column (str, optional): Output column to emulate. Defaults to "Colony Size".
+            seed (int, optional): Seed for the sample and the held-out runs. Defaults to None.
+            n_workers (int, optional): Number of worker processes. Defaults to the CPU count.
+            chunksize (int, optional): Number of runs sent to a worker at a time. Defaults to 1.
+            executor (Executor, optional): Executor that runs the batch, as in run_batch.
+                Defaults to None.
+            **fit_options: n_components, variance, alpha and test_fraction, see Emulator.fit.
+
+        Raises:
+            ValueError: If a parameter cannot be sampled, column is not a BeePop+ output or
+                too few runs succeeded.
+
+        Returns:
+            Emulator: The trained emulator.
+        """
+        names = [get_parameter_spec(name).name for name in parameters]
+        output_columns([column])
+        rng = np.random.default_rng(seed)
+        samples = scale_samples(latin_hypercube(n_samples, len(names), seed=rng), names, bounds)
+        integer = [get_parameter_spec(name).type == "Integer" for name in names]
+        parameter_sets = [
+            dict((k, int(v) if is_int else v) for k, v, is_int in zip(names, row, integer))
+            for row in samples.tolist()
+        ]
+        trajectories = [None] * n_samples
+        results = beepop.run_batch(
+            parameter_sets,
+            n_workers=n_workers,
+            chunksize=chunksize,
+            executor=executor,
+            stream=True,
+            columns=[column],
+            reducer=TrajectoryReducer(column),
+        )
+        for result in results:
+            if result.ok:
+                trajectories[result.scenario_id] = result.output
+        ok = [i for i, trajectory in enumerate(trajectories) if trajectory is not None]
+        if len(ok) < 2:
+            raise ValueError("Only {} of {} training runs succeeded.".format(len(ok), n_samples))
+        return cls.fit(
+            names,
+            samples[ok],
+            np.stack([trajectories[i] for i in ok]),
+            bounds=bounds,
+            column=column,
+            base_parameters=beepop.get_parameters(),
+            seed=rng,
+            **fit_options
+        )
+
+    def _values(self, parameters):
+        """Return the parameter values of a query as an array, or None if the names of a dict
+        are not exactly the emulated parameters."""
+        if not isinstance(parameters, dict):
+            return np.asarray(parameters, dtype=np.float64)
+        values = np.empty(len(self.names))
+        for name, value in parameters.items():
+            i = self._index.get(name.lower())
+            if i is None:
+                return None
+            values[i] = value
+        return values if len(parameters) == len(self.names) else None
+
+    def in_domain(self, parameters):
+        """True if a query sets exactly the emulated parameters, within their training bounds.
+
+        Args:
+            parameters (dict or array): name: value of every emulated parameter, or the values
+                in the order of names. An array of shape (queries, parameters) gives one answer
+                per query.
+        """
+        values = self._values(parameters)
+        if values is None:
+            return False
+        inside = ((values >= self._low) & (values <= self.bounds[:, 1])).all(axis=-1)
+        return bool(inside) if np.ndim(inside) == 0 else inside
+
+    def predict(self, parameters):
+        """Return the emulated daily values for one query or an array of queries.
+
+        No check is made that the queries are in the training domain; see in_domain and query.
+
+        Args:
+            parameters (dict or array): name: value of every emulated parameter, or the values
+                in the order of names, with shape (parameters,) or (queries, parameters).
+
+        Returns:
+            ndarray: The daily values, shape (days,), or (queries, days) for several queries.
+        """
+        values = self._values(parameters)
+        if values is None:
+            raise ValueError("A query must give exactly these parameters: {}".format(self.names))
+        scores = _features((values - self._low) / self._span) @ self.weights
+        predicted = self.mean + scores @ self.components
+        return predicted[0] if np.ndim(values) == 1 else predicted
+
+    def query(self, parameters, beepop=None):
+        """Answer a what-if query, emulated when possible and run with BeePop+ otherwise.
+
+        Args:
+            parameters (dict): name: value of every emulated parameter. Queries that leave out
+                an emulated parameter, set other parameters or go beyond the training bounds are
+                outside the training domain.
+            beepop (PyBeePop, optional): Model set up as for training (weather and residues),
+                used for queries outside the training domain. The base parameters and the query
+                are set on it. Defaults to None.
+
+        Raises:
+            ValueError: If the query is outside the training domain and no beepop is given.
+
+        Returns:
+            tuple: The daily values and their expected error: the held-out rmse for emulated
+                values (NaN if none was estimated) and 0 for values from a BeePop+ run.
+        """
+        if self.in_domain(parameters):
+            rmse = self.errors["rmse"] if self.errors else np.nan
+            return self.predict(parameters), rmse
+        if beepop is None:
+            raise ValueError(
+                "The query {} is outside the training domain of the emulator.".format(parameters)
+            )
+        query = dict((k.lower(), v) for k, v in parameters.items())
+        base = dict((k.lower(), v) for k, v in self.base_parameters.items())
+        beepop.set_parameters(dict(base, **query))
+        return beepop.run_model(columns=[self.column], reducer=TrajectoryReducer(self.column)), 0.0
+
+    def save(self, path):
+        """Save the emulator to a NumPy .npz file."""
+        errors = dict(self.errors) if self.errors else None
+        daily_rmse = errors.pop("daily_rmse") if errors else np.zeros(0)
+        metadata = {
+            "names": self.names,
+            "column": self.column,
+            "base_parameters": self.base_parameters,
+            "errors": errors,
+        }
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                metadata=np.array(json.dumps(metadata)),
+                bounds=self.bounds,
+                mean=self.mean,
+                components=self.components,
+                weights=self.weights,
+                daily_rmse=daily_rmse,
+            )
+
+    @classmethod
+    def load(cls, path):
+        """Load an emulator saved with save."""
+        with np.load(path, allow_pickle=False) as arrays:
+            metadata = json.loads(str(arrays["metadata"]))
+            errors = metadata["errors"]
+            if errors is not None:
+                errors["daily_rmse"] = arrays["daily_rmse"]
+            return cls(
+                metadata["names"],
+                arrays["bounds"],
+                metadata["column"],
+                metadata["base_parameters"],
+                arrays["mean"],
+                arrays["components"],
+                arrays["weights"],
+                errors,
+            )
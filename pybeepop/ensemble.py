@@ -0,0 +1,287 @@
+"""
+pybeepop - ensembles of BeePop+ runs held in one array
+
+An Ensemble stores the daily outputs of many runs as a single contiguous NumPy array shaped
+scenarios x days x variables, with one datetime64 date axis shared by every run. Ensemble
+statistics such as quantile bands, exceedance probabilities and the time until a threshold is
+crossed are computed over the scenario axis in a few vectorized passes.
+"""
+
+import numpy as np
+from .results import colnames, text_columns, output_columns, parse_dates, _window_rows
+
+numeric_columns = [name for name in colnames if name not in text_columns]
+
+
+def _output_arrays(output):
+    """Return (dates, column getter) of a run output DataFrame or BeePopResults."""
+    if hasattr(output, "dates"):  # BeePopResults
+        return output.dates, output.__getitem__
+    dates = parse_dates(np.asarray(output["Date"], dtype="S10"))
+    return dates, lambda name: output[name].to_numpy()
+
+
+class Ensemble:
+    """Daily outputs of many BeePop+ runs with the same dates, as one 3-D array.
+
+    The initial conditions row of each run is dropped, so the first day of the date axis is the
+    simulation start.
+
+    Attributes:
+        data (ndarray): Array shaped (scenarios, days, variables).
+        dates (ndarray): datetime64[D] array of the days.
+        variables (list): Names of the output columns along the last axis.
+        scenario_ids (list): Id of each scenario along the first axis.
+        failures (dict): Error of each failed scenario that was left out, by scenario id.
+
+    Example:
+        results = beepop.run_batch(scenarios, columns=["Colony Size"])
+        ensemble = Ensemble.from_results(results, dtype=np.float32)
+        bands = ensemble.quantile([0.05, 0.5, 0.95], "Colony Size")  # shape (3, days)
+        p_small = ensemble.exceedance(5000, "Colony Size", below=True)
+    """
+
+    def __init__(self, data, dates, variables, scenario_ids=None, failures=None):
+        """
+        Args:
+            data (ndarray): Array shaped (scenarios, days, variables).
+            dates (ndarray): Dates of the days axis.
+            variables (list): Names of the variables axis.
+            scenario_ids (list, optional): Ids of the scenarios axis. Defaults to the indices.
+            failures (dict, optional): Errors of scenarios left out. Defaults to None.
+
+        Raises:
+            ValueError: If the labels do not match the shape of the data.
+        """
+        data = np.asarray(data)
+        if data.ndim != 3:
+            raise ValueError("Ensemble data must be shaped (scenarios, days, variables).")
+        if scenario_ids is None:
+            scenario_ids = list(range(data.shape[0]))
+        if (len(scenario_ids), len(dates), len(variables)) != data.shape:
+            raise ValueError(
+                "Labels for {} scenarios, {} days and {} variables do not match data of "
+                "shape {}.".format(len(scenario_ids), len(dates), len(variables), data.shape)
+            )
+        self.data = data
+        self.dates = np.asarray(dates, dtype="datetime64[D]")
+        self.variables = list(variables)
+        self.scenario_ids = list(scenario_ids)
+        self.failures = dict(failures or {})
+
+    @classmethod
+    def from_results(cls, results, variables=None, dtype=np.float64, n_scenarios=None):
+        """Build an ensemble from run outputs, e.g. the results of run_batch.
+
+        The outputs are copied into the array one at a time, so results can be streamed from
+        run_batch(stream=True) or ResultStore.iter_scenarios without holding them all.
+
+        Args:
+            results (iterable): ScenarioResults, (scenario_id, output) pairs or outputs, where an
+                output is a run_model DataFrame or BeePopResults. Failed ScenarioResults are
+                left out and recorded in failures.
+            variables (list, optional): Numeric output columns to keep. Defaults to all the
+                numeric columns of the first output.
+            dtype (optional): Data type of the array. np.float32 halves the memory and keeps
+                about 7 significant digits. Defaults to np.float64.
+            n_scenarios (int, optional): Number of results, used to size the array up front when
+                results has no length. Defaults to None.
+
+        Raises:
+            ValueError: If a variable is not a numeric BeePop+ output column, or the outputs do
+                not all have the same dates.
+
+        Returns:
+            Ensemble: The outputs stacked along the scenario axis.
+        """
+        if variables is not None:
+            variables = [name for name in output_columns(variables) if name != "Date"]
+            text = [name for name in variables if name in text_columns]
+            if text:
+                raise ValueError("{} not numeric output columns.".format(", ".join(text)))
+        if n_scenarios is None and hasattr(results, "__len__"):
+            n_scenarios = len(results)
+        data, dates, scenario_ids, failures = None, None, [], dict()
+        for index, result in enumerate(results):
+            if hasattr(result, "scenario_id"):  # ScenarioResult
+                if not result.ok:
+                    failures[result.scenario_id] = result.error
+                    continue
+                scenario_id, output = result.scenario_id, result.output
+            elif isinstance(result, tuple):
+                scenario_id, output = result
+            else:
+                scenario_id, output = index, result
+            output_dates, column = _output_arrays(output)
+            days = ~np.isnat(output_dates)
+            if data is None:
+                dates = output_dates[days]
+                if variables is None:
+                    names = getattr(output, "columns", None)
+                    variables = [name for name in numeric_columns if name in names]
+                data = np.empty((max(1, n_scenarios or 1), len(dates), len(variables)), dtype)
+            elif not np.array_equal(output_dates[days], dates):
+                raise ValueError(
+                    "The output of scenario {!r} does not have the same dates as the "
+                    "others.".format(scenario_id)
+                )
+            if len(scenario_ids) == len(data):  # grow geometrically when the length is unknown
+                data = np.concatenate([data, np.empty_like(data)])
+            row = data[len(scenario_ids)]
+            for i, name in enumerate(variables):
+                row[:, i] = column(name)[days]
+            scenario_ids.append(scenario_id)
+        if data is None:
+            return cls(np.empty((0, 0, 0), dtype), [], [], [], failures)
+        if len(data) != len(scenario_ids):
+            data = data[: len(scenario_ids)].copy()
+        return cls(data, dates, variables, scenario_ids, failures)
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    def __getitem__(self, variable):
+        """Return the (scenarios, days) array of one variable, as a view of the data."""
+        return self.data[:, :, self._index(variable)]
+
+    def __repr__(self):
+        return "Ensemble({} scenarios x {} days x {} variables, {})".format(
+            *self.data.shape, self.data.dtype
+        )
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def nbytes(self):
+        """Size of the data array in bytes."""
+        return self.data.nbytes
+
+    def _index(self, variable):
+        try:
+            return self.variables.index(variable)
+        except ValueError:
+            raise KeyError(
+                "{!r} is not in the ensemble. Choose from: {}".format(
+                    variable, ", ".join(self.variables)
+                )
+            ) from None
+
+    def _values(self, variable):
+        """Return a (scenarios, days) array of one variable or (scenarios, days, variables)."""
+        return self.data if variable is None else self[variable]
+
+    def sel(self, variables=None, start=None, end=None, scenarios=None):
+        """Return a subset of the ensemble by label.
+
+        Args:
+            variables (list, optional): Variables to keep. Defaults to all.
+            start (optional): First date to keep, as an MM/DD/YYYY string, a date or a
+                datetime64. Defaults to None.
+            end (optional): Last date to keep. Defaults to None.
+            scenarios (list, optional): Scenario ids to keep. Defaults to all.
+
+        Raises:
+            KeyError: If a variable or scenario is not in the ensemble.
+
+        Returns:
+            Ensemble: The subset. It shares memory with this ensemble unless scenarios are
+                selected.
+        """
+        if isinstance(variables, str):
+            variables = [variables]
+        rows = slice(None)
+        scenario_ids = self.scenario_ids
+        if scenarios is not None:
+            position = dict((scenario_id, i) for i, scenario_id in enumerate(self.scenario_ids))
+            missing = [scenario_id for scenario_id in scenarios if scenario_id not in position]
+            if missing:
+                raise KeyError("Scenarios {} are not in the ensemble.".format(missing))
+            rows = [position[scenario_id] for scenario_id in scenarios]
+            scenario_ids = list(scenarios)
+        days = slice(None)
+        if start is not None or end is not None:
+            days = _window_rows(self.dates, start, end)
+        data = self.data[rows, days]
+        if variables is None:
+            variables = self.variables
+        else:
+            data = data[:, :, [self._index(name) for name in variables]]
+        return Ensemble(data, self.dates[days], variables, scenario_ids, self.failures)
+
+    def mean(self, variable=None):
+        """Return the ensemble mean of each day, shaped (days,) for one variable or
+        (days, variables) for all."""
+        return self._values(variable).mean(axis=0, dtype=np.float64)
+
+    def std(self, variable=None):
+        """Return the ensemble standard deviation of each day, shaped like mean()."""
+        return self._values(variable).std(axis=0, dtype=np.float64)
+
+    def quantile(self, q, variable=None):
+        """Return ensemble quantiles of each day.
+
+        Args:
+            q (float or list): Quantile or quantiles between 0 and 1.
+            variable (str, optional): Variable to summarize. Defaults to all, one at a time,
+                so that only one variable is copied at once.
+
+        Returns:
+            ndarray: Shaped q.shape + (days,) for one variable or q.shape + (days, variables).
+        """
+        if variable is not None:
+            return np.quantile(self[variable], q, axis=0)
+        return np.stack([np.quantile(self[name], q, axis=0) for name in self.variables], -1)
+
+    def exceedance(self, threshold, variable, below=False):
+        """Return the fraction of scenarios above (or below) a threshold on each day.
+
+        Args:
+            threshold (float): Threshold value.
+            variable (str): Variable to compare.
+            below (bool, optional): Count scenarios below the threshold instead? Defaults to
+                False.
+
+        Returns:
+            ndarray: Probability of each day, shaped (days,).
+        """
+        values = self[variable]
+        crossed = values < threshold if below else values > threshold
+        return crossed.mean(axis=0)
+
+    def time_to_threshold(self, threshold, variable, below=True):
+        """Return the number of days until each scenario first crosses a threshold.
+
+        Args:
+            threshold (float): Threshold value.
+            variable (str): Variable to compare.
+            below (bool, optional): Look for the first day below the threshold, e.g. a colony
+                collapse? Otherwise the first day above it. Defaults to True.
+
+        Returns:
+            ndarray: Days since the first date, shaped (scenarios,). NaN where the threshold is
+                never crossed. Add them to dates[0] to get the dates.
+        """
+        values = self[variable]
+        crossed = values < threshold if below else values > threshold
+        days = crossed.argmax(axis=1).astype(np.float64)
+        days[~crossed.any(axis=1)] = np.nan
+        return days
+
+    def summary(self, variable, quantiles=(0.05, 0.5, 0.95)):
+        """Return the daily mean and quantile bands of one variable as a DataFrame.
+
+        Args:
+            variable (str): Variable to summarize.
+            quantiles (list, optional): Quantiles to include. Defaults to 0.05, 0.5 and 0.95.
+
+        Returns:
+            DataFrame: Indexed by date, with a "mean" column and a column per quantile.
+        """
+        import pandas as pd
+
+        frame = pd.DataFrame({"mean": self.mean(variable)}, index=pd.Index(self.dates, name="Date"))
+        for q, values in zip(quantiles, self.quantile(list(quantiles), variable)):
+            frame["q{:g}".format(q)] = values
+        return frame
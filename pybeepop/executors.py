@@ -0,0 +1,650 @@
+"""
+pybeepop - pluggable executors for batches of BeePop+ scenarios
+
+An executor runs scenarios against shared weather, residues and base parameters and yields a
+ScenarioResult for each, in input order. ProcessExecutor uses worker processes on this machine.
+SocketExecutor hands scenarios out over TCP to workers on any number of hosts, started with
+run_worker. Each worker receives a weather or residue input once, and afterwards it is referred
+to only by its content hash; workers send back only the (optionally reduced) result of each run.
+
+SocketExecutor uses multiprocessing.connection, which authenticates workers with a shared key
+but exchanges pickled objects. Use it only on networks where the workers are trusted.
+"""
+
+import os
+import sys
+import time
+import queue
+import signal
+import socket
+import threading
+import collections
+import multiprocessing
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client, wait
+from .batch import BatchWorker, ScenarioResult, iter_batch, _enumerate_scenarios
+from .inputs import input_cache
+from .results import output_columns
+
+
+class Executor:
+    """Base class of executors. Subclasses implement map()."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def map(
+        self,
+        parameter_sets,
+        weather_file,
+        residue_file=None,
+        parameters=None,
+        reducer=None,
+        instrument=False,
+        columns=None,
+        start=None,
+        end=None,
+    ):
+        """Run scenarios and yield their results in input order.
+
+        Args:
+            parameter_sets (list or dict): Parameter dicts, one per scenario. If a dict is given,
+                its keys are used as scenario ids; otherwise the scenario id is the list index.
+            weather_file: Path to the weather file, or in-memory weather rows.
+            residue_file (optional): Path to a residue file, or in-memory residue rows.
+                Defaults to None.
+            parameters (dict, optional): Base parameters applied before each scenario's own
+                parameters. Defaults to None.
+            reducer (callable, optional): Picklable function applied to each run's output
+                DataFrame where the scenario runs. Defaults to None.
+            instrument (bool, optional): Record per-phase timings of each scenario?
+                Defaults to False.
+            columns (list, optional): Output columns to return. Defaults to None (all).
+            start (optional): First date of each output. Defaults to None.
+            end (optional): Last date of each output. Defaults to None.
+
+        Yields:
+            ScenarioResult: The outcome of each scenario, in input order.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Release the executor's resources."""
+
+
+class ProcessExecutor(Executor):
+    """Runs scenarios in a pool of worker processes on this machine (see batch.iter_batch)."""
+
+    def __init__(self, n_workers=None, chunksize=1, lib_file=None, verbose=False):
+        """
+        Args:
+            n_workers (int, optional): Number of worker processes. Defaults to the CPU count.
+            chunksize (int, optional): Number of scenarios sent to a worker at a time.
+                Defaults to 1.
+            lib_file (str, optional): Path to the BeePop+ shared library. Defaults to the
+                library bundled for this platform.
+            verbose (bool, optional): Print debugging messages? Defaults to False.
+        """
+        from .pybeepop import find_library
+
+        self.n_workers = n_workers
+        self.chunksize = chunksize
+        self.lib_file = find_library(lib_file, verbose=verbose)
+        self.verbose = verbose
+
+    def map(
+        self,
+        parameter_sets,
+        weather_file,
+        residue_file=None,
+        parameters=None,
+        reducer=None,
+        instrument=False,
+        columns=None,
+        start=None,
+        end=None,
+    ):
+        return iter_batch(
+            self.lib_file,
+            parameter_sets,
+            weather_file,
+            residue_file=residue_file,
+            parameters=parameters,
+            n_workers=self.n_workers,
+            chunksize=self.chunksize,
+            reducer=reducer,
+            verbose=self.verbose,
+            instrument=instrument,
+            columns=columns,
+            start=start,
+            end=end,
+        )
+
+
+class _RemoteWorker:
+    """The coordinator's view of one connected worker."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.name = None
+        self.inputs = set()  # keys of the inputs the worker holds
+        self.batch = None  # id of the batch the worker is set up for
+        self.in_flight = dict()  # (batch id, task index): (scenario_id, parameters)
+
+    def send(self, message):
+        """Send a message, returning False if the worker is gone."""
+        try:
+            self.connection.send(message)
+            return True
+        except (OSError, ValueError):
+            return False
+
+    def setup(self, inputs, batch):
+        """Send the worker the inputs it lacks and the batch settings, if it needs them."""
+        if self.batch == batch[1]:
+            return True
+        for prepared in inputs:
+            if prepared.key not in self.inputs:
+                if not self.send(("input", prepared)):
+                    return False
+                self.inputs.add(prepared.key)
+        if not self.send(batch):
+            return False
+        self.batch = batch[1]
+        return True
+
+    def submit(self, batch, task):
+        """Send a task of a batch to the worker and record it as in flight."""
+        index, scenario_id, parameters = task
+        self.in_flight[(batch[1], index)] = (scenario_id, parameters)
+        return self.send(("task", batch[1], index, scenario_id, parameters))
+
+
+class SocketExecutor(Executor):
+    """Coordinator of a TCP work queue of BeePop+ workers.
+
+    Workers can join or leave at any time. Scenarios are handed to whichever worker has room,
+    and the scenarios of a worker that disconnects are given to the others. A batch waits for
+    workers to connect if there are none.
+
+    Example:
+        with SocketExecutor(("0.0.0.0", 6000), authkey=b"secret") as executor:
+            # on each node: pybeepop.executors.run_worker(("coordinator", 6000), b"secret")
+            results = beepop.run_batch(scenarios, executor=executor, reducer=SummaryReducer())
+    """
+
+    def __init__(self, address=("127.0.0.1", 0), authkey=None, prefetch=2, max_requeues=2):
+        """
+        Args:
+            address (tuple, optional): (host, port) to listen on. Port 0 picks a free port; see
+                the address attribute for the one used. Defaults to ("127.0.0.1", 0).
+            authkey (bytes): Shared key that workers must present. Required.
+            prefetch (int, optional): Scenarios queued on each worker, so that it does not wait
+                for the next one after each run. Defaults to 2.
+            max_requeues (int, optional): Times a scenario is given to another worker after the
+                worker running it disconnected, before it is reported as failed. Defaults to 2.
+
+        Raises:
+            ValueError: If no authkey is given.
+        """
+        if not authkey:
+            raise ValueError("An authkey is required so that only your workers can connect.")
+        self.authkey = authkey
+        self.prefetch = max(1, prefetch)
+        self.max_requeues = max_requeues
+        self._listener = Listener(address, authkey=authkey)
+        self.address = self._listener.address
+        self._workers = dict()  # connection: _RemoteWorker
+        self._accepted = queue.Queue()
+        self._batches = 0
+        self._closed = False
+        self._accept_thread = threading.Thread(target=self._accept, daemon=True)
+        self._accept_thread.start()
+
+    def __len__(self):
+        return len(self._workers)
+
+    def _accept(self):
+        while not self._closed:
+            try:
+                connection = self._listener.accept()
+            except (OSError, EOFError, AuthenticationError):
+                continue  # closed, or a client that failed the handshake
+            self._accepted.put(connection)
+
+    def _add_workers(self, timeout=0):
+        """Register connections accepted since the last call, waiting up to timeout for one."""
+        try:
+            connection = self._accepted.get(timeout=timeout) if timeout else None
+        except queue.Empty:
+            return
+        while True:
+            if connection is not None:
+                self._workers[connection] = _RemoteWorker(connection)
+            try:
+                connection = self._accepted.get_nowait()
+            except queue.Empty:
+                return
+
+    def _drop(self, worker, batch_id, tasks, requeues, results):
+        """Forget a disconnected worker and put its scenarios back in the queue."""
+        del self._workers[worker.connection]
+        worker.connection.close()
+        for key in sorted(worker.in_flight, reverse=True):
+            if key[0] != batch_id:
+                continue  # left over from an earlier batch
+            index = key[1]
+            scenario_id, scenario_parameters = worker.in_flight[key]
+            requeues[index] += 1
+            if requeues[index] > self.max_requeues:
+                results[index] = ScenarioResult(
+                    scenario_id, error="ConnectionError: worker {} disconnected".format(worker.name)
+                )
+            else:
+                tasks.appendleft((index, scenario_id, scenario_parameters))
+
+    def map(
+        self,
+        parameter_sets,
+        weather_file,
+        residue_file=None,
+        parameters=None,
+        reducer=None,
+        instrument=False,
+        columns=None,
+        start=None,
+        end=None,
+    ):
+        if self._closed:
+            raise RuntimeError("The executor has been closed.")
+        scenarios = _enumerate_scenarios(parameter_sets)
+        self._batches += 1
+        inputs, batch = _batch_messages(
+            self._batches,
+            weather_file,
+            residue_file,
+            parameters,
+            reducer,
+            instrument,
+            {"columns": columns, "start": start, "end": end},
+        )
+        return self._run(scenarios, inputs, batch)
+
+    def _run(self, scenarios, inputs, batch):
+        tasks = collections.deque(
+            (index, scenario_id, parameters)
+            for index, (scenario_id, parameters) in enumerate(scenarios)
+        )
+        results = [None] * len(scenarios)
+        requeues = [0] * len(scenarios)
+        next_result = 0
+        while next_result < len(scenarios):
+            self._add_workers(timeout=0 if self._workers else 0.1)
+            for worker in list(self._workers.values()):
+                sent = True
+                while sent and tasks and len(worker.in_flight) < self.prefetch:
+                    sent = worker.setup(inputs, batch) and worker.submit(batch, tasks.popleft())
+                if not sent:
+                    self._drop(worker, batch[1], tasks, requeues, results)
+            connections = list(self._workers)
+            for connection in wait(connections, timeout=0.1) if connections else []:
+                worker = self._workers[connection]
+                try:
+                    message = connection.recv()
+                except (EOFError, OSError):
+                    self._drop(worker, batch[1], tasks, requeues, results)
+                    continue
+                if message[0] == "hello":
+                    worker.name = message[1]
+                    worker.inputs.update(message[2])
+                elif message[0] == "result":
+                    _, batch_id, index, result, _ = message
+                    sent = worker.in_flight.pop((batch_id, index), None) is not None
+                    if sent and batch_id == batch[1] and results[index] is None:
+                        results[index] = result
+            while next_result < len(scenarios) and results[next_result] is not None:
+                yield results[next_result]
+                results[next_result] = None
+                next_result += 1
+
+    def close(self):
+        """Stop the workers' connections and the listener."""
+        if self._closed:
+            return
+        self._closed = True
+        self._add_workers()
+        for worker in list(self._workers.values()):
+            worker.send(("stop",))
+            worker.connection.close()
+        self._workers.clear()
+        self._listener.close()
+        try:  # wake the accept thread so it sees the executor is closed
+            Client(self.address, authkey=self.authkey).close()
+        except OSError:
+            pass
+        self._accept_thread.join(timeout=1)
+
+
+def _batch_messages(batch_id, weather_file, residue_file, parameters, reducer, instrument, options):
+    """Return the prepared inputs of a batch and the message that sets a worker up for it."""
+    output_columns(options["columns"])  # fail before sending anything
+    inputs = [input_cache.get(weather_file)]
+    if residue_file is not None:
+        inputs.append(input_cache.get(residue_file))
+    batch = (
+        "batch",
+        batch_id,
+        [prepared.key for prepared in inputs],
+        dict(parameters or {}),
+        reducer,
+        instrument,
+        options,
+    )
+    return inputs, batch
+
+
+def _memory_usage():
+    """Return the resident memory of this process in bytes, or None if it is not known."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _serve(connection, lib_file, verbose=False):
+    """Run the inputs, batches and tasks received on a connection until told to stop."""
+    inputs = dict()  # prepared weather and residues by key
+    batch_id, worker, setup_error = None, None, None
+    connection.send(("hello", "{}:{}".format(socket.gethostname(), os.getpid()), []))
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            break
+        kind = message[0]
+        if kind == "input":
+            prepared = input_cache.get(message[1])
+            inputs[prepared.key] = prepared
+        elif kind == "batch":
+            _, batch_id, keys, parameters, reducer, instrument, output_options = message
+            try:
+                worker = BatchWorker(
+                    lib_file,
+                    inputs[keys[0]],
+                    inputs[keys[1]] if len(keys) > 1 else None,
+                    parameters,
+                    reducer,
+                    verbose,
+                    instrument,
+                    output_options,
+                )
+                setup_error = None
+            except Exception as e:
+                worker, setup_error = None, "{}: {}".format(type(e).__name__, e)
+        elif kind == "task":
+            _, task_batch, index, scenario_id, parameters = message
+            if worker is None or task_batch != batch_id:
+                error = setup_error or "RuntimeError: batch {} is not set up".format(task_batch)
+                result = ScenarioResult(scenario_id, error=error)
+            else:
+                result = worker.run(scenario_id, parameters)
+            connection.send(("result", task_batch, index, result, _memory_usage()))
+        elif kind == "stop":
+            break
+
+
+def run_worker(address, authkey, lib_file=None, verbose=False):
+    """Connect to a SocketExecutor and run the scenarios it sends until it closes.
+
+    Args:
+        address (tuple): (host, port) of the coordinator.
+        authkey (bytes): Shared key of the coordinator.
+        lib_file (str, optional): Path to the BeePop+ shared library on this host. Defaults to
+            the library bundled for this platform.
+        verbose (bool, optional): Print debugging messages? Defaults to False.
+    """
+    from .pybeepop import find_library
+
+    lib_file = find_library(lib_file, verbose=verbose)
+    connection = Client(tuple(address), authkey=authkey)
+    try:
+        _serve(connection, lib_file, verbose)
+    finally:
+        connection.close()
+
+
+def _supervised_worker(connection, lib_file, verbose):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the supervisor decides when workers stop
+    try:
+        _serve(connection, lib_file, verbose)
+    finally:
+        connection.close()
+
+
+_NTSTATUS_NAMES = {  # exit codes of native crashes on Windows
+    0xC0000005: "STATUS_ACCESS_VIOLATION",
+    0xC000001D: "STATUS_ILLEGAL_INSTRUCTION",
+    0xC0000094: "STATUS_INTEGER_DIVIDE_BY_ZERO",
+    0xC00000FD: "STATUS_STACK_OVERFLOW",
+    0xC0000374: "STATUS_HEAP_CORRUPTION",
+    0xC0000409: "STATUS_STACK_BUFFER_OVERRUN",
+}
+
+
+class _ChildWorker(_RemoteWorker):
+    """A worker process started by a SupervisedExecutor."""
+
+    def __init__(self, context, lib_file, verbose):
+        connection, child_connection = context.Pipe()
+        super().__init__(connection)
+        self.process = context.Process(
+            target=_supervised_worker, args=(child_connection, lib_file, verbose), daemon=True
+        )
+        self.process.start()
+        child_connection.close()  # so that the worker's death reads as EOF here
+        self.runs = 0
+        self.deadline = None
+
+    def stop(self, timeout=5):
+        """Ask the worker to exit, and kill it if it does not."""
+        self.send(("stop",))
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.connection.close()
+
+    def kill(self):
+        """Kill the worker, e.g. in the middle of a run."""
+        self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+    def exit_description(self):
+        """Describe how the worker ended, killing it first if it is still running."""
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.connection.close()
+        code = self.process.exitcode
+        if code is not None and code < 0:
+            try:
+                return "killed by {}".format(signal.Signals(-code).name)
+            except ValueError:
+                return "killed by signal {}".format(-code)
+        if sys.platform == "win32" and code is not None and code & 0xC0000000 == 0xC0000000:
+            # a native crash on Windows ends the process with an NTSTATUS error code
+            status = _NTSTATUS_NAMES.get(code & 0xFFFFFFFF, "an NTSTATUS error")
+            return "crashed with {} (0x{:08X})".format(status, code & 0xFFFFFFFF)
+        return "exited with code {}".format(code)
+
+
+class SupervisedExecutor(Executor):
+    """Runs scenarios in supervised worker processes that are replaced when they misbehave.
+
+    Each worker runs one scenario at a time. A scenario that runs longer than the timeout has
+    its worker killed, and a worker that crashes (e.g. a segmentation fault in BeePop+) is
+    detected; both come back as failed ScenarioResults and the batch carries on with a new
+    worker. Workers are also replaced after a number of runs or once their memory grows past a
+    limit, so that throughput holds up over long campaigns. Workers stay up between batches
+    and only receive inputs they do not hold yet.
+
+    Attributes:
+        counts (dict): Number of "timeouts", "crashes" and "recycled" workers so far.
+
+    Example:
+        with SupervisedExecutor(n_workers=8, timeout=120, max_runs=500) as executor:
+            results = beepop.run_batch(scenarios, executor=executor)
+    """
+
+    def __init__(
+        self,
+        n_workers=None,
+        timeout=None,
+        max_runs=None,
+        max_memory=None,
+        lib_file=None,
+        verbose=False,
+        start_method=None,
+    ):
+        """
+        Args:
+            n_workers (int, optional): Number of worker processes. Defaults to the CPU count.
+            timeout (float, optional): Seconds a scenario may run before its worker is killed.
+                Defaults to None (no limit).
+            max_runs (int, optional): Runs after which a worker is replaced. Defaults to None
+                (never).
+            max_memory (int, optional): Resident memory in bytes above which a worker is
+                replaced after its current run. Only measured on Linux. Defaults to None.
+            lib_file (str, optional): Path to the BeePop+ shared library. Defaults to the
+                library bundled for this platform.
+            verbose (bool, optional): Print debugging messages? Defaults to False.
+            start_method (str, optional): multiprocessing start method of the workers.
+                Defaults to the platform default.
+        """
+        from .pybeepop import find_library
+
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.max_runs = max_runs
+        self.max_memory = max_memory
+        self.lib_file = find_library(lib_file, verbose=verbose)
+        self.verbose = verbose
+        self.counts = {"timeouts": 0, "crashes": 0, "recycled": 0}
+        self._context = multiprocessing.get_context(start_method)
+        self._workers = dict()  # connection: _ChildWorker
+        self._batches = 0
+        self._closed = False
+
+    def __len__(self):
+        return len(self._workers)
+
+    def map(
+        self,
+        parameter_sets,
+        weather_file,
+        residue_file=None,
+        parameters=None,
+        reducer=None,
+        instrument=False,
+        columns=None,
+        start=None,
+        end=None,
+    ):
+        if self._closed:
+            raise RuntimeError("The executor has been closed.")
+        scenarios = _enumerate_scenarios(parameter_sets)
+        self._batches += 1
+        inputs, batch = _batch_messages(
+            self._batches,
+            weather_file,
+            residue_file,
+            parameters,
+            reducer,
+            instrument,
+            {"columns": columns, "start": start, "end": end},
+        )
+        return self._run(scenarios, inputs, batch)
+
+    def _spawn(self):
+        worker = _ChildWorker(self._context, self.lib_file, self.verbose)
+        self._workers[worker.connection] = worker
+
+    def _remove(self, worker, batch_id, results, error=None):
+        """Forget a worker, failing the scenario of this batch it was running with error."""
+        del self._workers[worker.connection]
+        for (task_batch, index), (scenario_id, _) in worker.in_flight.items():
+            if task_batch == batch_id:
+                results[index] = ScenarioResult(scenario_id, error=error)
+
+    def _run(self, scenarios, inputs, batch):
+        tasks = collections.deque(
+            (index, scenario_id, parameters)
+            for index, (scenario_id, parameters) in enumerate(scenarios)
+        )
+        results = [None] * len(scenarios)
+        next_result = 0
+        while next_result < len(scenarios):
+            while tasks and len(self._workers) < self.n_workers:
+                self._spawn()
+            for worker in list(self._workers.values()):
+                if tasks and not worker.in_flight:
+                    if worker.setup(inputs, batch) and worker.submit(batch, tasks.popleft()):
+                        if self.timeout is not None:
+                            worker.deadline = time.monotonic() + self.timeout
+                    else:
+                        self._crashed(worker, batch[1], results)
+            timeout = 1.0
+            deadlines = [w.deadline for w in self._workers.values() if w.deadline is not None]
+            if deadlines:
+                timeout = min(timeout, max(0.0, min(deadlines) - time.monotonic()))
+            for connection in wait(list(self._workers), timeout=timeout):
+                worker = self._workers[connection]
+                try:
+                    message = connection.recv()
+                except (EOFError, OSError):
+                    self._crashed(worker, batch[1], results)
+                    continue
+                if message[0] == "result":
+                    _, batch_id, index, result, memory = message
+                    worker.in_flight.pop((batch_id, index), None)
+                    worker.deadline = None
+                    worker.runs += 1
+                    if batch_id == batch[1]:
+                        results[index] = result
+                    if (self.max_runs and worker.runs >= self.max_runs) or (
+                        self.max_memory and memory and memory > self.max_memory
+                    ):
+                        self.counts["recycled"] += 1
+                        self._remove(worker, batch[1], results)
+                        worker.stop()
+            now = time.monotonic()
+            for worker in list(self._workers.values()):
+                if worker.deadline is not None and now >= worker.deadline:
+                    self.counts["timeouts"] += 1
+                    worker.kill()
+                    error = "TimeoutError: the run took longer than {} s".format(self.timeout)
+                    self._remove(worker, batch[1], results, error)
+            while next_result < len(scenarios) and results[next_result] is not None:
+                yield results[next_result]
+                results[next_result] = None
+                next_result += 1
+
+    def _crashed(self, worker, batch_id, results):
+        self.counts["crashes"] += 1
+        error = "ChildProcessError: the worker process {}".format(worker.exit_description())
+        self._remove(worker, batch_id, results, error)
+
+    def close(self):
+        """Stop the worker processes."""
+        if self._closed:
+            return
+        self._closed = True
+        for worker in list(self._workers.values()):
+            worker.stop()
+        self._workers.clear()
@@ -0,0 +1,455 @@
+"""
+pybeepop - cache of weather and residue inputs prepared for BeePop+
+
+BeePop+ takes weather and residue tables as arrays of C strings, one per line. Building those
+arrays means reading the input and encoding every line, so prepared arrays are cached by a hash
+of their content and shared by every BeePopModel in the process.
+
+Weather and residue series held as NumPy arrays can skip text files and per-line Python objects
+altogether: format_weather_arrays and format_residue_arrays write all rows at once into one
+contiguous block of fixed-width lines that the C string array points into.
+"""
+
+import os
+import ctypes
+import hashlib
+import datetime
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+class PreparedLines:
+    """The lines of a weather or residue input as a ctypes array ready to pass to BeePop+.
+
+    Attributes:
+        key (str): Hash of the input content.
+        lines (list): The encoded lines. Holding them keeps the memory the array points into alive.
+        array (ctypes.Array): Array of c_char_p pointing at each line.
+        size (int): Bytes of text in the lines.
+        nbytes (int): Approximate memory held by the lines and the array.
+    """
+
+    def __init__(self, key, lines):
+        self.key = key
+        self.lines = lines
+        self.array = (ctypes.c_char_p * len(lines))(*lines)
+        self.size = sum(len(line) for line in lines)
+        self.nbytes = self.size + len(lines) * (
+            ctypes.sizeof(ctypes.c_char_p) + 33  # pointer plus bytes object overhead
+        )
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __reduce__(self):
+        return (PreparedLines, (self.key, self.lines))
+
+    def date_range(self):
+        """Return the (first, last) dates of the input as strings, taken from the first field
+        of its first and last non-blank lines."""
+        dated = [line for line in self.lines if line.strip()]
+        if not dated:
+            return None, None
+        first = dated[0].split(b",")[0].strip().decode("utf-8")
+        last = dated[-1].split(b",")[0].strip().decode("utf-8")
+        return first, last
+
+
+class PreparedBuffer:
+    """Weather or residue rows formatted into one contiguous block, ready to pass to BeePop+.
+
+    Every line takes the same number of bytes in the block, padded with spaces within its
+    fields and ended by a NUL byte, so the C string array points straight into the block.
+    PreparedBuffer objects can be used wherever a weather or residue file is accepted,
+    including batch runs, and pickle to just their key and block.
+
+    Attributes:
+        key (str): Hash of the formatted rows.
+        rows (ndarray): The block, a C-contiguous uint8 array with one line per row.
+        array (ctypes.Array): Array of c_char_p pointing at each row of the block.
+        size (int): Bytes of text in the lines, without the NUL terminators.
+        nbytes (int): Approximate memory held by the block and the array.
+    """
+
+    def __init__(self, key, rows):
+        self.key = key
+        self.rows = rows
+        n_rows, width = rows.shape
+        self.array = (ctypes.c_char_p * n_rows)()
+        pointers = rows.ctypes.data + np.arange(n_rows, dtype=np.uintp) * np.uintp(width)
+        ctypes.memmove(self.array, pointers.ctypes.data, pointers.nbytes)
+        self.size = rows.size - n_rows
+        self.nbytes = rows.nbytes + pointers.nbytes
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __reduce__(self):
+        return (PreparedBuffer, (self.key, self.rows))
+
+    def date_range(self):
+        """Return the (first, last) dates of the rows as strings."""
+        if not len(self.rows):
+            return None, None
+        return (
+            self.rows[0, :_DATE_WIDTH].tobytes().decode("ascii"),
+            self.rows[-1, :_DATE_WIDTH].tobytes().decode("ascii"),
+        )
+
+
+_DIGITS = np.frombuffer(b"0123456789", dtype=np.uint8)
+_DATE_WIDTH = 10  # MM/DD/YYYY
+_SEPARATOR = np.frombuffer(b", ", dtype=np.uint8)
+
+
+def _as_column(values, name, n_rows=None):
+    """Return a 1-D float array of finite values, checking its length against n_rows."""
+    column = np.asarray(values, dtype=np.float64)
+    if column.ndim != 1:
+        raise ValueError("{} must be a 1-D array.".format(name))
+    if n_rows is not None and len(column) != n_rows:
+        raise ValueError(
+            "{} has {} values but there are {} dates.".format(name, len(column), n_rows)
+        )
+    if not np.isfinite(column).all():
+        raise ValueError("{} contains NaN or infinite values.".format(name))
+    return column
+
+
+def _digits_field(numbers, n_digits, width, point=0):
+    """Write non-negative integers right-aligned into a (rows, width) block of spaces.
+
+    Args:
+        numbers (ndarray): int64 values to write.
+        n_digits (ndarray): Number of digits to write for each value; leading digits beyond
+            it are left as spaces.
+        width (int): Width of the field.
+        point (int, optional): Write a decimal point before the last `point` digits.
+            Defaults to 0 (no decimal point).
+    """
+    field = np.full((len(numbers), width), ord(" "), dtype=np.uint8)
+    column = width - 1
+    for position in range(int(n_digits.max(initial=1))):
+        if point and position == point:
+            field[:, column] = ord(".")
+            column -= 1
+        written = position < n_digits
+        digits = (numbers // 10**position) % 10
+        field[written, column] = _DIGITS[digits[written]]
+        column -= 1
+    return field
+
+
+def _count_digits(numbers, minimum=1):
+    n_digits = np.full(len(numbers), minimum, dtype=np.int64)
+    for power in range(minimum, 19):
+        n_digits += numbers >= 10**power
+    return n_digits
+
+
+def _signed_field(numbers, negative, decimals):
+    """Format scaled non-negative integers as fixed point numbers with an optional '-' sign."""
+    n_digits = _count_digits(numbers, minimum=decimals + 1)
+    width = int(n_digits.max(initial=1)) + (decimals > 0) + bool(negative.any())
+    field = _digits_field(numbers, n_digits, width, point=decimals)
+    sign_column = width - 1 - n_digits - (decimals > 0)
+    field[negative, sign_column[negative]] = ord("-")
+    return field
+
+
+def _fixed_field(values, decimals):
+    """Format floats with a fixed number of decimals, right-aligned in a common width."""
+    scaled = np.abs(values) * 10.0**decimals
+    if len(values) and scaled.max() >= 2**62:
+        raise ValueError("Values are too large to format with {} decimals.".format(decimals))
+    numbers = np.rint(scaled).astype(np.int64)
+    return _signed_field(numbers, (values < 0) & (numbers > 0), decimals)
+
+
+def _scientific_field(values, significant_digits):
+    """Format floats in scientific notation, e.g. 9.00000E-08, in a common width."""
+    magnitude = np.abs(values)
+    nonzero = magnitude > 0
+    exponent = np.zeros(len(values), dtype=np.int64)
+    exponent[nonzero] = np.floor(np.log10(magnitude[nonzero])).astype(np.int64)
+    decimals = significant_digits - 1
+    mantissa = np.rint(magnitude * 10.0 ** (decimals - exponent)).astype(np.int64)
+    carried = mantissa >= 10**significant_digits  # e.g. 9.999999 rounded up to 10.00000
+    mantissa[carried] = np.rint(mantissa[carried] / 10).astype(np.int64)
+    exponent[carried] += 1
+    mantissa_field = _signed_field(mantissa, (values < 0) & (mantissa > 0), decimals)
+    exponent_digits = max(2, int(_count_digits(np.abs(exponent)).max(initial=1)))
+    exponent_field = _digits_field(
+        np.abs(exponent), np.full(len(values), exponent_digits), exponent_digits
+    )
+    marker = np.full((len(values), 2), ord("E"), dtype=np.uint8)
+    marker[:, 1] = np.where(exponent < 0, ord("-"), ord("+"))
+    return np.hstack([mantissa_field, marker, exponent_field])
+
+
+def _date_field(dates):
+    """Format dates as MM/DD/YYYY into a (rows, 10) block."""
+    try:
+        days = np.asarray(dates).astype("datetime64[D]")
+    except (TypeError, ValueError):
+        raise ValueError("Dates must be datetime64 values, date objects or ISO date strings.")
+    if days.ndim != 1:
+        raise ValueError("Dates must be a 1-D array.")
+    if np.isnat(days).any():
+        raise ValueError("Dates contain missing values.")
+    months = days.astype("datetime64[M]")
+    years = months.astype("datetime64[Y]").astype(np.int64) + 1970
+    if len(days) and (years.min() < 1 or years.max() > 9999):
+        raise ValueError("Dates must fall within years 1 to 9999.")
+    field = np.full((len(days), _DATE_WIDTH), ord("/"), dtype=np.uint8)
+    two = np.full(len(days), 2)
+    field[:, 0:2] = _digits_field(months.astype(np.int64) % 12 + 1, two, 2)
+    field[:, 3:5] = _digits_field((days - months).astype(np.int64) + 1, two, 2)
+    field[:, 6:10] = _digits_field(years, np.full(len(days), 4), 4)
+    return field
+
+
+def _join_fields(fields):
+    """Join fields with ', ' separators into one contiguous block with a NUL ending each row."""
+    n_rows = len(fields[0])
+    parts = [fields[0]]
+    for field in fields[1:]:
+        parts.append(np.broadcast_to(_SEPARATOR, (n_rows, len(_SEPARATOR))))
+        parts.append(field)
+    parts.append(np.zeros((n_rows, 1), dtype=np.uint8))
+    return np.ascontiguousarray(np.hstack(parts))
+
+
+def _prepare_fields(fields):
+    rows = _join_fields(fields)
+    return PreparedBuffer(_hash(b"rows", str(rows.shape).encode(), memoryview(rows)), rows)
+
+
+def format_weather_arrays(dates, tmax, tmin, tavg, wind, rain, daylight=None, decimals=2):
+    """Format daily weather series held as arrays into a PreparedBuffer for BeePop+.
+
+    All rows are formatted in one vectorized pass, without temporary files or per-line Python
+    objects.
+
+    Args:
+        dates: Dates of the rows as datetime64 values, date objects or ISO (YYYY-MM-DD) strings.
+        tmax: Maximum temperature (C) of each day.
+        tmin: Minimum temperature (C) of each day.
+        tavg: Average temperature (C) of each day.
+        wind: Windspeed (m/s) of each day.
+        rain: Rainfall (mm) of each day.
+        daylight (optional): Hours of daylight of each day. Defaults to None, in which case
+            BeePop+ calculates day length from the latitude.
+        decimals (int, optional): Decimals written for each value. Defaults to 2, as in the
+            example weather files.
+
+    Raises:
+        ValueError: If the series differ in length or contain missing or non-finite values.
+
+    Returns:
+        PreparedBuffer: The formatted weather.
+    """
+    fields = [_date_field(dates)]
+    series = [("tmax", tmax), ("tmin", tmin), ("tavg", tavg), ("wind", wind), ("rain", rain)]
+    if daylight is not None:
+        series.append(("daylight", daylight))
+    for name, values in series:
+        fields.append(_fixed_field(_as_column(values, name, len(fields[0])), decimals))
+    return _prepare_fields(fields)
+
+
+def format_residue_arrays(dates, nectar, pollen, significant_digits=6):
+    """Format daily pesticide residue series held as arrays into a PreparedBuffer for BeePop+.
+
+    Concentrations are written in scientific notation, e.g. 9.00000E-08, in one vectorized pass.
+
+    Args:
+        dates: Dates of the rows as datetime64 values, date objects or ISO (YYYY-MM-DD) strings.
+        nectar: Concentration in nectar (g A.I. / g) of each day.
+        pollen: Concentration in pollen (g A.I. / g) of each day.
+        significant_digits (int, optional): Significant digits written for each value.
+            Defaults to 6.
+
+    Raises:
+        ValueError: If the series differ in length or contain missing or non-finite values.
+
+    Returns:
+        PreparedBuffer: The formatted residues.
+    """
+    fields = [_date_field(dates)]
+    for name, values in (("nectar", nectar), ("pollen", pollen)):
+        column = _as_column(values, name, len(fields[0]))
+        fields.append(_scientific_field(column, significant_digits))
+    return _prepare_fields(fields)
+
+
+def _format_value(value):
+    """Format one field of an in-memory weather or residue row as BeePop+ expects it."""
+    if isinstance(value, np.datetime64):
+        value = value.astype("datetime64[D]").item()
+    if isinstance(value, (datetime.date, datetime.datetime)) or hasattr(value, "strftime"):
+        return value.strftime("%m/%d/%Y")
+    if isinstance(value, bytes):
+        return value.decode("utf-8")
+    return str(value)
+
+
+def _format_rows(rows):
+    return [", ".join(_format_value(v) for v in row).encode("utf-8") for row in rows]
+
+
+def _hash(*parts):
+    h = hashlib.sha1()
+    for part in parts:
+        h.update(part)
+    return h.hexdigest()
+
+
+def is_path(source):
+    """True if an input is given as a file path rather than in memory."""
+    return isinstance(source, (str, os.PathLike))
+
+
+def input_key_and_lines(source):
+    """Return a content hash for a weather or residue input and a function that encodes its lines.
+
+    Args:
+        source: Path to a csv/txt file, a pandas DataFrame or 2-D NumPy array with one row per
+            line, or a list of str or bytes lines.
+
+    Raises:
+        TypeError: If the source is not one of the supported types.
+
+    Returns:
+        tuple: (key, build) where build() returns the encoded lines as a list of bytes.
+    """
+    if is_path(source):
+        with open(source, "rb") as f:
+            content = f.read()
+
+        def build():
+            with open(source) as f:
+                return [line.encode("utf-8") for line in f.readlines()]
+
+        return _hash(b"file", content), build
+    if hasattr(source, "itertuples"):  # pandas DataFrame
+        rows = list(source.itertuples(index=False, name=None))
+        lines = _format_rows(rows)
+        return _hash(b"lines", b"\n".join(lines)), lambda: lines
+    if isinstance(source, np.ndarray):
+        if source.ndim != 2:
+            raise TypeError("Array inputs must be 2-D with one row per line.")
+        if source.dtype.kind in "biufSUM":  # fixed-size values: hash the raw buffer
+            key = _hash(
+                b"array",
+                str(source.dtype).encode(),
+                str(source.shape).encode(),
+                np.ascontiguousarray(source).tobytes(),
+            )
+            return key, lambda: _format_rows(source.tolist())
+        lines = _format_rows(source.tolist())
+        return _hash(b"lines", b"\n".join(lines)), lambda: lines
+    if isinstance(source, (list, tuple)):
+        lines = [line if isinstance(line, bytes) else str(line).encode("utf-8") for line in source]
+        return _hash(b"lines", b"\n".join(lines)), lambda: lines
+    raise TypeError(
+        "Inputs must be a file path, DataFrame, 2-D NumPy array or list of lines, not {}".format(
+            type(source).__name__
+        )
+    )
+
+
+class InputCache:
+    """Least-recently-used cache of PreparedLines keyed by input content.
+
+    File paths are remembered by (path, modification time, size), so an unchanged file is not
+    even re-read when it is requested again.
+    """
+
+    def __init__(self, max_entries=64, max_bytes=256 * 1024**2):
+        """
+        Args:
+            max_entries (int, optional): Maximum number of prepared inputs kept. Defaults to 64.
+            max_bytes (int, optional): Approximate memory cap for the prepared inputs.
+                Defaults to 256 MB.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._file_keys = dict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, source):
+        """Return the PreparedLines for an input, preparing and caching it if needed.
+
+        Args:
+            source: Path to a csv/txt file, a pandas DataFrame or 2-D NumPy array with one row per
+                line, a list of str or bytes lines, or an already prepared input (e.g. one
+                received from another process).
+
+        Returns:
+            PreparedLines or PreparedBuffer: The prepared input.
+        """
+        if isinstance(source, (PreparedLines, PreparedBuffer)):
+            return self._add(source)
+        file_id = None
+        key = None
+        if is_path(source):
+            stat = os.stat(source)
+            file_id = (os.path.abspath(source), stat.st_mtime_ns, stat.st_size)
+            key = self._file_keys.get(file_id)
+        with self._lock:
+            if key is not None and key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+        key, build = input_key_and_lines(source)
+        if file_id is not None:
+            self._file_keys[file_id] = key
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+        return self._add(PreparedLines(key, build()))
+
+    def _add(self, prepared):
+        """Cache a prepared input, or return the cached one with the same content."""
+        with self._lock:
+            cached = self._entries.get(prepared.key)
+            if cached is not None:
+                self._entries.move_to_end(prepared.key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+            self._entries[prepared.key] = prepared
+            self.nbytes += prepared.nbytes
+            self._evict()
+        return prepared
+
+    def _evict(self):
+        while self._entries and (
+            len(self._entries) > self.max_entries or self.nbytes > self.max_bytes
+        ):
+            _, prepared = self._entries.popitem(last=False)
+            self.nbytes -= prepared.nbytes
+
+    def clear(self):
+        """Remove all prepared inputs from the cache."""
+        with self._lock:
+            self._entries.clear()
+            self._file_keys.clear()
+            self.nbytes = 0
+
+
+input_cache = InputCache()  # shared by all BeePopModel objects in the process
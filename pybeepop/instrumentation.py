@@ -0,0 +1,164 @@
+"""
+pybeepop - timing and size counters for each phase of a BeePop+ run
+
+An Instrumentation object attached to a BeePopModel records the wall time of each phase
+(parameter marshalling, weather and residue loading, the simulation itself, fetching and
+decoding results), the bytes passed to and from the library, and the number of result lines.
+Phases timed between two runs, such as setting parameters or loading weather, are counted
+towards the next run. Models without instrumentation skip all of this.
+"""
+
+import time
+import threading
+import contextlib
+
+_NOT_TIMED = contextlib.nullcontext()  # shared no-op context used when instrumentation is off
+
+
+class RunStats:
+    """Measurements of a single BeePop+ run.
+
+    Attributes:
+        phases (dict): Wall time in seconds of each phase, e.g. "simulate" or "decode".
+        bytes (dict): Bytes passed to or from the library, by phase.
+        counts (dict): Other counts, e.g. "parameters_sent" or "result_lines".
+        cached (bool): True if the results came from a result cache.
+    """
+
+    def __init__(self):
+        self.phases = dict()
+        self.bytes = dict()
+        self.counts = dict()
+        self.cached = False
+
+    def __repr__(self):
+        return "RunStats(total_time={:.6f}, phases={})".format(self.total_time, self.phases)
+
+    @property
+    def total_time(self):
+        """Sum of the phase times in seconds."""
+        return sum(self.phases.values())
+
+    def to_dict(self):
+        """Return the measurements as a dict of plain values."""
+        return {
+            "total_time": self.total_time,
+            "phases": dict(self.phases),
+            "bytes": dict(self.bytes),
+            "counts": dict(self.counts),
+            "cached": self.cached,
+        }
+
+    @classmethod
+    def from_dict(cls, values):
+        """Rebuild a RunStats from the output of to_dict, e.g. one sent from a worker process."""
+        stats = cls()
+        stats.phases.update(values["phases"])
+        stats.bytes.update(values["bytes"])
+        stats.counts.update(values["counts"])
+        stats.cached = values["cached"]
+        return stats
+
+
+class Instrumentation:
+    """Collects RunStats for each run of a model and keeps running totals.
+
+    Example:
+        beepop.enable_instrumentation(callbacks=[lambda stats: print(stats.to_dict())])
+        beepop.run_model()
+        print(beepop.last_run_stats())
+    """
+
+    def __init__(self, callbacks=None):
+        """
+        Args:
+            callbacks (list, optional): Functions called with the RunStats of each completed
+                run, e.g. to export them to a metrics system. Defaults to None.
+        """
+        self.callbacks = list(callbacks or [])
+        self.last_run = None
+        self.runs = 0
+        self.cached_runs = 0
+        self.phases = dict()
+        self.bytes = dict()
+        self.counts = dict()
+        self._current = RunStats()
+        self._lock = threading.Lock()
+
+    def add_callback(self, callback):
+        """Call a function with the RunStats of each completed run."""
+        self.callbacks.append(callback)
+
+    def remove_callback(self, callback):
+        """Stop calling a function added with add_callback."""
+        self.callbacks.remove(callback)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Context manager that adds the wall time of its block to a phase of the current run."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            phases = self._current.phases
+            phases[name] = phases.get(name, 0.0) + time.perf_counter() - start
+
+    def add_bytes(self, name, n):
+        """Add to the bytes passed to or from the library in a phase of the current run."""
+        self._current.bytes[name] = self._current.bytes.get(name, 0) + n
+
+    def count(self, name, n=1):
+        """Add to a count of the current run."""
+        self._current.counts[name] = self._current.counts.get(name, 0) + n
+
+    def mark_cached(self):
+        """Mark the current run as answered from a result cache."""
+        self._current.cached = True
+
+    def finish_run(self):
+        """Close the current run, add it to the totals and call the callbacks.
+
+        Returns:
+            RunStats: The measurements of the run.
+        """
+        stats, self._current = self._current, RunStats()
+        self.record(stats)
+        return stats
+
+    def record(self, stats):
+        """Add a completed run's RunStats to the totals and call the callbacks."""
+        with self._lock:
+            self.last_run = stats
+            self.runs += 1
+            self.cached_runs += int(stats.cached)
+            for totals, values in (
+                (self.phases, stats.phases),
+                (self.bytes, stats.bytes),
+                (self.counts, stats.counts),
+            ):
+                for name, value in values.items():
+                    totals[name] = totals.get(name, 0) + value
+        for callback in self.callbacks:
+            callback(stats)
+
+    def totals(self):
+        """Return the cumulative measurements of all completed runs as a dict."""
+        with self._lock:
+            return {
+                "runs": self.runs,
+                "cached_runs": self.cached_runs,
+                "total_time": sum(self.phases.values()),
+                "phases": dict(self.phases),
+                "bytes": dict(self.bytes),
+                "counts": dict(self.counts),
+            }
+
+    def reset(self):
+        """Clear the totals and the last run."""
+        with self._lock:
+            self.last_run = None
+            self.runs = 0
+            self.cached_runs = 0
+            self.phases.clear()
+            self.bytes.clear()
+            self.counts.clear()
@@ -0,0 +1,227 @@
+"""
+pybeepop - index of the exposed BeePop+ parameters
+
+Parameter names, types and bounds come from data/BeePop_exposed_parameters.csv. The file is
+read once per process into a case-insensitive index that every BeePopModel shares.
+"""
+
+import os
+import re
+import csv
+import warnings
+import functools
+
+PARAMETER_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "data/BeePop_exposed_parameters.csv"
+)
+
+_date_pattern = re.compile(r"^\s*(\d{1,2})/(\d{1,2})/(\d{1,4})\s*$")
+_true_values = ("true", "1")
+_false_values = ("false", "0")
+
+
+def _bound(text):
+    """Convert a Min/Max cell of the parameter file to a float, or None if it is not a number."""
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+class ParameterSpec:
+    """Definition of one exposed BeePop+ parameter.
+
+    Attributes:
+        name (str): Parameter name as written in the parameter file.
+        type (str): One of "Integer", "Float", "Boolean", "Date" or "String".
+        min: Lower bound (float for numbers, (year, month, day) for dates), or None.
+        max: Upper bound (float for numbers, (year, month, day) for dates), or None.
+        description (str): Description of the parameter.
+    """
+
+    def __init__(self, name, type, min=None, max=None, description=""):
+        self.name = name
+        self.type = type
+        self.min = min
+        self.max = max
+        self.description = description
+
+    def __repr__(self):
+        return "ParameterSpec({!r}, {!r}, min={!r}, max={!r})".format(
+            self.name, self.type, self.min, self.max
+        )
+
+    @property
+    def is_numeric(self):
+        """True for Integer and Float parameters."""
+        return self.type in ("Integer", "Float")
+
+    def format(self, value):
+        """Return the string BeePop+ expects for a value of this parameter.
+
+        Dates given as date or datetime objects are written as MM/DD/YYYY.
+        """
+        if self.type == "Date" and hasattr(value, "strftime"):
+            return value.strftime("%m/%d/%Y")
+        return str(value)
+
+    def normalize(self, value):
+        """Return a canonical string for a value, so that equal values of different types or
+        spellings (e.g. 10000, "10000" and 10000.0, or True and "TRUE") compare equal."""
+        text = self.format(value).strip()
+        try:
+            if self.is_numeric:
+                return repr(float(text))
+            if self.type == "Boolean":
+                return "true" if text.lower() in _true_values else "false"
+            if self.type == "Date":
+                month, day, year = (int(x) for x in _date_pattern.match(text).groups())
+                return "{:04d}-{:02d}-{:02d}".format(year, month, day)
+        except (ValueError, AttributeError):
+            pass
+        return text
+
+    def validate(self, value):
+        """Check a value against the parameter's type and bounds.
+
+        The Min/Max columns of the parameter file describe the biologically sensible range, and
+        values outside it are still accepted by BeePop+ (e.g. a large LD50 to switch off
+        toxicity), so they only raise a warning.
+
+        Raises:
+            ValueError: If the value does not convert to the parameter's type.
+        """
+        text = self.format(value).strip()
+        if self.is_numeric:
+            try:
+                number = float(text)
+            except ValueError:
+                raise ValueError(
+                    "{} must be a number ({}), not {!r}.".format(self.name, self.type, value)
+                )
+            if (self.min is not None and number < self.min) or (
+                self.max is not None and number > self.max
+            ):
+                warnings.warn(
+                    "{}={} is outside the expected range [{}, {}].".format(
+                        self.name, text, self.min, self.max
+                    )
+                )
+        elif self.type == "Boolean":
+            if text.lower() not in _true_values + _false_values:
+                raise ValueError("{} must be true or false, not {!r}.".format(self.name, value))
+        elif self.type == "Date":
+            match = _date_pattern.match(text)
+            if match is None:
+                raise ValueError(
+                    "{} must be a date as MM/DD/YYYY, not {!r}.".format(self.name, value)
+                )
+            month, day, year = (int(x) for x in match.groups())
+            if not (1 <= month <= 12 and 1 <= day <= 31):
+                raise ValueError("{} is not a valid date: {!r}.".format(self.name, value))
+            if (self.min is not None and (year, month, day) < self.min) or (
+                self.max is not None and (year, month, day) > self.max
+            ):
+                warnings.warn(
+                    "{} is outside the expected date range: {!r}.".format(self.name, value)
+                )
+
+
+def _date_bound(text):
+    match = _date_pattern.match(text)
+    if match is None:
+        return None
+    month, day, year = (int(x) for x in match.groups())
+    return (year, month, day)
+
+
+@functools.lru_cache(maxsize=None)
+def parameter_index():
+    """Return the exposed BeePop+ parameters as a dict of lowercase name: ParameterSpec.
+
+    The parameter file is read on first use and the index is shared for the rest of the process.
+    """
+    index = dict()
+    with open(PARAMETER_FILE, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        next(reader)  # note line above the header
+        header = next(reader)
+        columns = dict((name, i) for i, name in enumerate(header))
+        for row in reader:
+            if not row or not row[0]:
+                continue
+            name = row[columns["Exposed Variable Name"]]
+            type = row[columns["Type"]]
+            bound = _date_bound if type == "Date" else _bound
+            index[name.lower()] = ParameterSpec(
+                name,
+                type,
+                min=bound(row[columns["Min"]]),
+                max=bound(row[columns["Max"]]),
+                description=row[columns["Interpretation"]],
+            )
+    return index
+
+
+@functools.lru_cache(maxsize=None)
+def parameter_names():
+    """Return the names of the exposed BeePop+ parameters as a tuple shared for the process."""
+    return tuple(spec.name for spec in parameter_index().values())
+
+
+def get_parameter_spec(name):
+    """Look up an exposed BeePop+ parameter by name, ignoring case.
+
+    Raises:
+        ValueError: If the name is not a valid BeePop+ parameter.
+
+    Returns:
+        ParameterSpec: The parameter's definition.
+    """
+    spec = parameter_index().get(name.strip().lower())
+    if spec is None:
+        raise ValueError("{} is not a valid parameter.".format(name.lower()))
+    return spec
+
+
+def read_parameter_file(path):
+    """Read a text file of BeePop+ parameters with one "name=value" per line.
+
+    Whitespace around names and values is ignored, as are blank lines and lines starting with
+    "#". Values may themselves contain "=".
+
+    Raises:
+        ValueError: If a line is not of the form name=value.
+
+    Returns:
+        dict: Parameter values as strings, by name, in the order of the file.
+    """
+    parameters = dict()
+    with open(path, encoding="utf-8-sig") as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            name, separator, value = line.partition("=")
+            if not separator or not name.strip():
+                raise ValueError(
+                    "Line {} of {} is not of the form name=value: {!r}".format(number, path, line)
+                )
+            parameters[name.strip()] = value.strip()
+    return parameters
+
+
+def validate_parameter(name, value):
+    """Check that a parameter name is valid and its value fits the parameter's type and bounds.
+
+    Values outside the parameter's Min/Max range raise a warning rather than an error.
+
+    Raises:
+        ValueError: If the name is not a valid parameter or the value has the wrong type.
+
+    Returns:
+        ParameterSpec: The parameter's definition.
+    """
+    spec = get_parameter_spec(name)
+    spec.validate(value)
+    return spec
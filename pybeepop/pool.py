@@ -0,0 +1,186 @@
+"""
+pybeepop - pool of isolated BeePop+ instances for use from threads
+
+Each pooled BeePopModel runs on its own private copy of the shared library, so the instances
+do not share parameters, inputs or results. ctypes releases the GIL while a simulation runs,
+which lets a thread pool run several simulations at once inside one process. Instances are
+created on demand up to the pool size and reused afterwards.
+"""
+
+import os
+import queue
+import threading
+import contextlib
+import concurrent.futures
+from .tools import BeePopModel
+from .batch import ScenarioResult, _enumerate_scenarios
+from .pybeepop import find_library
+
+
+class LibraryPool:
+    """Thread-safe pool of isolated BeePopModel instances.
+
+    Example:
+        with LibraryPool(size=4) as pool:
+            output = pool.run_model({"ICWorkerAdults": 20000}, weather_file)
+    """
+
+    def __init__(self, lib_file=None, size=None, verbose=False):
+        """
+        Args:
+            lib_file (str, optional): Path to the BeePop+ shared library. Defaults to the
+                library bundled for this platform.
+            size (int, optional): Maximum number of instances. Defaults to the CPU count.
+            verbose (bool, optional): Print debugging messages? Defaults to False.
+
+        Raises:
+            FileNotFoundError: If the library does not exist at the path.
+        """
+        self.lib_file = find_library(lib_file, verbose=verbose)
+        self.size = size or os.cpu_count() or 1
+        self.verbose = verbose
+        self._idle = queue.LifoQueue()  # reuse the most recently used, warmest instance
+        self._models = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self):
+        return len(self._models)
+
+    def acquire(self, timeout=None):
+        """Take an instance from the pool, creating one if the pool is not yet full.
+
+        Args:
+            timeout (float, optional): Seconds to wait for an instance to be released if all
+                are in use. Defaults to waiting indefinitely.
+
+        Raises:
+            RuntimeError: If the pool has been closed.
+            TimeoutError: If no instance became available within the timeout.
+
+        Returns:
+            BeePopModel: An isolated model. Return it with release() when done.
+        """
+        if self._closed:
+            raise RuntimeError("The pool has been closed.")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = len(self._models) < self.size
+            if create:
+                self._models.append(None)  # reserve the slot while the library loads
+        if create:
+            try:
+                model = BeePopModel(self.lib_file, verbose=self.verbose, isolated=True)
+            except Exception:
+                with self._lock:
+                    self._models.remove(None)
+                raise
+            with self._lock:
+                self._models[self._models.index(None)] = model
+            return model
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError("No BeePop+ instance became available.") from None
+
+    def release(self, model):
+        """Return an instance taken with acquire() to the pool."""
+        if self._closed:
+            model.close_library()
+            with self._lock:
+                self._models.remove(model)
+        else:
+            self._idle.put(model)
+
+    @contextlib.contextmanager
+    def model(self, timeout=None):
+        """Context manager that acquires an instance and releases it on exit."""
+        model = self.acquire(timeout=timeout)
+        try:
+            yield model
+        finally:
+            self.release(model)
+
+    def run_model(self, parameters=None, weather_file=None, residue_file=None, timeout=None):
+        """Run one simulation on a pooled instance.
+
+        The instance's parameters are reset first, so nothing carries over from earlier runs.
+        Weather and residue inputs already loaded on the instance are not resent.
+
+        Args:
+            parameters (dict, optional): BeePop+ parameters for the run. Defaults to None.
+            weather_file (optional): Path to a weather file or in-memory weather rows.
+            residue_file (optional): Path to a residue file or in-memory residue rows.
+                Defaults to None.
+            timeout (float, optional): Seconds to wait for a free instance. Defaults to
+                waiting indefinitely.
+
+        Raises:
+            RuntimeError: If no weather is given.
+
+        Returns:
+            DataFrame: The daily outputs of the run.
+        """
+        if weather_file is None:
+            raise RuntimeError("Weather must be set before running BeePop+!")
+        with self.model(timeout=timeout) as model:
+            if residue_file is None:
+                model.contam_file = None  # reset_parameters then disables residue input
+            model.reset_parameters()
+            model.load_weather(weather_file)
+            if residue_file is not None:
+                model.load_contam_file(residue_file)
+            if parameters:
+                model.set_parameters(parameters)
+            return model.run_beepop()
+
+    def map(self, parameter_sets, weather_file, residue_file=None, parameters=None):
+        """Run many scenarios on the pool's instances from a thread pool.
+
+        Args:
+            parameter_sets (list or dict): Parameter dicts, one per scenario. If a dict is given,
+                its keys are used as scenario ids; otherwise the scenario id is the list index.
+            weather_file: Path to a weather file or in-memory weather rows.
+            residue_file (optional): Path to a residue file or in-memory residue rows.
+                Defaults to None.
+            parameters (dict, optional): Base parameters applied before each scenario's own
+                parameters. Defaults to None.
+
+        Returns:
+            list: A ScenarioResult for each scenario, in input order.
+        """
+        scenarios = _enumerate_scenarios(parameter_sets)
+
+        def run(scenario):
+            scenario_id, scenario_parameters = scenario
+            combined = dict(parameters or {})
+            combined.update(scenario_parameters or {})
+            try:
+                output = self.run_model(combined, weather_file, residue_file)
+            except Exception as e:
+                return ScenarioResult(scenario_id, error="{}: {}".format(type(e).__name__, e))
+            return ScenarioResult(scenario_id, output=output)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.size) as executor:
+            return list(executor.map(run, scenarios))
+
+    def close(self):
+        """Unload every instance in the pool. Instances still in use are unloaded when returned."""
+        self._closed = True
+        while True:
+            try:
+                model = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            model.close_library()
+            with self._lock:
+                self._models.remove(model)
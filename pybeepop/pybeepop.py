@@ -6,11 +6,76 @@ code by Jeff Minucci
 
 import os
 import platform
-import pandas as pd
 from .tools import BeePopModel
+from .executors import ProcessExecutor
+from .inputs import is_path
+from .instrumentation import RunStats
 import json
 
 
+def find_library(lib_file=None, verbose=False):
+    """Return the path of the BeePop+ shared library to load.
+
+    Args:
+        lib_file (str, optional): Path to a BeePop+ shared library (.dll or .so). Defaults to the
+            pre-compiled library bundled for this platform.
+        verbose (bool, optional): Print additional debugging statements? Defaults to False.
+
+    Raises:
+        FileNotFoundError: If the library does not exist at the path.
+        NotImplementedError: If run on a platform that is not 64-bit Windows or Linux.
+    """
+    parent = os.path.dirname(os.path.abspath(__file__))
+    system = platform.system()
+    if lib_file is None:  # detect OS and architecture and use pre-compiled BeePop+ if possible
+        if system == "Windows":
+            if platform.architecture()[0] == "32bit":
+                raise NotImplementedError(
+                    "Windows x86 (32-bit) is not supported by BeePop+. Please run on an x64 platform."
+                )
+            else:
+                lib_file = os.path.join(parent, "lib/beepop_win64.dll")
+        elif system == "Linux":
+            lib_file = os.path.join(parent, "lib/beepop_linux.so")
+            if verbose:
+                print(
+                    """
+                    Running in Linux mode. Trying manylinux/musllinux version.
+                    If you encounter errors, you may need to compile your own version of BeePop+ from source and pass the path to your
+                    .so file with the lib_file option. Currently, only 64-bit architecture is supported.
+                    See the pybeepop README for instructions.
+                    """
+                )
+        else:
+            raise NotImplementedError("BeePop+ only supports Windows and Linux.")
+    if not os.path.isfile(lib_file):
+        raise FileNotFoundError(
+            """
+            BeePop+ shared object library does not exist or is not compatible with your operating system. 
+            You may need to compile BeePop+ from source (see https://github.com/USEPA/pybeepop/blob/main/README.md for more info.)
+            Currently, only 64-bit architecture is supported.
+            """
+        )
+    return lib_file
+
+
+def _record_stats(results, instrumentation):
+    """Add the stats of each batch result to an Instrumentation as the results arrive."""
+    for result in results:
+        if result.stats is not None:
+            instrumentation.record(RunStats.from_dict(result.stats))
+        yield result
+
+
+def _append_to_store(results, store):
+    """Append each successful output to a ResultStore and yield the results without outputs."""
+    for result in results:
+        if result.ok:
+            store.append(result.scenario_id, result.output)
+            result.output = None
+        yield result
+
+
 class PyBeePop:
     """Wrapper for the BeePop+ honey bee colony simulation model"""
 
@@ -21,18 +86,28 @@ class PyBeePop:
         weather_file=None,
         residue_file=None,
         verbose=False,
+        isolated=False,
+        result_cache=None,
     ):
         """Create a PyBeePop object connected to a BeePop+ shared library.
 
         Args:
             lib_file (str, optional): Path to the BeePop+ shared library (.dll or .so).
-            parameters_file (str, optional): Path to a txt file of BeePop+ parameters where each line specifies
+            parameter_file (str, optional): Path to a txt file of BeePop+ parameters where each line specifies
                 parameter=value. Defaults to None.
             weather_file (str, optional): Path to a .csv or comma separated .txt file containing weather data.
                 For formatting info see docs/weather_readme.txt. Defaults to None.
             residue_file (str, optional): Path to a .csv or comma separated .txt file containing pesticide residue data.
                 Defaults to None.
             verbose (bool, optional): Print additional debugging statements? Defaults to False.
+            isolated (bool, optional): Load a private copy of the BeePop+ library, so that this
+                object does not share parameters, weather or results with other PyBeePop objects
+                in the same process. Isolated objects can run simulations concurrently from
+                separate threads. Defaults to False.
+            result_cache (ResultCache, optional): Cache that remembers simulation results, so that
+                repeating a scenario (same library version, parameters, weather and residues)
+                returns the earlier results without running BeePop+. A cache can be shared by
+                several objects. Defaults to None.
 
         Raises:
             FileNotFoundError: If a provided file does not exist at the specified path.
@@ -42,52 +117,22 @@ class PyBeePop:
         self.parent = os.path.dirname(os.path.abspath(__file__))
         self.platform = platform.system()
         self.verbose = verbose
-        if lib_file is None:  # detect OS and architecture and use pre-compiled BeePop+ if possible
-            if self.platform == "Windows":
-                if platform.architecture()[0] == "32bit":
-                    raise NotImplementedError(
-                        "Windows x86 (32-bit) is not supported by BeePop+. Please run on an x64 platform."
-                    )
-                else:
-                    lib_file = os.path.join(self.parent, "lib/beepop_win64.dll")
-            elif self.platform == "Linux":
-                lib_file = os.path.join(self.parent, "lib/beepop_linux.so")
-                if self.verbose:
-                    print(
-                        """
-                        Running in Linux mode. Trying manylinux/musllinux version.
-                        If you encounter errors, you may need to compile your own version of BeePop+ from source and pass the path to your
-                        .so file with the lib_file option. Currently, only 64-bit architecture is supported.
-                        See the pybeepop README for instructions.
-                        """
-                    )
-            else:
-                raise NotImplementedError("BeePop+ only supports Windows and Linux.")
-        if not os.path.isfile(lib_file):
-            raise FileNotFoundError(
-                """
-                BeePop+ shared object library does not exist or is not compatible with your operating system. 
-                You may need to compile BeePop+ from source (see https://github.com/USEPA/pybeepop/blob/main/README.md for more info.)
-                Currently, only 64-bit architecture is supported.
-                """
-            )
+        lib_file = find_library(lib_file, verbose=self.verbose)
         self.lib_file = lib_file
-        self.beepop = BeePopModel(self.lib_file, verbose=self.verbose)
+        self.beepop = BeePopModel(
+            self.lib_file, verbose=self.verbose, isolated=isolated, result_cache=result_cache
+        )
         self.parameters = None
+        self.parameter_file = None
+        self.weather_file = None
+        self.residue_file = None
+        self.output = None
         if parameter_file is not None:
-            self.load_parameter_file(self.parameter_file)
-        else:
-            self.parameter_file = None
+            self.load_parameter_file(parameter_file)
         if weather_file is not None:
             self.load_weather(weather_file)
-        else:
-            self.weather_file = None
         if residue_file is not None:
-            self.load_residue_file(self.residue_file)
-        else:
-            self.residue_file = None
-        # self.new_features = new_features # not being used?
-        self.output = None
+            self.load_residue_file(residue_file)
 
     def set_parameters(self, parameters):
         """Set BeePop+ parameters based on a dictionary {parameter: value}.
@@ -97,12 +142,24 @@ class PyBeePop:
 
         Raises:
             TypeError: If parameters is not a dict.
-            ValueError: If the parameter is not a valid BeePop+ parameter listed in the docs.
+            ValueError: If the parameter is not a valid BeePop+ parameter listed in the docs, or its
+                value does not match the parameter's type or allowed range.
         """
         if (parameters is not None) and (not isinstance(parameters, dict)):
             raise TypeError("parameters must be a named dictionary of BeePop+ parameters")
         self.parameters = self.beepop.set_parameters(parameters)
 
+    def reset_parameters(self):
+        """Return all BeePop+ parameters to their default values.
+
+        The loaded weather and residue files are kept, so the model can be run again right away,
+        and the simulation dates return to the span of the weather, as after loading it.
+        This is much cheaper than creating a new PyBeePop object.
+        """
+        self.beepop.reset_parameters()
+        self.parameters = None
+        self.parameter_file = None
+
     def get_parameters(self):
         """Return all parameters that have been set by the user."""
         return self.beepop.get_parameters()
@@ -112,17 +169,49 @@ class PyBeePop:
         Date(MM/DD/YY), Max Temp (C), Min Temp (C), Avg Temp (C), Windspeed (m/s), Rainfall (mm),
         Hours of daylight (optional).
 
+        The same rows can also be given in memory as a DataFrame, a 2-D NumPy array or a list of
+        lines. Prepared weather is cached by content, so loading weather that has been loaded
+        before is nearly free.
+
         Args:
-            weather_file (_type_): Path to the weather file (csv or txt).
+            weather_file (_type_): Path to the weather file (csv or txt), or the weather rows as a
+                DataFrame, 2-D NumPy array or list of lines.
 
         Raises:
             FileNotFoundError: If the provided file does not exist at the specified path.
         """
-        if not os.path.isfile(weather_file):
+        if is_path(weather_file) and not os.path.isfile(weather_file):
             raise FileNotFoundError("Weather file does not exist at path: {}!".format(weather_file))
         self.weather_file = weather_file
         self.beepop.load_weather(self.weather_file)
 
+    def load_weather_array(self, dates, tmax, tmin, tavg, wind, rain, daylight=None, decimals=2):
+        """Load daily weather held as NumPy arrays (or other sequences), e.g. one cell of a
+        gridded climate dataset, without writing a weather file.
+
+        All rows are formatted in one vectorized pass into a single contiguous buffer that is
+        handed to BeePop+ directly. The formatted weather is cached like a file and is used by
+        run_batch when no other weather file is given.
+
+        Args:
+            dates: Dates as datetime64 values, date objects or ISO (YYYY-MM-DD) strings.
+            tmax: Maximum temperature (C) of each day.
+            tmin: Minimum temperature (C) of each day.
+            tavg: Average temperature (C) of each day.
+            wind: Windspeed (m/s) of each day.
+            rain: Rainfall (mm) of each day.
+            daylight (optional): Hours of daylight of each day. Defaults to None, in which
+                case BeePop+ calculates day length from the latitude.
+            decimals (int, optional): Decimals passed to BeePop+ for each value. Defaults to 2.
+
+        Raises:
+            ValueError: If the series differ in length or contain missing or non-finite values.
+        """
+        self.beepop.load_weather_array(
+            dates, tmax, tmin, tavg, wind, rain, daylight=daylight, decimals=decimals
+        )
+        self.weather_file = self.beepop.weather_file
+
     def load_parameter_file(self, parameter_file):
         """Load a .txt file of parameter values to set. Each row of the file is a string with the
         format 'paramter=value'.
@@ -141,42 +230,210 @@ class PyBeePop:
                 "Paramter file does not exist at path: {}!".format(parameter_file)
             )
         self.parameter_file = parameter_file
-        self.beepop.load_input_file(self.parameter_file)
+        self.parameters = self.beepop.load_input_file(self.parameter_file)
 
     def load_residue_file(self, residue_file):
         """Load a .csv or comma delimited .txt file of pesticide residues in pollen/nectar.
             Each row should specify Date(MM/DD/YYYY), Concentration in nectar (g A.I. / g),
             Concentration in pollen (g A.I. / g). Values can be specified in scientific
-            notation, e.g. "9.00E-08".
+            notation, e.g. "9.00E-08". The same rows can also be given in memory as a DataFrame,
+            a 2-D NumPy array or a list of lines.
 
         Args:
-            residue_file (_type_): Path to the residue .csv or .txt file.
+            residue_file (_type_): Path to the residue .csv or .txt file, or the residue rows as a
+                DataFrame, 2-D NumPy array or list of lines.
 
         Raises:
             FileNotFoundError: If the provided file does not exist at the specified path.
         """
-        if not os.path.isfile(residue_file):
+        if is_path(residue_file) and not os.path.isfile(residue_file):
             raise FileNotFoundError("Residue file does not exist at path: {}!".format(residue_file))
         self.residue_file = residue_file
         self.beepop.load_contam_file(self.residue_file)
 
-    def run_model(self):
-        """_summary_
+    def load_residue_array(self, dates, nectar, pollen, significant_digits=6):
+        """Load daily pesticide residues held as NumPy arrays (or other sequences) without
+        writing a residue file.
+
+        Args:
+            dates: Dates as datetime64 values, date objects or ISO (YYYY-MM-DD) strings.
+            nectar: Concentration in nectar (g A.I. / g) of each day.
+            pollen: Concentration in pollen (g A.I. / g) of each day.
+            significant_digits (int, optional): Significant digits passed to BeePop+ for each
+                value. Defaults to 6.
+
+        Raises:
+            ValueError: If the series differ in length or contain missing or non-finite values.
+        """
+        self.beepop.load_contam_array(dates, nectar, pollen, significant_digits=significant_digits)
+        self.residue_file = self.beepop.contam_file
+
+    def run_model(self, columns=None, start=None, end=None, reducer=None):
+        """Run BeePop+ with the parameters, weather and residues set on this object.
+
+        The options below limit what is decoded from the run's output, so runs that only need
+        a few columns, a date window or a summary do less work and use less memory.
+
+        Args:
+            columns (list, optional): Output columns to return, e.g. ["Colony Size",
+                "Adult Workers"]. "Date" is always included. Defaults to None (all columns).
+            start (optional): First date of the output, as an MM/DD/YYYY string, a date or a
+                datetime64. The initial conditions row is dropped when a window is given.
+                Defaults to None.
+            end (optional): Last date of the output. Defaults to None.
+            reducer (callable, optional): Function that summarizes the run instead of returning
+                the daily table, e.g. a sensitivity.SummaryReducer. It is called with the decoded
+                results, which can be indexed by column name like a DataFrame, and its return
+                value is returned. Defaults to None.
 
         Raises:
             RuntimeError: If the weather file has not yet been set.
+            ValueError: If a column is not a BeePop+ output column.
 
         Returns:
-            DataFrame: A DataFrame of the model results for the BeePop+ run.
+            DataFrame: A DataFrame of the model results for the BeePop+ run, or the reducer's
+                summary of them.
         """
         # check to see if parameters have been supplied
         if (self.parameter_file is None) and (self.parameters is None):
             print("No parameters have been set. Running with defualt settings.")
         if self.weather_file is None:
             raise RuntimeError("Weather must be set before running BeePop+!")
-        self.output = self.beepop.run_beepop()
+        self.output = self.beepop.run_beepop(columns=columns, start=start, end=end, reducer=reducer)
         return self.output
 
+    def run_batch(
+        self,
+        parameter_sets,
+        weather_file=None,
+        residue_file=None,
+        n_workers=None,
+        chunksize=1,
+        stream=False,
+        reducer=None,
+        store=None,
+        columns=None,
+        start=None,
+        end=None,
+        executor=None,
+    ):
+        """Run many BeePop+ scenarios in parallel worker processes.
+
+        Each worker loads the shared library and the weather (and residue) file once, then
+        reuses them for all of its scenarios. Parameters set on this object are applied as a
+        base before each scenario's own parameters. By default the workers are processes on
+        this machine; pass an executor to run them elsewhere, e.g. an executors.SocketExecutor
+        to spread the batch over workers on several hosts.
+
+        Args:
+            parameter_sets (list or dict): Parameter dicts, one per scenario. If a dict is given,
+                its keys are used as scenario ids; otherwise the scenario id is the list index.
+            weather_file (str, optional): Path to the weather file, or in-memory weather rows.
+                Defaults to the weather loaded on this object.
+            residue_file (str, optional): Path to a residue file, or in-memory residue rows.
+                Defaults to the residues loaded on this object, if any.
+            n_workers (int, optional): Number of worker processes. Defaults to the CPU count.
+            chunksize (int, optional): Number of scenarios sent to a worker at a time.
+                Defaults to 1.
+            stream (bool, optional): Return a generator that yields results as they complete
+                instead of a list? Defaults to False.
+            reducer (callable, optional): Picklable function applied to each run's output
+                DataFrame in the worker, so that only its summary is returned. Defaults to None.
+            store (ResultStore, optional): Store that the output of each successful scenario is
+                appended to. The outputs are then dropped from the returned results, so memory
+                use does not grow with the size of the batch. Defaults to None.
+            columns (list, optional): Output columns to return for each scenario, as in
+                run_model. Defaults to None (all columns).
+            start (optional): First date of each scenario's output. Defaults to None.
+            end (optional): Last date of each scenario's output. Defaults to None.
+            executor (Executor, optional): Executor that runs the scenarios. n_workers and
+                chunksize are ignored when one is given. Defaults to a ProcessExecutor.
+
+        If instrumentation is enabled, each result's stats hold the timings of its scenario,
+        and the scenarios are added to this object's cumulative stats and callbacks.
+
+        Raises:
+            FileNotFoundError: If a provided file does not exist at the specified path.
+            RuntimeError: If no weather file has been given or loaded.
+
+        Returns:
+            list or generator: A ScenarioResult for each scenario, in input order. Failed
+                scenarios are returned with their error instead of stopping the batch.
+        """
+        if weather_file is None:
+            weather_file = self.weather_file
+        if residue_file is None:
+            residue_file = self.residue_file
+        if weather_file is None:
+            raise RuntimeError("Weather must be set before running BeePop+!")
+        if is_path(weather_file) and not os.path.isfile(weather_file):
+            raise FileNotFoundError("Weather file does not exist at path: {}!".format(weather_file))
+        if is_path(residue_file) and not os.path.isfile(residue_file):
+            raise FileNotFoundError("Residue file does not exist at path: {}!".format(residue_file))
+        if executor is None:
+            executor = ProcessExecutor(
+                n_workers, chunksize, lib_file=self.lib_file, verbose=self.verbose
+            )
+        results = executor.map(
+            parameter_sets,
+            weather_file,
+            residue_file=residue_file,
+            parameters=self.get_parameters(),
+            reducer=reducer,
+            instrument=self.beepop.instrumentation is not None,
+            columns=columns,
+            start=start,
+            end=end,
+        )
+        if self.beepop.instrumentation is not None:
+            results = _record_stats(results, self.beepop.instrumentation)
+        if store is not None:
+            results = _append_to_store(results, store)
+        if stream:
+            return results
+        return list(results)
+
+    def enable_instrumentation(self, callbacks=None):
+        """Record the wall time of each phase of every run, the bytes passed to and from
+        BeePop+ and the number of result lines.
+
+        Phases are "send_parameters", "reset", "prepare_weather", "send_weather",
+        "prepare_residue", "send_residue", "cache_lookup", "simulate", "fetch_results", "decode",
+        "dataframe" (or "reduce" for runs with a reducer) and "cache_store". Parameters and inputs
+        set between two runs are counted towards the next run.
+
+        Args:
+            callbacks (list, optional): Functions called with the RunStats of each completed
+                run, e.g. to export them to a metrics system. Defaults to None.
+
+        Returns:
+            Instrumentation: The object collecting the measurements.
+        """
+        return self.beepop.enable_instrumentation(callbacks)
+
+    def disable_instrumentation(self):
+        """Stop recording run measurements. Runs then carry no instrumentation overhead."""
+        self.beepop.disable_instrumentation()
+
+    def last_run_stats(self):
+        """Return the measurements of the last run as a dict, or None if there are none.
+
+        The dict holds "total_time", "phases" (seconds per phase), "bytes" (bytes per phase),
+        "counts" (e.g. "result_lines") and "cached" (True if the result came from a cache).
+        """
+        instrumentation = self.beepop.instrumentation
+        if instrumentation is None or instrumentation.last_run is None:
+            return None
+        return instrumentation.last_run.to_dict()
+
+    def run_stats(self):
+        """Return the cumulative measurements of all runs since instrumentation was enabled,
+        or None if it is disabled."""
+        instrumentation = self.beepop.instrumentation
+        if instrumentation is None:
+            return None
+        return instrumentation.totals()
+
     def get_output(self, format="DataFrame"):
         """Get the output from the last BeePop+ run.
 
@@ -0,0 +1,265 @@
+"""
+pybeepop - columnar decoding of BeePop+ results
+
+BeePop+ returns its daily outputs as whitespace-aligned text lines. These are parsed in a
+single pass into typed NumPy arrays, one per output column, rather than through pandas.
+"""
+
+import numpy as np
+
+colnames = [  # DataFrame column names for the BeePop+ output
+    "Date",
+    "Colony Size",
+    "Adult Drones",
+    "Adult Workers",
+    "Foragers",
+    "Active Foragers",
+    "Capped Drone Brood",
+    "Capped Worker Brood",
+    "Drone Larvae",
+    "Worker Larvae",
+    "Drone Eggs",
+    "Worker Eggs",
+    "Total Eggs",
+    "DD",
+    "L",
+    "N",
+    "P",
+    "dd",
+    "l",
+    "n",
+    "Free Mites",
+    "Drone Brood Mites",
+    "Worker Brood Mites",
+    "Mites/Drone Cell",
+    "Mites/Worker Cell",
+    "Mites Dying",
+    "Proportion Mites Dying",
+    "Colony Pollen (g)",
+    "Pollen Pesticide Concentration (ug/g)",
+    "Colony Nectar (g)",
+    "Nectar Pesticide Concentration (ug/g)",
+    "Dead Drone Larvae",
+    "Dead Worker Larvae",
+    "Dead Drone Adults",
+    "Dead Worker Adults",
+    "Dead Foragers",
+    "Queen Strength",
+    "Average Temperature (C)",
+    "Rain (mm)",
+    "Min Temp (C)",
+    "Max Temp (C)",
+    "Daylight hours",
+    "Forage Inc",
+    "Forage Day",
+]
+
+text_columns = ["Date", "Forage Day"]  # columns kept as strings
+
+integer_columns = [  # columns BeePop+ writes as whole numbers
+    "Colony Size",
+    "Adult Drones",
+    "Adult Workers",
+    "Foragers",
+    "Active Foragers",
+    "Capped Drone Brood",
+    "Capped Worker Brood",
+    "Drone Larvae",
+    "Worker Larvae",
+    "Drone Eggs",
+    "Worker Eggs",
+    "Total Eggs",
+    "Mites Dying",
+    "Proportion Mites Dying",
+    "Dead Drone Larvae",
+    "Dead Worker Larvae",
+    "Dead Drone Adults",
+    "Dead Worker Adults",
+    "Dead Foragers",
+]
+
+N_HEADER_LINES = 3  # header lines at the top of the BeePop+ results
+
+
+class BeePopResults:
+    """Daily outputs of a single BeePop+ run stored as one NumPy array per column.
+
+    Attributes:
+        columns (dict): Mapping of column name to a 1-D NumPy array, in output order.
+        dates (ndarray): datetime64[D] array of the simulation dates. The initial
+            conditions row has a date of NaT.
+    """
+
+    def __init__(self, columns, dates):
+        self.columns = columns
+        self.dates = dates
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    @property
+    def names(self):
+        """List of the column names held by this result."""
+        return list(self.columns)
+
+    def select(self, columns=None, start=None, end=None):
+        """Return a subset of the results. The arrays of the subset are views of these ones.
+
+        Args:
+            columns (list, optional): Output columns to keep. "Date" is always kept.
+                Defaults to None (all columns).
+            start (optional): First date to keep, as an MM/DD/YYYY string, a date or a
+                datetime64. The initial conditions row is dropped when a window is given.
+                Defaults to None.
+            end (optional): Last date to keep. Defaults to None.
+
+        Raises:
+            ValueError: If a column is not a BeePop+ output column.
+        """
+        names = output_columns(columns)
+        rows = slice(None)
+        if start is not None or end is not None:
+            rows = _window_rows(self.dates, start, end)
+        columns = dict((name, self.columns[name][rows]) for name in names)
+        return BeePopResults(columns, self.dates[rows])
+
+    def to_dataframe(self, copy=False):
+        """Return the results as a pandas DataFrame.
+
+        Args:
+            copy (bool, optional): Copy the column arrays? By default the DataFrame shares
+                memory with them. Defaults to False.
+        """
+        import pandas as pd
+
+        return pd.DataFrame(self.columns, copy=copy)
+
+
+def parse_dates(date_bytes):
+    """Convert an array of MM/DD/YYYY byte strings to datetime64[D] in one vectorized pass.
+
+    Entries that are not dates (e.g. "Initial") become NaT.
+    """
+    date_bytes = np.ascontiguousarray(date_bytes, dtype="S10")
+    chars = date_bytes.view(np.uint8).reshape(-1, 10)
+    is_date = (chars[:, 2] == ord("/")) & (chars[:, 5] == ord("/"))
+    digits = chars.astype(np.int64) - ord("0")
+    month = digits[:, 0] * 10 + digits[:, 1]
+    day = digits[:, 3] * 10 + digits[:, 4]
+    year = digits[:, 6] * 1000 + digits[:, 7] * 100 + digits[:, 8] * 10 + digits[:, 9]
+    dates = np.full(len(date_bytes), np.datetime64("NaT"), dtype="datetime64[D]")
+    if is_date.any():
+        ym = (year[is_date] - 1970) * 12 + (month[is_date] - 1)
+        dates[is_date] = ym.astype("datetime64[M]").astype("datetime64[D]") + (day[is_date] - 1)
+    return dates
+
+
+def to_date(value):
+    """Convert an MM/DD/YYYY string, an ISO date string, a date or a datetime64 to
+    datetime64[D]."""
+    if isinstance(value, str) and "/" in value:
+        month, day, year = (int(x) for x in value.strip().split("/"))
+        return np.datetime64("{:04d}-{:02d}-{:02d}".format(year, month, day), "D")
+    if hasattr(value, "date") and not isinstance(value, np.datetime64):
+        value = value.date()  # datetime and pandas Timestamp
+    return np.datetime64(value, "D")
+
+
+def output_columns(columns=None):
+    """Return the output columns to decode, in output order with "Date" first.
+
+    Args:
+        columns (list, optional): Names of BeePop+ output columns. Defaults to None (all).
+
+    Raises:
+        ValueError: If a name is not a BeePop+ output column.
+    """
+    if columns is None:
+        return list(colnames)
+    if isinstance(columns, str):
+        columns = [columns]
+    unknown = [name for name in columns if name not in colnames]
+    if unknown:
+        raise ValueError(
+            "{} not BeePop+ output columns. Choose from: {}".format(
+                ", ".join(unknown), ", ".join(colnames)
+            )
+        )
+    requested = set(columns)
+    return [name for name in colnames if name == "Date" or name in requested]
+
+
+def _window_rows(dates, start=None, end=None):
+    """Return the slice of rows whose dates fall between start and end, inclusive.
+
+    The dates of BeePop+ results are in order, after the undated initial conditions row.
+    """
+    dated = ~np.isnat(dates)
+    first = int(np.argmax(dated)) if dated.any() else len(dates)
+    days = dates[first:]
+    lo = first + (0 if start is None else int(np.searchsorted(days, to_date(start), "left")))
+    hi = first + (len(days) if end is None else int(np.searchsorted(days, to_date(end), "right")))
+    return slice(lo, max(lo, hi))
+
+
+def decode_results(lines, columns=None, start=None, end=None):
+    """Decode BeePop+ result rows into typed column arrays.
+
+    The numeric fields of all rows are parsed in one np.loadtxt call into a float array, and
+    the whole-number columns are then cast to int64. The date and forage day fields are taken
+    from the start and end of each row, and the dates are converted to datetime64 once.
+
+    Only the requested columns are converted and kept, and with a date window only the rows
+    inside it are parsed, so the work and memory follow what is requested.
+
+    Args:
+        lines (list): Result rows without the header lines, as bytes.
+        columns (list, optional): Output columns to decode. "Date" is always decoded.
+            Defaults to None (all columns).
+        start (optional): First date to decode, as an MM/DD/YYYY string, a date or a
+            datetime64. The initial conditions row is skipped when a window is given.
+            Defaults to None.
+        end (optional): Last date to decode. Defaults to None.
+
+    Raises:
+        ValueError: If the rows do not have the expected number of columns, or a requested
+            column is not a BeePop+ output column.
+
+    Returns:
+        BeePopResults: The decoded columns.
+    """
+    names = output_columns(columns)
+    n_cols = len(colnames)
+    if len(lines) and len(lines[0].split()) != n_cols:
+        raise ValueError("BeePop+ results do not have {} columns.".format(n_cols))
+    date_bytes = np.char.strip(np.array([line[:10] for line in lines], dtype="S10"))
+    dates = parse_dates(date_bytes)
+    if start is not None or end is not None:
+        rows = _window_rows(dates, start, end)
+        lines, date_bytes, dates = lines[rows], date_bytes[rows], dates[rows]
+    numeric = [name for name in names if name not in text_columns]
+    if not len(lines):
+        columns = dict((name, np.empty(0)) for name in names)
+        return BeePopResults(columns, dates)
+    values = []
+    if numeric:
+        usecols = [colnames.index(name) for name in numeric]
+        values = np.loadtxt(lines, usecols=usecols, ndmin=2, dtype=np.float64).T.copy()
+    columns = dict()
+    columns["Date"] = date_bytes.astype(str).astype(object)
+    for name, column in zip(numeric, values):
+        if name in integer_columns:
+            whole = column.astype(np.int64)
+            if (whole == column).all():
+                column = whole
+        columns[name] = column
+    if "Forage Day" in names:
+        forage_day = np.array([line.rsplit(None, 1)[-1] for line in lines])
+        columns["Forage Day"] = forage_day.astype(str).astype(object)
+    return BeePopResults(columns, dates)
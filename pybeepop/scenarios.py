@@ -0,0 +1,180 @@
+"""
+pybeepop - tables of BeePop+ scenarios
+
+A scenario table has one row per scenario and one column per exposed BeePop+ parameter, plus
+an optional scenario_id column. Empty cells leave a parameter at its base value. Tables are
+read from CSV or Parquet and checked column by column against the Type, Min and Max of the
+parameter file, so that a table of many thousands of scenarios is validated in one pass before
+any of them run.
+"""
+
+import os
+import warnings
+import numpy as np
+import pandas as pd
+from .parameters import get_parameter_spec, _date_pattern, _true_values, _false_values
+
+SCENARIO_COLUMN = "scenario_id"
+
+
+def read_scenario_table(path):
+    """Read a scenario table from a .csv or .parquet file.
+
+    CSV cells are read as text, so values reach BeePop+ as they are written in the file.
+
+    Raises:
+        FileNotFoundError: If the file does not exist.
+        ValueError: If the file is not a .csv or .parquet file.
+        ImportError: If the file is Parquet and pyarrow is not installed.
+
+    Returns:
+        DataFrame: The table.
+    """
+    if not os.path.isfile(path):
+        raise FileNotFoundError("Scenario table does not exist at path: {}!".format(path))
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".csv", ".txt"):
+        return pd.read_csv(path, dtype=str, skipinitialspace=True, encoding="utf-8-sig")
+    if extension in (".parquet", ".pq"):
+        from .store import _import_pyarrow
+
+        _import_pyarrow()
+        return pd.read_parquet(path)
+    raise ValueError("Scenario tables must be .csv or .parquet files, not {}.".format(path))
+
+
+def _describe(labels, rows, limit=5):
+    """Return a short list of the scenarios flagged in a boolean mask."""
+    flagged = [str(label) for label in labels[rows][:limit]]
+    more = int(rows.sum()) - len(flagged)
+    return ", ".join(flagged) + (" and {} more".format(more) if more else "")
+
+
+def _check_column(spec, values):
+    """Return (invalid, out_of_range) boolean masks of one parameter column."""
+    present = values.notna().to_numpy()
+    invalid = np.zeros(len(values), dtype=bool)
+    out_of_range = np.zeros(len(values), dtype=bool)
+    if spec.is_numeric:
+        numbers = pd.to_numeric(values, errors="coerce").to_numpy(dtype=np.float64)
+        invalid = present & np.isnan(numbers)
+        if spec.min is not None:
+            out_of_range |= numbers < spec.min
+        if spec.max is not None:
+            out_of_range |= numbers > spec.max
+    elif spec.type == "Boolean":
+        text = values.astype(str).str.strip().str.lower()
+        invalid = present & ~text.isin(_true_values + _false_values).to_numpy()
+    elif spec.type == "Date":
+        if pd.api.types.is_datetime64_any_dtype(values):
+            year, month, day = values.dt.year, values.dt.month, values.dt.day
+        else:
+            parts = values.astype(str).str.extract(_date_pattern.pattern).astype(np.float64)
+            month, day, year = parts[0], parts[1], parts[2]
+        month, day, year = (np.asarray(x, dtype=np.float64) for x in (month, day, year))
+        with np.errstate(invalid="ignore"):
+            invalid = present & ~((month >= 1) & (month <= 12) & (day >= 1) & (day <= 31))
+            ordinal = year * 10000 + month * 100 + day
+            if spec.min is not None:
+                out_of_range |= ordinal < np.dot(spec.min, (10000, 100, 1))
+            if spec.max is not None:
+                out_of_range |= ordinal > np.dot(spec.max, (10000, 100, 1))
+    return invalid, out_of_range & present & ~invalid
+
+
+def validate_scenario_table(table, id_column=SCENARIO_COLUMN):
+    """Check every parameter column of a scenario table against the parameter file.
+
+    Values outside a parameter's Min/Max range raise one warning per column, as in
+    validate_parameter, since BeePop+ accepts them.
+
+    Args:
+        table (DataFrame): Scenario table.
+        id_column (str, optional): Column holding the scenario ids, if present.
+            Defaults to "scenario_id".
+
+    Raises:
+        ValueError: If a column is not a BeePop+ parameter, a value does not convert to its
+            parameter's type, or the scenario ids are not unique. The message lists every
+            problem found.
+
+    Returns:
+        dict: The ParameterSpec of each parameter column, by column name.
+    """
+    specs, unknown, errors = dict(), [], []
+    for name in table.columns:
+        if name == id_column:
+            continue
+        try:
+            specs[name] = get_parameter_spec(str(name))
+        except ValueError:
+            unknown.append(str(name))
+    if unknown:
+        errors.append("Columns are not BeePop+ parameters: {}".format(", ".join(unknown)))
+    if id_column in table.columns:
+        labels, kind = table[id_column].to_numpy(), "scenarios"
+        duplicated = table[id_column].duplicated(keep=False).to_numpy()
+        if duplicated.any():
+            errors.append("Scenario ids are repeated: {}".format(_describe(labels, duplicated)))
+    else:
+        labels, kind = np.arange(len(table)), "rows"
+    for name, spec in specs.items():
+        invalid, out_of_range = _check_column(spec, table[name])
+        if invalid.any():
+            errors.append(
+                "{} must be {} values; {} {} are not".format(
+                    name, spec.type.lower(), kind, _describe(labels, invalid)
+                )
+            )
+        if out_of_range.any():
+            warnings.warn(
+                "{} is outside the expected range [{}, {}] in {} {}: {}.".format(
+                    name,
+                    spec.min,
+                    spec.max,
+                    int(out_of_range.sum()),
+                    kind,
+                    _describe(labels, out_of_range),
+                )
+            )
+    if errors:
+        raise ValueError("Invalid scenario table:\n" + "\n".join(errors))
+    return specs
+
+
+def scenario_parameters(table, id_column=SCENARIO_COLUMN, validate=True):
+    """Convert a scenario table to the parameter sets of run_batch.
+
+    Args:
+        table (DataFrame or str): Scenario table, or the path of a .csv or .parquet file.
+        id_column (str, optional): Column holding the scenario ids. If the table has no such
+            column, scenarios are numbered by row. Defaults to "scenario_id".
+        validate (bool, optional): Check the table with validate_scenario_table first?
+            Defaults to True.
+
+    Raises:
+        ValueError: If the table is not valid.
+
+    Returns:
+        dict: Parameter dict of each scenario, by scenario id, without its empty cells.
+    """
+    if isinstance(table, (str, os.PathLike)):
+        table = read_scenario_table(table)
+    if validate:
+        validate_scenario_table(table, id_column)
+    if id_column in table.columns:
+        ids = table[id_column].tolist()
+        table = table.drop(columns=id_column)
+    else:
+        ids = list(range(len(table)))
+    names = [str(name) for name in table.columns]
+    columns = [table[name].to_numpy(dtype=object) for name in table.columns]
+    missing = [table[name].isna().to_numpy() for name in table.columns]
+    scenarios = dict()
+    for row, scenario_id in enumerate(ids):
+        scenarios[scenario_id] = dict(
+            (name, values[row])
+            for name, values, na in zip(names, columns, missing)
+            if not na[row]
+        )
+    return scenarios
@@ -0,0 +1,375 @@
+"""
+pybeepop - global sensitivity analysis of BeePop+ parameters
+
+Samples are drawn with NumPy from the Min/Max bounds of the exposed parameters, run in parallel
+with run_batch, and reduced to a few summary metrics inside the worker processes so that the
+daily outputs of each run are never collected. First-order and total-order Sobol indices are
+estimated from a Saltelli design with the Saltelli (2010) and Jansen (1999) estimators.
+"""
+
+import numpy as np
+from .parameters import get_parameter_spec
+from .results import parse_dates
+
+_daily_rows = slice(1, None)  # the first output row holds the initial conditions
+
+
+def _daily_values(output, column):
+    """Return the daily values of column, without the initial conditions row if there is one.
+
+    The initial conditions row is the undated first row, which outputs restricted to a date
+    window no longer have. Outputs without a Date column are taken to start with it.
+    """
+    values = np.asarray(output[column], dtype=np.float64)
+    if "Date" in output:
+        first = np.asarray(output["Date"])[:1].astype("S10")
+        if len(first) and not np.isnat(parse_dates(np.char.strip(first)))[0]:
+            return values
+    return values[_daily_rows]
+
+
+def _colony_size(output):
+    return _daily_values(output, "Colony Size")
+
+
+def final_colony_size(output):
+    """Colony size on the last day of the simulation."""
+    return _colony_size(output)[-1]
+
+
+def min_colony_size(output):
+    """Smallest daily colony size."""
+    return _colony_size(output).min()
+
+
+def max_colony_size(output):
+    """Largest daily colony size."""
+    return _colony_size(output).max()
+
+
+def mean_colony_size(output):
+    """Average daily colony size."""
+    return _colony_size(output).mean()
+
+
+METRICS = {  # summary metrics available by name
+    "final_colony_size": final_colony_size,
+    "min_colony_size": min_colony_size,
+    "max_colony_size": max_colony_size,
+    "mean_colony_size": mean_colony_size,
+    "collapsed": None,  # these two depend on the reducer's collapse threshold
+    "collapse_day": None,
+}
+
+DEFAULT_METRICS = ("final_colony_size", "min_colony_size", "collapsed")
+
+
+class SummaryReducer:
+    """Reduce the daily output of a BeePop+ run to a vector of summary metrics.
+
+    Instances are picklable as long as any custom metric functions are defined at module level,
+    so they can be passed as the reducer of run_batch and evaluated in the worker processes.
+    """
+
+    def __init__(self, metrics=DEFAULT_METRICS, collapse_threshold=1000):
+        """
+        Args:
+            metrics (list or dict, optional): Names of metrics in METRICS, or a dict of
+                name: function taking the output DataFrame and returning a number.
+                Defaults to final_colony_size, min_colony_size and collapsed.
+            collapse_threshold (float, optional): A colony is considered collapsed on the first
+                day its size falls below this value. Used by the "collapsed" (1 or 0) and
+                "collapse_day" (days since the start) metrics. A colony that never collapses
+                gets the number of simulated days as its collapse_day, i.e. the day after the
+                simulation ends, so the metric stays finite. Defaults to 1000.
+
+        Raises:
+            ValueError: If a metric name is not known.
+        """
+        if isinstance(metrics, dict):
+            self.metrics = dict(metrics)
+        else:
+            self.metrics = dict()
+            for name in metrics:
+                if name not in METRICS:
+                    raise ValueError(
+                        "{} is not a known metric. Choose from: {}".format(
+                            name, ", ".join(METRICS)
+                        )
+                    )
+                self.metrics[name] = METRICS[name]
+        self.collapse_threshold = collapse_threshold
+
+    @property
+    def names(self):
+        """List of the metric names, in the order they are returned."""
+        return list(self.metrics)
+
+    def __call__(self, output):
+        """Return the metrics of one run as a float64 array."""
+        values = np.empty(len(self.metrics))
+        collapse_day = None
+        for i, (name, metric) in enumerate(self.metrics.items()):
+            if metric is None:  # collapse metrics
+                if collapse_day is None:
+                    sizes = _colony_size(output)
+                    below = np.flatnonzero(sizes < self.collapse_threshold)
+                    days = len(sizes)
+                    collapse_day = below[0] if len(below) else days
+                if name == "collapsed":
+                    values[i] = float(collapse_day < days)
+                else:
+                    values[i] = collapse_day
+            else:
+                values[i] = metric(output)
+        return values
+
+
+def parameter_bounds(names, bounds=None):
+    """Return the sampling bounds of numeric BeePop+ parameters.
+
+    Args:
+        names (list): Names of Float or Integer parameters.
+        bounds (dict, optional): name: (low, high) bounds that replace the Min/Max of the
+            parameter file. Required for parameters that have no Max in the file.
+            Defaults to None.
+
+    Raises:
+        ValueError: If a parameter is not numeric or has no finite bounds.
+
+    Returns:
+        ndarray: Array of shape (len(names), 2) with the low and high bound of each parameter.
+    """
+    overrides = dict((k.lower(), v) for k, v in (bounds or {}).items())
+    result = np.empty((len(names), 2))
+    for i, name in enumerate(names):
+        spec = get_parameter_spec(name)
+        if not spec.is_numeric:
+            raise ValueError("{} is a {} parameter and cannot be sampled.".format(name, spec.type))
+        low, high = overrides.get(spec.name.lower(), (spec.min, spec.max))
+        if low is None or high is None:
+            raise ValueError(
+                "{} has no Min/Max in the parameter file; give its bounds explicitly.".format(name)
+            )
+        if not low < high:
+            raise ValueError("{}: low bound must be below high bound.".format(name))
+        result[i] = low, high
+    return result
+
+
+def latin_hypercube(n, d, seed=None):
+    """Latin hypercube sample of n points in the d-dimensional unit cube.
+
+    Each dimension is split into n equal strata and every stratum is sampled exactly once.
+
+    Returns:
+        ndarray: Array of shape (n, d) with values in [0, 1).
+    """
+    rng = np.random.default_rng(seed)
+    strata = rng.random((d, n)).argsort(axis=1).T  # an independent permutation per dimension
+    return (strata + rng.random((n, d))) / n
+
+
+def scale_samples(unit, names, bounds=None):
+    """Map unit cube samples onto the parameter bounds.
+
+    Integer parameters are spread evenly over their whole numbers from low to high.
+
+    Returns:
+        ndarray: Array of the same shape as unit with the parameter values.
+    """
+    limits = parameter_bounds(names, bounds)
+    low, high = limits[:, 0], limits[:, 1]
+    integer = np.array([get_parameter_spec(name).type == "Integer" for name in names])
+    span = np.where(integer, np.floor(high) - np.ceil(low) + 1, high - low)
+    start = np.where(integer, np.ceil(low), low)
+    values = start + unit * span
+    return np.where(integer, np.minimum(np.floor(values), np.floor(high)), values)
+
+
+def saltelli_design(n, d, sampler="lhs", seed=None):
+    """Unit cube sample for estimating Sobol indices.
+
+    Two independent base samples A and B of n points are drawn. For each dimension i,
+    A with its column i taken from B is appended, giving n * (d + 2) points in total.
+
+    Args:
+        n (int): Number of base points.
+        d (int): Number of parameters.
+        sampler (str, optional): "lhs" to draw A and B as Latin hypercubes or "random" for
+            plain uniform samples. Defaults to "lhs".
+        seed (int, optional): Seed for the random number generator. Defaults to None.
+
+    Returns:
+        ndarray: Array of shape (n * (d + 2), d), ordered A, B, AB_1, ..., AB_d.
+    """
+    rng = np.random.default_rng(seed)
+    if sampler == "lhs":
+        base = latin_hypercube(n, 2 * d, seed=rng)
+    elif sampler == "random":
+        base = rng.random((n, 2 * d))
+    else:
+        raise ValueError("sampler must be 'lhs' or 'random'.")
+    a, b = base[:, :d], base[:, d:]
+    ab = np.repeat(a[np.newaxis], d, axis=0)
+    ab[np.arange(d), :, np.arange(d)] = b.T
+    return np.concatenate([a, b, ab.reshape(n * d, d)])
+
+
+def _design_blocks(y, d):
+    """Split outputs of a Saltelli design into its A, B and AB_i outputs.
+
+    Returns:
+        tuple: (y_a, y_b, y_ab).
+    """
+    y = np.asarray(y, dtype=np.float64)
+    if len(y) % (d + 2):
+        raise ValueError("Expected a multiple of {} outputs, got {}.".format(d + 2, len(y)))
+    n = len(y) // (d + 2)
+    return y[:n], y[n : 2 * n], y[2 * n :].reshape((d, n) + y.shape[1:])
+
+
+def _valid_blocks(y, d, failed=None):
+    """Return a boolean array marking the base points none of whose runs failed.
+
+    The failed runs are given by index, or are those whose outputs are all NaN.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    if failed is None:
+        failed_runs = np.isnan(y.reshape(len(y), -1)).all(axis=1)
+    else:
+        failed_runs = np.zeros(len(y), dtype=bool)
+        failed_runs[list(failed)] = True
+    runs_a, runs_b, runs_ab = _design_blocks(failed_runs, d)
+    return (runs_a == 0) & (runs_b == 0) & (runs_ab == 0).all(axis=0)
+
+
+def sobol_indices(y, d, failed=None):
+    """Estimate first-order and total-order Sobol indices from outputs of a Saltelli design.
+
+    Base points with a failed run in any of their A, B or AB_i rows are left out of the
+    estimates. Other NaN outputs are kept, and give NaN indices for their metric.
+
+    Args:
+        y (ndarray): Outputs for the points of saltelli_design, of shape (n * (d + 2),) or
+            (n * (d + 2), k) for k metrics.
+        d (int): Number of parameters.
+        failed (list, optional): Indices of the runs that failed. Defaults to None, the runs
+            whose outputs are all NaN.
+
+    Raises:
+        ValueError: If the length of y does not fit a design for d parameters.
+
+    Returns:
+        tuple: (first_order, total_order) arrays of shape (d,) or (d, k).
+    """
+    y_a, y_b, y_ab = _design_blocks(y, d)
+    valid = _valid_blocks(y, d, failed)
+    if y_a.ndim > 1:
+        valid = valid[:, np.newaxis]
+    count = valid.sum()
+    y_a, y_b = np.where(valid, y_a, 0.0), np.where(valid, y_b, 0.0)
+    y_ab = np.where(valid, y_ab, 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = (y_a + y_b).sum(axis=0) / (2 * count)
+        variance = (valid * ((y_a - mean) ** 2 + (y_b - mean) ** 2)).sum(axis=0) / (2 * count)
+        first_order = (y_b * (y_ab - y_a)).sum(axis=1) / count / variance
+        total_order = 0.5 * ((y_a - y_ab) ** 2).sum(axis=1) / count / variance
+    return first_order, total_order
+
+
+class SensitivityResult:
+    """Samples, summary metrics and Sobol indices of a sensitivity analysis.
+
+    Attributes:
+        parameters (list): Names of the sampled parameters.
+        metrics (list): Names of the summary metrics.
+        samples (ndarray): Parameter values of each run, shape (runs, parameters).
+        outputs (ndarray): Summary metrics of each run, shape (runs, metrics). Rows of failed
+            runs are NaN.
+        first_order (ndarray): First-order Sobol indices, shape (parameters, metrics).
+        total_order (ndarray): Total-order Sobol indices, shape (parameters, metrics).
+        errors (dict): Error message of each failed run, by run index.
+        dropped_blocks (int): Number of base points of the design left out of the indices
+            because one of their runs failed.
+    """
+
+    def __init__(self, parameters, metrics, samples, outputs, errors):
+        self.parameters = parameters
+        self.metrics = metrics
+        self.samples = samples
+        self.outputs = outputs
+        self.errors = errors
+        d = len(parameters)
+        self.first_order, self.total_order = sobol_indices(outputs, d, failed=list(errors))
+        self.dropped_blocks = int((~_valid_blocks(outputs, d, failed=list(errors))).sum())
+
+    def to_dataframe(self):
+        """Return the indices as a DataFrame of S1 and ST columns indexed by (metric, parameter)."""
+        import pandas as pd
+
+        index = pd.MultiIndex.from_product([self.metrics, self.parameters])
+        return pd.DataFrame(
+            {"S1": self.first_order.T.ravel(), "ST": self.total_order.T.ravel()}, index=index
+        )
+
+
+def run_sensitivity(
+    beepop,
+    parameters,
+    n,
+    bounds=None,
+    metrics=DEFAULT_METRICS,
+    collapse_threshold=1000,
+    sampler="lhs",
+    seed=None,
+    n_workers=None,
+    chunksize=1,
+):
+    """Run a Sobol sensitivity analysis of BeePop+ parameters.
+
+    The model is run n * (len(parameters) + 2) times in parallel with the weather, residues
+    and parameters already set on beepop. Each run is reduced to its summary metrics in the
+    worker process.
+
+    BeePop+ results can differ slightly between repeated runs with the same inputs, which adds
+    a little noise to the indices; increase n if indices near zero matter.
+
+    Args:
+        beepop (PyBeePop): Model with weather (and optionally residues and fixed parameters) set.
+        parameters (list): Names of the Float or Integer parameters to vary.
+        n (int): Number of base points of the Saltelli design.
+        bounds (dict, optional): name: (low, high) bounds that replace the Min/Max of the
+            parameter file. Defaults to None.
+        metrics (list or dict, optional): Summary metrics, see SummaryReducer.
+            Defaults to final_colony_size, min_colony_size and collapsed.
+        collapse_threshold (float, optional): Colony size below which a colony counts as
+            collapsed. Defaults to 1000.
+        sampler (str, optional): "lhs" or "random" base samples. Defaults to "lhs".
+        seed (int, optional): Seed for the sample. Defaults to None.
+        n_workers (int, optional): Number of worker processes. Defaults to the CPU count.
+        chunksize (int, optional): Number of runs sent to a worker at a time. Defaults to 1.
+
+    Returns:
+        SensitivityResult: The samples, metrics and Sobol indices.
+    """
+    names = [get_parameter_spec(name).name for name in parameters]
+    d = len(names)
+    samples = scale_samples(saltelli_design(n, d, sampler=sampler, seed=seed), names, bounds)
+    reducer = SummaryReducer(metrics, collapse_threshold=collapse_threshold)
+    integer = [get_parameter_spec(name).type == "Integer" for name in names]
+    parameter_sets = [
+        dict((k, int(v) if is_int else v) for k, v, is_int in zip(names, row, integer))
+        for row in samples.tolist()
+    ]
+    outputs = np.full((len(samples), len(reducer.names)), np.nan)
+    errors = dict()
+    results = beepop.run_batch(
+        parameter_sets, n_workers=n_workers, chunksize=chunksize, stream=True, reducer=reducer
+    )
+    for result in results:
+        if result.ok:
+            outputs[result.scenario_id] = result.output
+        else:
+            errors[result.scenario_id] = result.error
+    return SensitivityResult(names, reducer.names, samples, outputs, errors)
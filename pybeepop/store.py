@@ -0,0 +1,318 @@
+"""
+pybeepop - on-disk store of BeePop+ results
+
+Runs are appended to a directory of Parquet files, each holding the daily outputs of many runs
+with a scenario_id column. Compression and file writes happen on a background thread so that a
+batch can keep running the model while earlier results are written.
+
+Requires pyarrow (pip install pyarrow).
+"""
+
+import os
+import queue
+import numbers
+import threading
+import numpy as np
+from .results import parse_dates
+
+SCENARIO_COLUMN = "scenario_id"
+FLOAT_DECIMALS = 3  # BeePop+ writes at most this many decimals
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        import pyarrow.dataset
+        import pyarrow.fs
+    except ImportError:
+        raise ImportError(
+            "Storing results requires pyarrow. Install it with: pip install pyarrow"
+        ) from None
+    return pyarrow
+
+
+def _smallest_int(column):
+    """Return the smallest signed integer dtype that holds every value of a whole number column."""
+    low, high = (column.min(), column.max()) if len(column) else (0, 0)
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return dtype
+    return np.int64
+
+
+def _downcast(column):
+    """Return a numeric column in the smallest dtype that keeps every value BeePop+ reported.
+
+    Whole numbers are stored as the smallest integer type that holds them. Other values are
+    stored as float32 when they still round to the same printed value, otherwise as float64.
+    """
+    if column.dtype.kind in "iu":
+        return column.astype(_smallest_int(column), copy=False)
+    finite = np.isfinite(column)
+    if finite.all():
+        whole = column.astype(np.int64)
+        if (whole == column).all():
+            return whole.astype(_smallest_int(whole), copy=False)
+    single = column.astype(np.float32)
+    restored = single.astype(np.float64)
+    if np.array_equal(
+        np.round(restored[finite], FLOAT_DECIMALS), np.round(column[finite], FLOAT_DECIMALS)
+    ):
+        return single
+    return column
+
+
+def _output_columns(output):
+    """Return the columns of a run's output (DataFrame, BeePopResults or dict) as NumPy arrays."""
+    if hasattr(output, "dates") and hasattr(output, "columns"):  # BeePopResults
+        columns = dict(output.columns)
+        dates = output.dates
+    else:
+        columns = dict((name, np.asarray(output[name])) for name in output.keys())
+        if "Date" in columns:
+            date_bytes = np.char.strip(np.asarray(columns["Date"], dtype=str).astype("S10"))
+            dates = parse_dates(date_bytes)
+    if "Date" in columns:
+        columns["Date"] = dates
+    return columns
+
+
+class ResultStore:
+    """A directory of Parquet files holding the daily outputs of many BeePop+ runs.
+
+    Appended runs are buffered and written as a new part file once rows_per_file rows have
+    accumulated, or when the store is flushed or closed. Stores can be reopened to append more
+    runs or to read results back.
+
+    Example:
+        with ResultStore("results/") as store:
+            for result in beepop.run_batch(scenarios, stream=True):
+                if result.ok:
+                    store.append(result.scenario_id, result.output)
+        outputs = ResultStore("results/").read(columns=["Date", "Colony Size"])
+    """
+
+    def __init__(
+        self,
+        path,
+        rows_per_file=500000,
+        compression="zstd",
+        downcast=True,
+        background=True,
+        max_pending=16,
+    ):
+        """
+        Args:
+            path (str): Directory of the store. It is created if it does not exist.
+            rows_per_file (int, optional): Number of output rows collected before a part file is
+                written. Defaults to 500000.
+            compression (str, optional): Parquet compression codec. Defaults to "zstd".
+            downcast (bool, optional): Store numeric columns in the smallest dtype that keeps
+                the values BeePop+ reported (whole numbers as small integers, other values as
+                float32 when they round to the same printed value)? Defaults to True.
+            background (bool, optional): Convert, compress and write on a background thread?
+                Defaults to True.
+            max_pending (int, optional): Number of appended runs that may wait for the
+                background writer before append blocks. Defaults to 16.
+
+        Raises:
+            ImportError: If pyarrow is not installed.
+        """
+        self.pa = _import_pyarrow()
+        self.path = os.path.abspath(path)
+        os.makedirs(self.path, exist_ok=True)
+        self.rows_per_file = rows_per_file
+        self.compression = compression
+        self.downcast = downcast
+        self.background = background
+        self._pending = []
+        self._pending_rows = 0
+        self._next_part = len(self.files())
+        self._scenario_type = None
+        self._error = None
+        self._queue = None
+        self._thread = None
+        if background:
+            self._queue = queue.Queue(maxsize=max_pending)
+            self._thread = threading.Thread(target=self._write_loop, daemon=True)
+            self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def files(self):
+        """Return the paths of the part files written so far, in order."""
+        return sorted(
+            os.path.join(self.path, name)
+            for name in os.listdir(self.path)
+            if name.startswith("part-") and name.endswith(".parquet")
+        )
+
+    def append(self, scenario_id, output):
+        """Add the daily outputs of one run to the store.
+
+        Args:
+            scenario_id (int or str): Identifier of the run. All runs in a store must use the
+                same type of identifier.
+            output: The run's outputs as a DataFrame, BeePopResults or dict of columns.
+
+        Raises:
+            TypeError: If the scenario id type differs from earlier runs.
+        """
+        self._raise_writer_error()
+        if isinstance(scenario_id, str):
+            scenario_type = str
+        elif isinstance(scenario_id, numbers.Integral) and not isinstance(scenario_id, bool):
+            scenario_type, scenario_id = int, int(scenario_id)
+        else:
+            raise TypeError("Scenario ids must be int or str, not {!r}.".format(scenario_id))
+        if self._scenario_type is None:
+            self._scenario_type = scenario_type
+        elif scenario_type is not self._scenario_type:
+            raise TypeError(
+                "Scenario ids in a store must all be {}s, not {!r}.".format(
+                    self._scenario_type.__name__, scenario_id
+                )
+            )
+        if self.background:
+            self._queue.put((scenario_id, output))
+        else:
+            self._add(scenario_id, output)
+
+    def flush(self):
+        """Write all appended runs to disk."""
+        if self.background:
+            self._queue.put(None)
+            self._queue.join()
+        else:
+            self._write_part()
+        self._raise_writer_error()
+
+    def close(self):
+        """Write all appended runs to disk and stop the background writer."""
+        if self._thread is not None and self._thread.is_alive():
+            self.flush()
+            self._queue.put(False)
+            self._thread.join()
+        elif not self.background:
+            self.flush()
+        self._raise_writer_error()
+
+    def _raise_writer_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError("Error writing BeePop+ results: {}".format(error)) from error
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is False:
+                    return
+                elif item is None:
+                    self._write_part()
+                else:
+                    self._add(*item)
+            except Exception as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _add(self, scenario_id, output):
+        """Convert one run to an Arrow table and write a part file if enough rows are pending."""
+        pa = self.pa
+        columns = _output_columns(output)
+        n_rows = len(next(iter(columns.values()))) if columns else 0
+        arrays = [
+            pa.array(
+                np.full(n_rows, scenario_id, dtype=object if self._scenario_type is str else None),
+                type=pa.string() if self._scenario_type is str else pa.int64(),
+            )
+        ]
+        names = [SCENARIO_COLUMN]
+        for name in columns:
+            column = columns[name]
+            if column.dtype.kind == "M":
+                array = pa.array(column.astype("datetime64[D]"), type=pa.date32())
+            elif column.dtype.kind in "OUS":
+                array = pa.array(column.astype(str)).dictionary_encode()
+            elif self.downcast:
+                array = pa.array(_downcast(column))
+            else:
+                array = pa.array(column)
+            arrays.append(array)
+            names.append(name)
+        self._pending.append(pa.Table.from_arrays(arrays, names=names))
+        self._pending_rows += n_rows
+        if self._pending_rows >= self.rows_per_file:
+            self._write_part()
+
+    def _write_part(self):
+        if not self._pending:
+            return
+        pa = self.pa
+        schema = pa.unify_schemas(
+            [table.schema for table in self._pending], promote_options="permissive"
+        )
+        table = pa.concat_tables(
+            [table.cast(schema) for table in self._pending], promote_options="none"
+        )
+        file_name = os.path.join(self.path, "part-{:05d}.parquet".format(self._next_part))
+        pa.parquet.write_table(table, file_name + ".tmp", compression=self.compression)
+        os.replace(file_name + ".tmp", file_name)  # readers never see a partial file
+        self._next_part += 1
+        self._pending = []
+        self._pending_rows = 0
+
+    def dataset(self):
+        """Return the written results as a lazily read, memory-mapped pyarrow Dataset.
+
+        Part files may store a column with different dtypes, so they are read with a schema
+        that widens each column to the type that holds all parts.
+        """
+        pa = self.pa
+        files = self.files()
+        if not files:
+            raise FileNotFoundError("No results have been written to {}.".format(self.path))
+        filesystem = pa.fs.LocalFileSystem(use_mmap=True)
+        schema = pa.unify_schemas(
+            [pa.parquet.read_schema(file, memory_map=True) for file in files],
+            promote_options="permissive",
+        )
+        return pa.dataset.dataset(files, schema=schema, format="parquet", filesystem=filesystem)
+
+    def read(self, scenario_ids=None, columns=None):
+        """Read results back as a pandas DataFrame.
+
+        Only the requested scenarios and columns are read from disk.
+
+        Args:
+            scenario_ids (list, optional): Scenarios to read. Defaults to all.
+            columns (list, optional): Output columns to read, in addition to scenario_id.
+                Defaults to all.
+
+        Returns:
+            DataFrame: The outputs, with a scenario_id column.
+        """
+        dataset = self.dataset()
+        if columns is not None:
+            columns = [SCENARIO_COLUMN] + [name for name in columns if name != SCENARIO_COLUMN]
+        row_filter = None
+        if scenario_ids is not None:
+            row_filter = self.pa.dataset.field(SCENARIO_COLUMN).isin(list(scenario_ids))
+        return dataset.to_table(columns=columns, filter=row_filter).to_pandas()
+
+    def iter_scenarios(self, columns=None):
+        """Yield (scenario_id, DataFrame) for each stored run, reading one part file at a time."""
+        if columns is not None:
+            columns = [SCENARIO_COLUMN] + [name for name in columns if name != SCENARIO_COLUMN]
+        dataset = self.dataset()
+        for fragment in dataset.get_fragments():  # each run is written whole to one part file
+            frame = fragment.to_table(columns=columns, schema=dataset.schema).to_pandas()
+            for scenario_id, rows in frame.groupby(SCENARIO_COLUMN, sort=False):
+                yield scenario_id, rows.drop(columns=SCENARIO_COLUMN).reset_index(drop=True)
@@ -0,0 +1,292 @@
+"""
+pybeepop - sweeps of BeePop+ runs over weather stations and date windows
+
+A sweep runs the same colony parameters for every SimStart/SimEnd window of one or more weather
+series, e.g. each year of a long record at many stations. The windows are checked against the
+dates of every weather series before anything runs. Runs are grouped so that each worker process
+loads a station's weather once and then runs its windows one after the other, changing only the
+simulation dates.
+"""
+
+import os
+import math
+import datetime
+import concurrent.futures
+import numpy as np
+from .batch import BatchWorker, ScenarioResult
+from .inputs import input_cache, is_path
+from .results import output_columns, to_date
+
+
+def _weather_date(text):
+    """Convert a date of a weather file, MM/DD/YYYY or MM/DD/YY, to datetime64[D]."""
+    if len(text.strip().rsplit("/", 1)[-1]) == 2:
+        return np.datetime64(datetime.datetime.strptime(text.strip(), "%m/%d/%y").date(), "D")
+    return to_date(text)
+
+
+def _format_date(day):
+    return day.astype(datetime.date).strftime("%m/%d/%Y")
+
+
+def year_windows(weather, start="01/01", end="12/31"):
+    """Return the (start, end) windows of every year that the weather covers completely.
+
+    Args:
+        weather: Path to a weather file, or in-memory weather rows.
+        start (str, optional): Month and day each window starts on, as MM/DD.
+            Defaults to "01/01".
+        end (str, optional): Month and day each window ends on, as MM/DD. If it comes before
+            start, windows end in the following year (e.g. a winter season). Defaults to "12/31".
+
+    Returns:
+        list: (start, end) pairs of MM/DD/YYYY strings, in date order.
+    """
+    first, last = (_weather_date(day) for day in input_cache.get(weather).date_range())
+    first_year = first.astype("datetime64[Y]").astype(int) + 1970
+    last_year = last.astype("datetime64[Y]").astype(int) + 1970
+    windows = []
+    for year in range(first_year, last_year + 1):
+        window_start = to_date("{}/{}".format(start, year))
+        window_end = to_date("{}/{}".format(end, year))
+        if window_end < window_start:
+            window_end = to_date("{}/{}".format(end, year + 1))
+        if first <= window_start and window_end <= last:
+            windows.append((_format_date(window_start), _format_date(window_end)))
+    return windows
+
+
+def _check_windows(stations, weather, windows):
+    """Return the windows as MM/DD/YYYY strings, checked against the dates of every weather.
+
+    Raises:
+        ValueError: Listing every window that ends before it starts or that is not covered by
+            the weather of a station.
+    """
+    days, errors = [], []
+    for start, end in windows:
+        start, end = to_date(start), to_date(end)
+        if end < start:
+            errors.append("Window {} to {} ends before it starts.".format(start, end))
+        days.append((start, end))
+    for station, source in zip(stations, weather):
+        first, last = (_weather_date(day) for day in input_cache.get(source).date_range())
+        outside = [
+            "{} to {}".format(start, end)
+            for start, end in days
+            if start < first or end > last
+        ]
+        if outside:
+            errors.append(
+                "Station {!r} has weather from {} to {}, which does not cover: {}".format(
+                    station, first, last, ", ".join(outside)
+                )
+            )
+    if errors:
+        raise ValueError("Invalid sweep windows:\n" + "\n".join(errors))
+    return [(_format_date(start), _format_date(end)) for start, end in days]
+
+
+class SweepResult:
+    """Results of a sweep, aligned by station and window.
+
+    Attributes:
+        stations (list): Station labels, in the order given.
+        windows (list): (start, end) dates of the windows as MM/DD/YYYY strings.
+        results (list): For each station, the ScenarioResult of each window.
+    """
+
+    def __init__(self, stations, windows, results):
+        self.stations = stations
+        self.windows = windows
+        self.results = results
+
+    def __getitem__(self, station):
+        """Return the ScenarioResults of one station, one per window."""
+        return self.results[self.stations.index(station)]
+
+    @property
+    def errors(self):
+        """Error of each failed run, by (station, window index)."""
+        return dict(
+            ((station, w), result.error)
+            for station, row in zip(self.stations, self.results)
+            for w, result in enumerate(row)
+            if not result.ok
+        )
+
+    def to_array(self):
+        """Return the reducer outputs as an array shaped (stations, windows) plus the shape of
+        each output. Failed runs are NaN.
+
+        Raises:
+            ValueError: If no run succeeded, or the outputs are not numbers or arrays of one
+                shape.
+        """
+        outputs = [result.output for row in self.results for result in row if result.ok]
+        if not outputs:
+            raise ValueError("No run of the sweep succeeded.")
+        shape = np.shape(outputs[0])
+        array = np.full((len(self.stations), len(self.windows)) + shape, np.nan)
+        for i, row in enumerate(self.results):
+            for w, result in enumerate(row):
+                if result.ok:
+                    array[i, w] = result.output
+        return array
+
+    def to_dataframe(self, names=None):
+        """Return the reducer outputs as a DataFrame with one row per station and window.
+
+        Args:
+            names (list, optional): Names of the output values, e.g. SummaryReducer.names.
+                Defaults to their positions.
+        """
+        import pandas as pd
+
+        array = self.to_array()
+        values = array.reshape(len(self.stations) * len(self.windows), -1)
+        index = pd.MultiIndex.from_tuples(
+            [(station,) + window for station in self.stations for window in self.windows],
+            names=["station", "start", "end"],
+        )
+        return pd.DataFrame(values, index=index, columns=names)
+
+
+_sweep = None  # settings and current BatchWorker of a sweep worker process
+
+
+def _init_sweep(lib_file, residue_file, parameters, reducer, verbose, output_options):
+    global _sweep
+    _sweep = {
+        "settings": (lib_file, residue_file, parameters, reducer, verbose, False, output_options),
+        "station": None,
+        "worker": None,
+    }
+
+
+def _run_windows(task):
+    """Run a chunk of windows of one station, loading its weather if this worker lacks it."""
+    station_index, station, weather, windows = task
+    lib_file, residue_file, parameters, reducer, verbose, _, options = _sweep["settings"]
+    if _sweep["station"] != station_index:
+        _sweep["worker"], _sweep["station"] = None, None
+        try:
+            _sweep["worker"] = BatchWorker(
+                lib_file, weather, residue_file, parameters, reducer, verbose, False, options
+            )
+        except Exception as e:
+            error = "{}: {}".format(type(e).__name__, e)
+            return [ScenarioResult((station, w), error=error) for w, _ in windows]
+        _sweep["station"] = station_index
+    return [
+        _sweep["worker"].run((station, w), {"SimStart": start, "SimEnd": end})
+        for w, (start, end) in windows
+    ]
+
+
+def _chunks(n_windows, n_stations, n_workers):
+    """Split the window indices of a station so that every worker has a station to run."""
+    n_chunks = min(n_windows, max(1, math.ceil(n_workers / max(1, n_stations))))
+    size = math.ceil(n_windows / n_chunks) if n_windows else 1
+    return [range(i, min(i + size, n_windows)) for i in range(0, n_windows, size)]
+
+
+def run_sweep(
+    beepop,
+    windows,
+    weather=None,
+    residue_file=None,
+    reducer=None,
+    columns=None,
+    n_workers=None,
+    executor=None,
+):
+    """Run the parameters set on beepop for every date window of one or more weather series.
+
+    Each window is a scenario with its own SimStart and SimEnd, on top of the parameters
+    already set on beepop.
+
+    Args:
+        beepop (PyBeePop): Model with the colony parameters (and optionally residues) set.
+        windows (list): (start, end) dates of each window, as MM/DD/YYYY strings, dates or
+            datetime64 values. See year_windows.
+        weather (optional): Weather of a single station (a path or in-memory rows), or a dict of
+            station: weather. Defaults to the weather loaded on beepop.
+        residue_file (optional): Residues used at every station. Defaults to the residues loaded
+            on beepop, if any.
+        reducer (callable, optional): Picklable function applied to each run's output in the
+            workers, as in run_batch. Defaults to None.
+        columns (list, optional): Output columns to return for each run. Defaults to None (all).
+        n_workers (int, optional): Number of worker processes. Defaults to the CPU count.
+        executor (Executor, optional): Executor that runs the windows of each station as one
+            batch, e.g. a SupervisedExecutor or SocketExecutor. Defaults to None, which uses
+            worker processes that each keep the last station they loaded.
+
+    Raises:
+        RuntimeError: If no weather is given or loaded.
+        FileNotFoundError: If a weather or residue file does not exist.
+        ValueError: If a window is not covered by the weather of every station.
+
+    Returns:
+        SweepResult: The result of every window at every station.
+    """
+    if weather is None:
+        weather = beepop.weather_file
+    if weather is None:
+        raise RuntimeError("Weather must be set before running BeePop+!")
+    if isinstance(weather, dict):
+        stations, weather = list(weather), list(weather.values())
+    else:
+        stations, weather = [0], [weather]
+    if residue_file is None:
+        residue_file = beepop.residue_file
+    for source in weather + [residue_file]:
+        if is_path(source) and not os.path.isfile(source):
+            raise FileNotFoundError("Input file does not exist at path: {}!".format(source))
+    output_columns(columns)
+    windows = _check_windows(stations, weather, windows)
+    parameters = beepop.get_parameters()
+    results = [[None] * len(windows) for _ in stations]
+
+    if executor is not None:
+        for i, (station, source) in enumerate(zip(stations, weather)):
+            scenarios = [{"SimStart": start, "SimEnd": end} for start, end in windows]
+            for w, result in enumerate(
+                executor.map(
+                    scenarios,
+                    source,
+                    residue_file=residue_file,
+                    parameters=parameters,
+                    reducer=reducer,
+                    columns=columns,
+                )
+            ):
+                result.scenario_id = (station, w)
+                results[i][w] = result
+        return SweepResult(stations, windows, results)
+
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    tasks = []
+    for i, (station, source) in enumerate(zip(stations, weather)):
+        if not is_path(source):
+            source = input_cache.get(source)  # sent to the workers already formatted
+        for chunk in _chunks(len(windows), len(stations), n_workers):
+            tasks.append((i, station, source, [(w, windows[w]) for w in chunk]))
+    n_workers = max(1, min(n_workers, len(tasks)))
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=n_workers,
+        initializer=_init_sweep,
+        initargs=(
+            beepop.lib_file,
+            residue_file,
+            parameters,
+            reducer,
+            beepop.verbose,
+            {"columns": columns},
+        ),
+    ) as pool:
+        for (i, _, _, chunk), chunk_results in zip(tasks, pool.map(_run_windows, tasks)):
+            for (w, _), result in zip(chunk, chunk_results):
+                results[i][w] = result
+    return SweepResult(stations, windows, results)
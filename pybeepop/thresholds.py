@@ -0,0 +1,315 @@
+"""
+pybeepop - threshold search for colony-effect endpoints
+
+Finds the value of an exposure parameter, e.g. an application rate, at which an endpoint of the
+colony, e.g. its final size, drops a given fraction below a control run. Each round of the
+search runs a few points inside the current bracket in parallel and keeps the pair of points
+on either side of the threshold, so the bracket shrinks by a factor of points + 1 per round.
+Several searches (other levels, or other values of further parameters) run their rounds in
+the same batch. The control run and every evaluated point are remembered, so later searches
+with the same ThresholdSearch reuse them.
+"""
+
+import os
+import numpy as np
+from .parameters import get_parameter_spec
+from .sensitivity import final_colony_size
+
+
+class ThresholdResult:
+    """Outcome of a threshold search.
+
+    Attributes:
+        parameter (str): The searched parameter.
+        level (float): The effect level searched for.
+        fixed (dict): Further parameters set for this search.
+        threshold (float): Estimated parameter value at which the effect reaches the level, or
+            None if the effect does not cross the level within the bounds.
+        bracket (tuple): The closest evaluated values on either side of the threshold, or None.
+        status (str): "found", "above" if the effect is at or above the level throughout the
+            bounds, "below" if it stays below the level, or "failed" if every run failed.
+        evaluations (ndarray): Evaluated parameter values and their effects, shape (points, 2),
+            sorted by value.
+        errors (dict): Error message of each failed run, by parameter value.
+    """
+
+    def __init__(self, parameter, level, fixed, threshold, bracket, status, evaluations, errors):
+        self.parameter = parameter
+        self.level = level
+        self.fixed = fixed
+        self.threshold = threshold
+        self.bracket = bracket
+        self.status = status
+        self.evaluations = evaluations
+        self.errors = errors
+
+    def __repr__(self):
+        return "ThresholdResult({}={!r}, level={}, {})".format(
+            self.parameter, self.threshold, self.level, self.status
+        )
+
+    def to_dataframe(self):
+        """Return the evaluated parameter values and their effects as a DataFrame."""
+        import pandas as pd
+
+        return pd.DataFrame(self.evaluations, columns=[self.parameter, "effect"])
+
+
+class _Search:
+    """Bracketing state of the search for one parameter, level and set of fixed parameters."""
+
+    def __init__(self, parameter, level, fixed, bounds, scale, tol):
+        spec = get_parameter_spec(parameter)
+        if not spec.is_numeric:
+            raise ValueError(
+                "{} is a {} parameter and cannot be searched.".format(parameter, spec.type)
+            )
+        self.parameter = spec.name
+        self.integer = spec.type == "Integer"
+        self.level = level
+        self.fixed = dict(fixed or {})
+        self.low, self.high = (float(bound) for bound in bounds)
+        if not self.low < self.high:
+            raise ValueError("{}: low bound must be below high bound.".format(parameter))
+        if scale not in ("linear", "log"):
+            raise ValueError("scale must be 'linear' or 'log'.")
+        if scale == "log" and self.low <= 0:
+            raise ValueError("{}: a log scale needs a positive low bound.".format(parameter))
+        self.log = scale == "log"
+        self.tol = tol
+        self.effects = dict()  # effect by evaluated value
+        self.errors = dict()
+        self.bracket = None
+        self.status = None
+
+    def _unit(self, value):
+        if self.log:
+            return np.log(value / self.low) / np.log(self.high / self.low)
+        return (value - self.low) / (self.high - self.low)
+
+    def _value(self, unit):
+        if self.log:
+            value = self.low * (self.high / self.low) ** unit
+        else:
+            value = self.low + unit * (self.high - self.low)
+        return np.round(value) if self.integer else value
+
+    def parameters(self, value):
+        values = dict(self.fixed)
+        values[self.parameter] = int(value) if self.integer else float(value)
+        return values
+
+    def propose(self, n):
+        """Return the parameter values to run in the next round."""
+        if self.bracket is None:
+            units = np.linspace(0, 1, max(2, n))
+        else:
+            low, high = (self._unit(value) for value in self.bracket)
+            units = np.linspace(low, high, n + 2)[1:-1]
+        values = np.unique(self._value(units))
+        return [value for value in values.tolist() if value not in self.effects]
+
+    def update(self):
+        """Narrow the bracket to the evaluated points around the threshold; set status if done."""
+        values = np.array(sorted(self.effects))
+        gaps = np.array([self.effects[value] for value in values]) - self.level
+        if len(values) == 0:
+            self.status = "failed"
+            return
+        crossing = np.flatnonzero(np.sign(gaps[:-1]) != np.sign(gaps[1:]))
+        if gaps[0] == 0:
+            self.bracket = (float(values[0]), float(values[0]))
+        elif len(crossing) == 0:
+            self.status = "above" if gaps[0] > 0 else "below"
+            return
+        else:
+            i = crossing[0]
+            self.bracket = (float(values[i]), float(values[i + 1]))
+        low, high = self.bracket
+        if self.integer:
+            done = high - low <= 1
+        else:
+            done = self._unit(high) - self._unit(low) <= self.tol
+        if done:
+            self.status = "found"
+
+    def result(self):
+        threshold = None
+        if self.bracket is not None:
+            low, high = self.bracket
+            gap_low = self.effects[low] - self.level
+            gap_high = self.effects[high] - self.level
+            if self.integer or low == high:
+                threshold = high
+            else:
+                unit_low, unit_high = self._unit(low), self._unit(high)
+                unit = unit_low + (unit_high - unit_low) * gap_low / (gap_low - gap_high)
+                threshold = float(self._value(unit))
+        if self.status is None:  # stopped by the round limit before the tolerance was reached
+            self.status = "found" if self.bracket is not None else "failed"
+        evaluations = np.array(sorted(self.effects.items()), dtype=np.float64).reshape(-1, 2)
+        return ThresholdResult(
+            self.parameter,
+            self.level,
+            self.fixed,
+            threshold,
+            self.bracket if threshold is not None else None,
+            self.status,
+            evaluations,
+            self.errors,
+        )
+
+
+class ThresholdSearch:
+    """Searches for threshold values of exposure parameters, remembering every run.
+
+    The runs use the weather, residues and parameters already set on beepop. The effect of a
+    run is its relative drop below the control, 1 - endpoint(run) / endpoint(control), or the
+    endpoint itself if relative is False.
+
+    Attributes:
+        runs (int): Number of BeePop+ runs made so far, including the control.
+        control_value (float): Endpoint of the control run, once it has been made.
+    """
+
+    def __init__(
+        self,
+        beepop,
+        endpoint=final_colony_size,
+        control=None,
+        relative=True,
+        n_workers=None,
+        chunksize=1,
+        executor=None,
+    ):
+        """
+        Args:
+            beepop (PyBeePop): Model with weather (and optionally residues and fixed
+                parameters) set.
+            endpoint (callable, optional): Picklable function that reduces the output of a run
+                to a number, called in the worker processes. Defaults to final_colony_size.
+            control (dict, optional): Parameters of the control run, set on top of those on
+                beepop, e.g. {"EAppRate": 0}. Defaults to None (the parameters on beepop).
+            relative (bool, optional): Measure effects as the relative drop below the control?
+                Otherwise the endpoint is compared to the level directly and no control is run.
+                Defaults to True.
+            n_workers (int, optional): Number of worker processes. Defaults to the CPU count.
+            chunksize (int, optional): Number of runs sent to a worker at a time. Defaults to 1.
+            executor (Executor, optional): Executor that runs the batches, as in run_batch.
+                Defaults to None.
+        """
+        self.beepop = beepop
+        self.endpoint = endpoint
+        self.control = dict(control or {})
+        self.relative = relative
+        self.run_options = dict(n_workers=n_workers, chunksize=chunksize, executor=executor)
+        self.n_workers = n_workers
+        self.cache = dict()  # endpoint (or error) of every run, by its parameters
+        self.runs = 0
+        self.control_value = None
+
+    @staticmethod
+    def _key(parameters):
+        return tuple(sorted((name.lower(), value) for name, value in parameters.items()))
+
+    def _run(self, parameter_sets):
+        """Run the parameter sets not yet in the cache, all in one batch."""
+        new = list(dict((self._key(p), p) for p in parameter_sets).items())
+        new = [(key, p) for key, p in new if key not in self.cache]
+        if not new:
+            return
+        results = self.beepop.run_batch(
+            [p for _, p in new], stream=True, reducer=self.endpoint, **self.run_options
+        )
+        for result in results:
+            key = new[result.scenario_id][0]
+            if result.ok:
+                self.cache[key] = (float(result.output), None)
+            else:
+                self.cache[key] = (None, result.error)
+        self.runs += len(new)
+
+    def _effect(self, value):
+        if self.relative:
+            return 1.0 - value / self.control_value
+        return value
+
+    def find(
+        self,
+        parameter,
+        level,
+        bounds,
+        fixed=None,
+        scale="linear",
+        tol=1e-3,
+        points=None,
+        max_rounds=20,
+    ):
+        """Find the value of parameter at which the effect reaches level.
+
+        The effect is assumed to cross the level once within the bounds; if it crosses more
+        than once, the crossing nearest the low bound is found.
+
+        Args:
+            parameter (str): Name of the Float or Integer parameter to search, e.g. "EAppRate".
+            level (float or list): Effect level(s) to find, e.g. 0.1 for a drop of 10% below
+                the control.
+            bounds (tuple): (low, high) values of the parameter to search between.
+            fixed (dict or list, optional): Further parameters set for the search, or a list of
+                them for one search each, e.g. [{"AIAdultLD50": 0.01}, {"AIAdultLD50": 0.1}].
+                Defaults to None.
+            scale (str, optional): "linear", or "log" for parameters that span orders of
+                magnitude. Defaults to "linear".
+            tol (float, optional): Stop once the bracket is at most this fraction of the bounds
+                (on the given scale) wide. Integer parameters stop at neighbouring whole
+                numbers. Defaults to 1e-3.
+            points (int, optional): Runs per search and round. Defaults to the number of
+                workers divided among the searches, and at least 2.
+            max_rounds (int, optional): Largest number of rounds after the first. Defaults to 20.
+
+        Raises:
+            ValueError: If the parameter cannot be searched, the bounds or scale are invalid or
+                the control run fails.
+
+        Returns:
+            ThresholdResult: The result, or a list of them for each fixed set and level (level
+                varying fastest) if either is a list.
+        """
+        levels = list(level) if np.ndim(level) else [level]
+        fixed_sets = fixed if isinstance(fixed, (list, tuple)) else [fixed]
+        searches = [
+            _Search(parameter, float(lvl), fixed_set, bounds, scale, tol)
+            for fixed_set in fixed_sets
+            for lvl in levels
+        ]
+        if self.relative and self.control_value is None:
+            self._run([self.control])
+            value, error = self.cache[self._key(self.control)]
+            if value is None:
+                raise ValueError("The control run failed: {}".format(error))
+            if value == 0:
+                raise ValueError("The control endpoint is 0, so relative effects are undefined.")
+            self.control_value = value
+        if points is None:
+            n_workers = self.n_workers or os.cpu_count() or 1
+            points = max(2, n_workers // len(searches))
+
+        active = searches
+        for _ in range(max_rounds + 1):
+            proposals = [(search, search.propose(points)) for search in active]
+            self._run([search.parameters(v) for search, values in proposals for v in values])
+            for search, values in proposals:
+                for v in values:
+                    output, error = self.cache[self._key(search.parameters(v))]
+                    if output is None:
+                        search.errors[v] = error
+                    else:
+                        search.effects[v] = self._effect(output)
+                search.update()
+            active = [s for s, values in proposals if s.status is None and values]
+            if not active:
+                break
+        results = [search.result() for search in searches]
+        if np.ndim(level) or isinstance(fixed, (list, tuple)):
+            return results
+        return results[0]
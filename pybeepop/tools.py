@@ -5,56 +5,24 @@
 ##
 
 import os
-import io
+import sys
 import ctypes
-import pandas as pd
-
-colnames = [  # DataFrame column names for the BeePop+ output
-    "Date",
-    "Colony Size",
-    "Adult Drones",
-    "Adult Workers",
-    "Foragers",
-    "Active Foragers",
-    "Capped Drone Brood",
-    "Capped Worker Brood",
-    "Drone Larvae",
-    "Worker Larvae",
-    "Drone Eggs",
-    "Worker Eggs",
-    "Total Eggs",
-    "DD",
-    "L",
-    "N",
-    "P",
-    "dd",
-    "l",
-    "n",
-    "Free Mites",
-    "Drone Brood Mites",
-    "Worker Brood Mites",
-    "Mites/Drone Cell",
-    "Mites/Worker Cell",
-    "Mites Dying",
-    "Proportion Mites Dying",
-    "Colony Pollen (g)",
-    "Pollen Pesticide Concentration (ug/g)",
-    "Colony Nectar (g)",
-    "Nectar Pesticide Concentration (ug/g)",
-    "Dead Drone Larvae",
-    "Dead Worker Larvae",
-    "Dead Drone Adults",
-    "Dead Worker Adults",
-    "Dead Foragers",
-    "Queen Strength",
-    "Average Temperature (C)",
-    "Rain (mm)",
-    "Min Temp (C)",
-    "Max Temp (C)",
-    "Daylight hours",
-    "Forage Inc",
-    "Forage Day",
-]
+import tempfile
+import threading
+from .results import colnames, decode_results, output_columns, N_HEADER_LINES
+from .inputs import input_cache, format_weather_arrays, format_residue_arrays
+from .parameters import (
+    parameter_names,
+    get_parameter_spec,
+    validate_parameter,
+    read_parameter_file,
+)
+from .cache import result_key
+from .instrumentation import Instrumentation, _NOT_TIMED
+
+_sessions = dict()  # state of each library handle's BeePop+ session
+_libraries = dict()  # shared library handles by path
+_libraries_lock = threading.Lock()
 
 
 def StringList2CPA(theList):
@@ -65,32 +33,159 @@ def StringList2CPA(theList):
     return theListBytes
 
 
+def load_library(library_file):
+    """Return the ctypes handle of a shared library, loading it only once per process.
+
+    Models created later for the same path reuse the handle, along with the library functions
+    ctypes has already looked up on it.
+
+    Args:
+        library_file (str): Path to the BeePop+ shared library.
+
+    Returns:
+        CDLL: The loaded library.
+    """
+    path = os.path.realpath(library_file)
+    with _libraries_lock:
+        lib = _libraries.get(path)
+        if lib is None:
+            lib = ctypes.CDLL(path)
+            _libraries[path] = lib
+    return lib
+
+
+def load_private_copy(library_file):
+    """Load a private copy of the BeePop+ library with its own global session.
+
+    The dynamic loader returns the same handle (and so the same BeePop+ state) for every load of
+    one file. Loading the library from a distinct file gives an independent copy. On Linux the
+    copy is made in an anonymous in-memory file; elsewhere it is written to a temporary file.
+
+    Args:
+        library_file (str): Path to the BeePop+ shared library.
+
+    Returns:
+        tuple: (CDLL, release). Call release() after unloading the library. It frees the copy
+            if the loader really unloaded it. Otherwise the copy stays in place for the life of
+            the process, so that its name cannot be reused for a later copy.
+    """
+    with open(library_file, "rb") as f:
+        content = f.read()
+    if hasattr(os, "memfd_create") and os.path.isdir("/proc/self/fd"):
+        # the copy is loaded under /proc/self/fd/N, and the loader would hand back this copy for
+        # a later one opened under the same path, so the descriptor is only closed once the copy
+        # has been unloaded
+        fd = os.memfd_create("beepop", 0)
+        path = "/proc/self/fd/{}".format(fd)
+        try:
+            os.write(fd, content)
+            lib = ctypes.CDLL(path)
+        except OSError:
+            os.close(fd)
+            raise
+        return lib, lambda: _release_copy(path, lambda: os.close(fd))
+    suffix = os.path.splitext(library_file)[1]
+    fd, path = tempfile.mkstemp(prefix="beepop_", suffix=suffix)
+    with os.fdopen(fd, "wb") as f:
+        f.write(content)
+    try:
+        lib = ctypes.CDLL(path)
+    except OSError:
+        os.remove(path)
+        raise
+    return lib, lambda: _release_copy(path, lambda: os.remove(path))
+
+
+_retained_copies = []  # paths of private copies the loader kept mapped after they were closed
+
+
+def _is_loaded(path):
+    """Return True if the dynamic loader still has the library at path mapped."""
+    if sys.platform == "win32":
+        get_module_handle = ctypes.WinDLL("kernel32").GetModuleHandleW
+        get_module_handle.argtypes = [ctypes.c_wchar_p]
+        get_module_handle.restype = ctypes.c_void_p
+        return bool(get_module_handle(path))
+    loader = ctypes.CDLL(None)
+    loader.dlopen.argtypes = [ctypes.c_char_p, ctypes.c_int]
+    loader.dlopen.restype = ctypes.c_void_p
+    handle = loader.dlopen(os.fsencode(path), os.RTLD_NOLOAD | os.RTLD_LAZY)
+    if not handle:
+        return False
+    loader.dlclose.argtypes = [ctypes.c_void_p]
+    loader.dlclose(handle)  # drop the reference the check itself took
+    return True
+
+
+def _release_copy(path, free):
+    """Free a private copy of the library unless the loader still has it mapped.
+
+    Returns:
+        bool: True if the copy was freed.
+    """
+    if _is_loaded(path):
+        # e.g. libraries with unique C++ symbols cannot be unloaded; keeping the copy keeps its
+        # name from being reused, which would hand its leftover state to a new model
+        _retained_copies.append(path)
+        return False
+    free()
+    return True
+
+
+def _unload_library(lib):
+    """Unload a shared library loaded with ctypes."""
+    if sys.platform == "win32":
+        free_library = ctypes.WinDLL("kernel32").FreeLibrary
+        free_library.argtypes = [ctypes.c_void_p]
+        free_library(lib._handle)
+    else:
+        dlclose = ctypes.CDLL(None).dlclose
+        dlclose.argtypes = [ctypes.c_void_p]
+        dlclose(lib._handle)
+
+
 class BeePopModel:
     """Class of background functions to interface with the BeePop+ shared library using CTypes.
 
     In most cases users would interact with a PyBeePop object instead of this class.
     """
 
-    def __init__(self, library_file, verbose=False):
+    def __init__(self, library_file, verbose=False, isolated=False, result_cache=None):
         """Initialize the connection to the BeePop+ shared library.
 
         Args:
             library_file (str): Path to the BeePop+ shared library.
             verbose (bool, optional): Print debugging messages? Defaults to False.
+            isolated (bool, optional): Load a private copy of the library so this model's
+                parameters, inputs and results are not shared with other models in the process.
+                Isolated models can run simulations concurrently from separate threads.
+                Defaults to False.
+            result_cache (ResultCache, optional): Cache of results to answer repeated
+                simulations from. Defaults to None.
 
         Raises:
             RuntimeError: If BeePop+ passes an error code on initialization.
         """
         self.parameters = dict()
         self.parent = os.path.dirname(os.path.abspath(__file__))
-        self.valid_parameters = pd.read_csv(
-            os.path.join(self.parent, "data/BeePop_exposed_parameters.csv"), skiprows=1
-        )["Exposed Variable Name"].tolist()
+        self.valid_parameters = parameter_names()
         self.weather_file = None
         self.contam_file = None
         self.verbose = verbose
         self.results = None
-        self.lib = ctypes.CDLL(library_file)
+        self.result_arrays = None
+        self.result_cache = result_cache
+        self.weather_key = None
+        self.residue_key = None
+        self.latitude = None
+        self._version = None
+        self.instrumentation = None
+        self.isolated = isolated
+        self._release_copy = None
+        if isolated:
+            self.lib, self._release_copy = load_private_copy(library_file)
+        else:
+            self.lib = load_library(library_file)
         self.parent_dir = os.path.dirname(os.path.abspath(__file__))
         self.lib_status = None
         if self.lib.InitializeModel():  # Initialize model
@@ -98,10 +193,36 @@ class BeePopModel:
                 print("Model initialized.")
         else:
             raise RuntimeError("BeePop+ could not be initialized.")
+        self.session()["parameters"] = dict()
         self.clear_buffers()
-        self.send_pars_to_beepop(
-            ["NecPolFileEnable=false"], silent=True
-        )  # disable residue input until given
+        self._send_defaults()  # disable residue input until given
+
+    def enable_instrumentation(self, callbacks=None):
+        """Start recording per-phase timings and sizes of each run.
+
+        Args:
+            callbacks (list, optional): Functions called with the RunStats of each run.
+                Defaults to None.
+
+        Returns:
+            Instrumentation: The object collecting the measurements.
+        """
+        if self.instrumentation is None:
+            self.instrumentation = Instrumentation(callbacks)
+        elif callbacks:
+            for callback in callbacks:
+                self.instrumentation.add_callback(callback)
+        return self.instrumentation
+
+    def disable_instrumentation(self):
+        """Stop recording per-phase timings."""
+        self.instrumentation = None
+
+    def _timed(self, phase):
+        """Return a context manager timing a phase, or a shared no-op one if not instrumented."""
+        if self.instrumentation is None:
+            return _NOT_TIMED
+        return self.instrumentation.phase(phase)
 
     def clear_buffers(self):
         """Clear C++ buffers in BeePop+"""
@@ -115,16 +236,7 @@ class BeePopModel:
     def load_input_file(self, in_file):
         """Load txt file of BeePop+ parameters."""
         self.input_file = in_file
-        icf = open(self.input_file)
-        inputs = icf.readlines()
-        icf.close()
-        input_d = dict(x.replace(" ", "").replace("\n", "").split("=") for x in inputs)
-        self.parameter_list_update(input_d)  # update parameter dictionary
-        inputlist = []
-        for k, v in self.parameters.items():
-            inputlist.append("{}={}".format(k, v))
-        self.send_pars_to_beepop(inputlist)
-        return self.parameters
+        return self.set_parameters(read_parameter_file(self.input_file))
 
     def parameter_list_update(self, parameters):
         """Update the internal tracking of set parameters with a dict of
@@ -133,52 +245,132 @@ class BeePopModel:
         self.parameters.update(to_add)
 
     def set_parameters(self, parameters=None):
-        """Set BeePop+ parameters based on a dict of parameters: values"""
+        """Set BeePop+ parameters based on a dict of parameters: values.
+
+        Only parameters whose value differs from what the library session already holds are
+        sent to BeePop+.
+        """
         if parameters is not None:
+            for name, value in parameters.items():  # validate before changing any state
+                validate_parameter(name, value)
             self.parameter_list_update(parameters)
         else:
             if len(self.parameters) < 1:
                 return
+        sent = self.session()["parameters"]
         inputlist = []
         for k, v in self.parameters.items():
-            inputlist.append("{}={}".format(k, v))
-        self.send_pars_to_beepop(inputlist)
+            value = get_parameter_spec(k).format(v)
+            if sent.get(k) != value:
+                inputlist.append("{}={}".format(k, value))
+        if inputlist:
+            self.send_pars_to_beepop(inputlist)
         return self.parameters
 
+    def reset_parameters(self):
+        """Return the BeePop+ parameters to their defaults without reloading the library.
+
+        The weather and residue tables stay loaded, and residue input stays enabled if a residue
+        file was loaded by this model. BeePop+ keeps the previous SimStart and SimEnd when it is
+        initialized, so they are set back to the span of the loaded weather, as after loading it.
+        """
+        with self._timed("reset"):
+            if not self.lib.InitializeModel():
+                raise RuntimeError("BeePop+ could not be initialized.")
+            self.session()["parameters"] = dict()
+            self.parameters = dict()
+            self.clear_buffers()
+        self._send_defaults()
+
+    def _send_defaults(self):
+        """Send the settings that follow InitializeModel: residue input enabled only if this
+        model loaded residues, and the simulation dates of the loaded weather, if any."""
+        enable = "true" if self.contam_file is not None else "false"
+        defaults = ["NecPolFileEnable={}".format(enable)]
+        loaded = self.session()
+        if "weather_dates" in loaded:  # InitializeModel keeps the previous SimStart/SimEnd
+            start, end = loaded["weather_dates"]
+            defaults += ["SimStart={}".format(start), "SimEnd={}".format(end)]
+        self.send_pars_to_beepop(defaults, silent=True)
+
     def send_pars_to_beepop(self, parameter_list, silent=False):
         """Call the BeePop+ interface function to set parameters from a list of
         parameter=value strings"""
+        with self._timed("send_parameters"):
+            self._send_pars(parameter_list, silent)
+
+    def _send_pars(self, parameter_list, silent):
+        sent = dict()
         for par in parameter_list:  # check for invalid parameters
-            par_name = par.split("=")[0].lower()
-            if par_name not in [x.lower() for x in self.valid_parameters]:
-                raise ValueError("{} is not a valid parameter.".format(par_name))
+            par_name, _, value = par.partition("=")
+            validate_parameter(par_name, value)
+            sent[par_name.strip().lower()] = value
         CPA = (ctypes.c_char_p * len(parameter_list))()
         inputlist_bytes = StringList2CPA(parameter_list)
         CPA[:] = inputlist_bytes
+        if self.instrumentation is not None:
+            self.instrumentation.add_bytes("send_parameters", sum(map(len, inputlist_bytes)))
+            self.instrumentation.count("parameters_sent", len(parameter_list))
+        session_parameters = self.session()["parameters"]
         if self.lib.SetICVariablesCPA(CPA, len(parameter_list)):
+            session_parameters.update(sent)
             if self.verbose and not silent:
                 print("Updated parameters")
         else:
+            for par_name in sent:  # the library state of these is now unknown
+                session_parameters.pop(par_name, None)
             raise RuntimeError("Error setting parameters")
 
     def get_parameters(self):
         """Return the current dict of user defined parameters"""
         return self.parameters
 
+    def session(self):
+        """Return the dict recording the inputs and parameter values held by the library session.
+
+        All BeePopModel objects that share a library handle also share its session, so the
+        record is kept per handle rather than per object. It holds the keys of the loaded
+        "weather" and "residue" inputs, the (start, end) "weather_dates" of the loaded weather
+        and the "parameters" last sent, as name: value strings.
+        """
+        return _sessions.setdefault(self.lib._handle, {"parameters": dict()})
+
     def load_weather(self, weather_file=None):
-        """Load a csv or comma separated txt weather file into BeePop+ using the library interface."""
+        """Load weather into BeePop+ using the library interface.
+
+        The weather can be a csv or comma separated txt file, or an in-memory DataFrame, 2-D
+        NumPy array or list of lines. Prepared inputs are cached, and if the same weather is
+        already loaded only the simulation dates are reset instead of resending the table.
+        """
         if weather_file is not None:
             try:
-                wf = open(weather_file)
-                weatherlines = wf.readlines()
-                wf.close()
-            except:
+                with self._timed("prepare_weather"):
+                    prepared = input_cache.get(weather_file)
+            except (OSError, UnicodeDecodeError):
                 raise OSError("Weather file is invalid.")
             self.weather_file = weather_file
-            CPA = (ctypes.c_char_p * len(weatherlines))()
-            weatherline_bytes = StringList2CPA(weatherlines)
-            CPA[:] = weatherline_bytes
-            if self.lib.SetWeatherCPA(CPA, len(weatherlines)):
+            self.weather_key = prepared.key
+            loaded = self.session()
+            if loaded.get("weather") == prepared.key:
+                # loading weather resets the simulation dates to the weather's span; do the same
+                # here instead of resending the whole table
+                start, end = prepared.date_range()
+                self.send_pars_to_beepop(
+                    ["SimStart={}".format(start), "SimEnd={}".format(end)], silent=True
+                )
+                return
+            loaded.pop("weather", None)
+            loaded.pop("weather_dates", None)
+            if self.instrumentation is not None:
+                self.instrumentation.add_bytes("send_weather", prepared.size)
+                self.instrumentation.count("weather_lines", len(prepared))
+            with self._timed("send_weather"):
+                weather_loaded = self.lib.SetWeatherCPA(prepared.array, len(prepared))
+            if weather_loaded:
+                loaded["weather"] = prepared.key
+                start, end = prepared.date_range()  # BeePop+ resets the dates to the span
+                loaded["weather_dates"] = (start, end)
+                loaded["parameters"].update(simstart=start, simend=end)
                 if self.verbose:
                     print("Loaded Weather")
             else:
@@ -186,75 +378,209 @@ class BeePopModel:
         else:
             raise TypeError("Cannot set weather file to None")
 
+    def load_weather_array(self, dates, tmax, tmin, tavg, wind, rain, daylight=None, decimals=2):
+        """Load daily weather series held as arrays, without writing a weather file.
+
+        See inputs.format_weather_arrays for the arguments. The formatted weather is cached
+        like a file, and can be passed on as `self.weather_file` to batch runs.
+        """
+        with self._timed("prepare_weather"):
+            prepared = format_weather_arrays(
+                dates, tmax, tmin, tavg, wind, rain, daylight=daylight, decimals=decimals
+            )
+        self.load_weather(prepared)
+
+    def load_contam_array(self, dates, nectar, pollen, significant_digits=6):
+        """Load daily pesticide residue series held as arrays, without writing a residue file.
+
+        See inputs.format_residue_arrays for the arguments.
+        """
+        with self._timed("prepare_residue"):
+            prepared = format_residue_arrays(
+                dates, nectar, pollen, significant_digits=significant_digits
+            )
+        self.load_contam_file(prepared)
+
     def load_contam_file(self, contam_file):
-        """Load a csv or comma separated txt of pesticide residues in pollen/nectar using the library interface."""
+        """Load pesticide residues in pollen/nectar using the library interface.
+
+        The residues can be a csv or comma separated txt file, or an in-memory DataFrame, 2-D
+        NumPy array or list of lines. Prepared inputs are cached, and the table is not resent
+        if the same residues are already loaded.
+        """
         try:
-            ct = open(contam_file)
-            contamlines = ct.readlines()
-            ct.close()
+            with self._timed("prepare_residue"):
+                prepared = input_cache.get(contam_file)
             self.contam_file = contam_file
-        except:
+            self.residue_key = prepared.key
+        except (OSError, UnicodeDecodeError):
             raise OSError("Residue file is invalid.")
-        CPA = (ctypes.c_char_p * len(contamlines))()
-        contamlines_bytes = StringList2CPA(contamlines)
-        CPA[:] = contamlines_bytes
-        if self.lib.SetContaminationTableCPA(CPA, len(contamlines)):
-            if self.verbose:
-                print("Loaded residue file")
-        else:
-            raise RuntimeError("Error loading residue file")
+        loaded = self.session()
+        if loaded.get("residue") != prepared.key:
+            loaded.pop("residue", None)
+            if self.instrumentation is not None:
+                self.instrumentation.add_bytes("send_residue", prepared.size)
+                self.instrumentation.count("residue_lines", len(prepared))
+            with self._timed("send_residue"):
+                residue_loaded = self.lib.SetContaminationTableCPA(prepared.array, len(prepared))
+            if residue_loaded:
+                loaded["residue"] = prepared.key
+                if self.verbose:
+                    print("Loaded residue file")
+            else:
+                raise RuntimeError("Error loading residue file")
         self.send_pars_to_beepop(["NecPolFileEnable=true"], silent=True)  # enable residue files
 
     def set_latitude(self, latitude):
         """Set the latitude for calculation of day length using the library interface."""
         c_double_lat = ctypes.c_double(latitude)
         if self.lib.SetLatitude(c_double_lat):
+            self.latitude = float(latitude)
             if self.verbose:
                 print("Set Latitude to: {}".format(latitude))
         else:
             print("Error setting latitude")
 
-    def run_beepop(self):
+    def cache_key(self):
+        """Return the result cache key of a run with the current library, parameters and inputs.
+
+        The key is built from the parameter values the library session holds, which can differ
+        from this object's record, e.g. after loading weather resets the simulation dates.
+        """
+        if self._version is None:
+            self._version = self.get_version()
+        residue_key = self.residue_key if self.contam_file is not None else None
+        return result_key(
+            self._version,
+            self.session()["parameters"],
+            self.weather_key,
+            residue_key,
+            self.latitude,
+        )
+
+    def run_beepop(self, columns=None, start=None, end=None, reducer=None):
         """Run the BeePop+ model once using the previously set parameters and weather.
 
+        If the model has a result cache and the same simulation has been run before, the cached
+        results are returned without running BeePop+.
+
+        Args:
+            columns (list, optional): Output columns to return. "Date" is always included.
+                Defaults to None (all columns).
+            start (optional): First date of the output, as an MM/DD/YYYY string, a date or a
+                datetime64. The initial conditions row is dropped when a window is given.
+                Defaults to None.
+            end (optional): Last date of the output. Defaults to None.
+            reducer (callable, optional): Function applied to the decoded BeePopResults (which
+                can be indexed by column name like a DataFrame). Its return value is returned
+                instead of a DataFrame, which is then never built. Defaults to None.
+
         Raises:
             RuntimeError: If BeePop+ passes an error code when running the simulation.
+            ValueError: If a column is not a BeePop+ output column.
 
         Returns:
-            DataFrame: A pandas DataFrame of daily BeePop+ outputs.
+            DataFrame: A pandas DataFrame of daily BeePop+ outputs, or the reducer's result.
         """
-        if self.lib.RunSimulation():
+        if self.instrumentation is None:
+            return self._run_beepop(columns, start, end, reducer)
+        try:
+            return self._run_beepop(columns, start, end, reducer)
+        finally:  # a failed run is closed too, so its timings do not count towards the next
+            self.instrumentation.finish_run()
+
+    def _run_beepop(self, columns, start, end, reducer):
+        subset = columns is not None or start is not None or end is not None
+        if subset:
+            output_columns(columns)  # check the names before running
+        key = None
+        if self.result_cache is not None and self.weather_key is not None:
+            with self._timed("cache_lookup"):
+                key = self.cache_key()
+                if subset or reducer is not None:
+                    cached = self.result_cache.get(key)
+                else:
+                    cached = self.result_cache.get_dataframe(key)
+            if cached is not None:
+                self.lib_status = 1
+                if subset or reducer is not None:
+                    self._finish_results(cached.select(columns, start, end), reducer, copy=True)
+                else:
+                    self.result_arrays, self.results = cached
+                if self.instrumentation is not None:
+                    self.instrumentation.mark_cached()
+                return self.results
+        with self._timed("simulate"):
+            simulated = self.lib.RunSimulation()
+        if simulated:
             self.lib_status = 1
         else:
             self.lib_status = 2
             raise RuntimeError("Error running BeePop+ simulation.")
         # fetch results
-        theCount = ctypes.c_int(0)
-        p_Results = ctypes.POINTER(ctypes.c_char_p)()
-        if self.lib.GetResultsCPA(ctypes.byref(p_Results), ctypes.byref(theCount)):
-            # store results
-            n_result_lines = int(theCount.value)
-            self.lib.ClearResultsBuffer()
-            out_lines = []
-            for j in range(0, n_result_lines - 1):
-                out_lines.append(p_Results[j].decode("utf-8", errors="strict"))
-            out_str = io.StringIO("\n".join(out_lines))
-            out_df = pd.read_csv(
-                out_str, sep="\\s+", skiprows=3, names=colnames, dtype={"Date": str}
-            )
-            self.results = out_df
+        with self._timed("fetch_results"):
+            result_lines = self.get_result_lines()
+        if result_lines is not None:
+            if self.instrumentation is not None:
+                self.instrumentation.add_bytes("fetch_results", sum(map(len, result_lines)))
+                self.instrumentation.count("result_lines", len(result_lines))
+            # skip the header lines; the final line is omitted as in previous releases
+            lines = result_lines[N_HEADER_LINES:-1]
+            if key is None:
+                with self._timed("decode"):
+                    result_arrays = decode_results(lines, columns, start, end)
+                self._finish_results(result_arrays, reducer, copy=False)
+            else:  # the cache keeps every column, so decode them all
+                with self._timed("decode"):
+                    result_arrays = decode_results(lines)
+                self._finish_results(
+                    result_arrays.select(columns, start, end) if subset else result_arrays,
+                    reducer,
+                    copy=True,
+                )
+                with self._timed("cache_store"):
+                    self.result_cache.put(key, result_arrays)
         else:
             print("Error running BeePop+ and fetching results.")
         self.clear_buffers()
         return self.results
 
+    def _finish_results(self, result_arrays, reducer, copy):
+        """Set the decoded results, and the DataFrame or reducer output returned for them."""
+        self.result_arrays = result_arrays
+        if reducer is not None:
+            with self._timed("reduce"):
+                self.results = reducer(result_arrays)
+        else:
+            with self._timed("dataframe"):
+                self.results = result_arrays.to_dataframe(copy=copy)
+
+    def get_result_lines(self):
+        """Fetch the raw text lines of the last simulation's results from the library.
+
+        Returns:
+            list: The result lines (including the header lines) as bytes, or None if the
+                library could not return results.
+        """
+        theCount = ctypes.c_int(0)
+        p_Results = ctypes.POINTER(ctypes.c_char_p)()
+        if not self.lib.GetResultsCPA(ctypes.byref(p_Results), ctypes.byref(theCount)):
+            return None
+        n_result_lines = int(theCount.value)
+        # copy all lines out in a single call rather than indexing the pointer per line
+        result_lines = ctypes.cast(
+            p_Results, ctypes.POINTER(ctypes.c_char_p * n_result_lines)
+        ).contents[:]
+        self.lib.ClearResultsBuffer()
+        return result_lines
+
     def write_results(self, file_path):
         """Write previously generated BeePop+ outputs to a csv file."""
         results_file = file_path
         if self.results is None:
             raise RuntimeError("There are no results to write. Please run the model first")
         self.results.to_csv(results_file, index=False)
-        if self.verbose():
+        if self.verbose:
             print("Wrote results to file")
 
     def get_errors(self):
@@ -292,9 +618,17 @@ class BeePopModel:
             raise RuntimeError("Failed to get library version")
 
     def close_library(self):
-        """Close connection to the library using CTypes."""
-        dlclose_func = ctypes.CDLL(None).dlclose
-        dlclose_func.argtypes = [ctypes.c_void_p]
-        handle = self.lib._handle
+        """Close connection to the library using CTypes.
+
+        The private copy of the library loaded for an isolated model is unloaded and freed if
+        the dynamic loader allows it. Libraries that cannot be unloaded, as with some C++
+        runtimes, keep their copy (and its memory) until the process exits, and later models
+        get a new copy. The shared library stays loaded for other models in the process.
+        """
+        if self.isolated:
+            _sessions.pop(self.lib._handle, None)  # the handle may be reused by a later load
+            _unload_library(self.lib)
+            self._release_copy()
+            self._release_copy = None
         self.lib = None
         del self.lib
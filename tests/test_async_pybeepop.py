@@ -0,0 +1,83 @@
+from pybeepop import AsyncPyBeePop, PoolFullError
+from pybeepop.pool import LibraryPool
+import pytest
+import asyncio
+import os
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.abspath(os.path.join(TEST_DIR, os.pardir))
+TEST_WEATHER = os.path.join(PROJECT_DIR, "example_data/cedar_grove_NC_weather.txt")
+
+
+def test_async_run_model():
+    async def main():
+        async with AsyncPyBeePop(pool_size=2) as model:
+            with pytest.raises(RuntimeError):
+                await model.run_model()
+            await model.load_weather(TEST_WEATHER)
+            await model.set_parameters({"SimStart": "06/16/2014", "SimEnd": "07/16/2014"})
+            with pytest.raises(ValueError):
+                await model.set_parameters({"SimEnd": "not a date"})
+            short, longer = await asyncio.gather(
+                model.run_model(),
+                model.run_model({"SimEnd": "08/16/2014"}),
+            )
+            assert len(short) < len(longer)
+            assert model.get_parameters()["simend"] == "07/16/2014"
+            results = await model.run_batch([{"ICWorkerAdults": 5000}, {"SimEnd": "bad"}])
+            assert results[0].ok and not results[1].ok
+            assert model.running == 0
+
+    asyncio.run(main())
+
+
+def test_async_parameter_file(tmp_path):
+    path = tmp_path / "parameters.txt"
+    path.write_text("# colony\nICWorkerAdults = 8000\n\nSimStart=06/16/2014\n")
+
+    async def main():
+        async with AsyncPyBeePop(parameter_file=str(path), pool_size=1) as model:
+            assert model.get_parameters() == {"icworkeradults": "8000", "simstart": "06/16/2014"}
+
+    asyncio.run(main())
+
+
+def test_async_backpressure_and_timeout():
+    async def main():
+        model = AsyncPyBeePop(weather_file=TEST_WEATHER, pool_size=1, max_queue=1)
+        await model.set_parameters({"SimStart": "01/01/2010", "SimEnd": "12/31/2014"})
+        first = asyncio.ensure_future(model.run_model())
+        await asyncio.sleep(0)
+        queued = asyncio.ensure_future(model.run_model())
+        await asyncio.sleep(0)
+        assert model.running == 1 and model.waiting == 1
+        with pytest.raises(PoolFullError):
+            await model.run_model()
+        queued.cancel()
+        with pytest.raises(asyncio.TimeoutError):
+            await model.run_model(timeout=0.001)
+        assert len(await first) > 1000
+        await model.exit()
+
+    asyncio.run(main())
+
+
+def test_async_shared_pool_queue():
+    async def main():
+        with LibraryPool(size=1) as pool:
+            first = AsyncPyBeePop(weather_file=TEST_WEATHER, pool=pool, max_queue=1)
+            second = AsyncPyBeePop(weather_file=TEST_WEATHER, pool=pool)
+            with pytest.raises(ValueError, match="wait queue of 1"):
+                AsyncPyBeePop(weather_file=TEST_WEATHER, pool=pool, max_queue=2)
+            running = asyncio.ensure_future(first.run_model())
+            await asyncio.sleep(0)
+            queued = asyncio.ensure_future(second.run_model())
+            await asyncio.sleep(0)
+            assert first.waiting == second.waiting == 1
+            with pytest.raises(PoolFullError):
+                await first.run_model()
+            assert len(await running) > 1 and len(await queued) > 1
+            await first.exit()
+            await second.exit()
+
+    asyncio.run(main())
@@ -0,0 +1,81 @@
+from pybeepop import PyBeePop, ResultCache
+from pybeepop.cache import result_key
+from pybeepop.results import BeePopResults
+import numpy as np
+import os
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.abspath(os.path.join(TEST_DIR, os.pardir))
+TEST_WEATHER = os.path.join(PROJECT_DIR, "example_data/cedar_grove_NC_weather.txt")
+RUN_PARAMETERS = {"SimStart": "06/16/2014", "SimEnd": "08/16/2014", "ICWorkerAdults": 10000}
+
+
+def test_result_key_normalizes_parameters():
+    key = result_key("1", {"ICWorkerAdults": 10000, "SimStart": "6/1/2014"}, "weather")
+    same = {"icworkeradults": "10000.0", "SimStart": "06/01/2014"}
+    assert key == result_key("1", same, "weather")
+    assert key != result_key("2", {"ICWorkerAdults": 10000, "SimStart": "6/1/2014"}, "weather")
+    assert key != result_key("1", {"ICWorkerAdults": 10001, "SimStart": "6/1/2014"}, "weather")
+    assert key != result_key("1", {"ICWorkerAdults": 10000, "SimStart": "6/1/2014"}, "other")
+
+
+def test_cached_run_model(tmp_path):
+    cache = ResultCache(directory=tmp_path)
+    beepop = PyBeePop(weather_file=TEST_WEATHER, result_cache=cache)
+    beepop.set_parameters(RUN_PARAMETERS)
+    first = beepop.run_model()
+    first_copy = first.copy()
+    first.loc[1, "Colony Size"] = -1  # changing an output must not change the cache
+    second = beepop.run_model()
+    assert second.equals(first_copy)
+    assert cache.stats()["memory_hits"] == 1 and cache.stats()["misses"] == 1
+    beepop.set_parameters({"ICWorkerAdults": 12000})
+    beepop.run_model()
+    assert cache.stats()["misses"] == 2
+
+    disk_cache = ResultCache(directory=tmp_path)  # e.g. a new session
+    other = PyBeePop(weather_file=TEST_WEATHER, result_cache=disk_cache)
+    other.set_parameters(RUN_PARAMETERS)
+    assert other.run_model().equals(first_copy)
+    assert disk_cache.stats()["disk_hits"] == 1
+    assert disk_cache.stats()["disk_entries"] == 2
+
+
+def test_cache_key_follows_library_dates(tmp_path):
+    cache = ResultCache(directory=tmp_path)
+    first = PyBeePop(result_cache=cache)
+    first.set_parameters({"SimStart": "06/16/2014", "SimEnd": "07/16/2014"})
+    first.load_weather(TEST_WEATHER)  # resets the dates to the span of the weather
+    assert len(first.run_model()) == 4383
+    second = PyBeePop(result_cache=cache)
+    second.load_weather(TEST_WEATHER)
+    second.set_parameters({"SimStart": "06/16/2014", "SimEnd": "07/16/2014"})
+    assert len(second.run_model()) == 31
+    assert cache.stats()["misses"] == 2
+
+
+def test_cache_key_after_reset(tmp_path):
+    cache = ResultCache(directory=tmp_path)
+    beepop = PyBeePop(weather_file=TEST_WEATHER, result_cache=cache)
+    beepop.set_parameters({"SimStart": "06/16/2015", "SimEnd": "07/16/2015"})
+    assert beepop.run_model()["Date"].iloc[-1] == "07/15/2015"
+    beepop.reset_parameters()  # the dates return to the span of the weather
+    assert len(beepop.run_model()) == 4383
+    beepop.set_parameters({"SimStart": "06/16/2014", "SimEnd": "07/26/2014"})
+    assert beepop.run_model()["Date"].iloc[-1] == "07/25/2014"
+    beepop.reset_parameters()
+    beepop.set_parameters({"SimStart": "06/16/2015", "SimEnd": "07/16/2015"})
+    assert beepop.run_model()["Date"].iloc[-1] == "07/15/2015"
+    assert cache.stats()["misses"] == 3
+
+
+def test_cache_eviction(tmp_path):
+    columns = {"Date": np.array(["Initial"], dtype=object), "Colony Size": np.zeros(1000)}
+    results = BeePopResults(columns, np.array(["NaT"], dtype="datetime64[D]"))
+    cache = ResultCache(max_entries=2, directory=tmp_path, max_disk_bytes=20000)
+    for key in "abc":
+        cache.put(key, results)
+    assert len(cache) == 2 and cache.get("b") is not None
+    assert cache.stats()["disk_bytes"] <= 20000
+    cache.clear()
+    assert len(cache) == 0 and cache.stats()["disk_entries"] == 0
@@ -0,0 +1,79 @@
+from pybeepop import PyBeePop
+from pybeepop.calibration import calibrate, rmse
+import numpy as np
+import pytest
+import os
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.abspath(os.path.join(TEST_DIR, os.pardir))
+
+
+def test_calibrate_recovers_colony_size(tmp_path):
+    weather = os.path.join(PROJECT_DIR, "example_data/cedar_grove_NC_weather.txt")
+    beepop = PyBeePop(weather_file=weather)
+    beepop.set_parameters({"SimStart": "06/16/2014", "SimEnd": "08/16/2014"})
+    truth = PyBeePop(weather_file=weather)
+    truth.set_parameters(
+        {"SimStart": "06/16/2014", "SimEnd": "08/16/2014", "ICWorkerAdults": 12000}
+    )
+    output = truth.run_model()
+    observed = output.iloc[1::10][["Date", "Colony Size"]].reset_index(drop=True)
+    observed.loc[2, "Colony Size"] = np.nan  # a missed count
+
+    checkpoint = str(tmp_path / "calibration.pkl")
+    options = dict(
+        bounds={"ICWorkerAdults": (2000, 30000)},
+        population_size=6,
+        seed=1,
+        checkpoint=checkpoint,
+        n_workers=1,
+    )
+    generations = []
+    result = calibrate(
+        beepop,
+        ["ICWorkerAdults"],
+        observed,
+        generations=3,
+        callback=lambda *args: generations.append(args[0]),
+        **options
+    )
+    assert generations == [1, 2, 3]
+    assert len(result.history) == 4
+    assert all(a >= b for a, b in zip(result.history, result.history[1:]))
+    assert result.evaluations <= 6 * 4
+    frame = result.to_dataframe()
+    assert frame["loss"].iloc[0] == result.loss
+    assert result.parameters == {"ICWorkerAdults": int(frame["ICWorkerAdults"].iloc[0])}
+
+    # rerunning with the checkpoint continues from generation 3
+    resumed = calibrate(beepop, ["ICWorkerAdults"], observed, generations=8, **options)
+    assert resumed.history[:4] == result.history
+    assert len(resumed.history) == 9 and resumed.loss <= result.loss
+    assert abs(resumed.parameters["ICWorkerAdults"] - 12000) < 3000
+
+    check = PyBeePop(weather_file=weather)
+    check.set_parameters({"SimStart": "06/16/2014", "SimEnd": "08/16/2014"})
+    check.set_parameters(resumed.parameters)
+    simulated = check.run_model().iloc[1::10]["Colony Size"].to_numpy()
+    present = ~np.isnan(observed["Colony Size"].to_numpy())
+    expected = rmse(simulated[present], observed["Colony Size"].to_numpy()[present])
+    assert resumed.loss == pytest.approx(expected, rel=0.05, abs=50)
+
+    with pytest.raises(ValueError):
+        calibrate(beepop, ["ICWorkerAdults", "AIAdultLD50"], observed, **options)
+    with pytest.raises(ValueError):
+        calibrate(beepop, ["ICWorkerAdults"], observed, loss="huber", bounds=options["bounds"])
+    late = observed.copy()
+    late.loc[len(late)] = ["08/20/2014", 15000]
+    with pytest.raises(ValueError, match="2014-08-20 are outside the simulated dates"):
+        calibrate(beepop, ["ICWorkerAdults"], late, bounds=options["bounds"])
+    with pytest.raises(ValueError, match="No candidate of the initial population"):
+        calibrate(
+            beepop,
+            ["ICWorkerAdults"],
+            observed,
+            loss=lambda simulated, observed: np.full(len(simulated), np.nan),
+            bounds=options["bounds"],
+            population_size=5,
+            n_workers=1,
+        )
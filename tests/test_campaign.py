@@ -0,0 +1,73 @@
+from pybeepop import PyBeePop, Campaign
+from pybeepop.sensitivity import SummaryReducer
+import pytest
+import sqlite3
+import time
+import os
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.abspath(os.path.join(TEST_DIR, os.pardir))
+
+
+def attempts(path):
+    with sqlite3.connect(path) as connection:
+        return dict(connection.execute("SELECT id, attempts FROM scenarios"))
+
+
+def test_campaign_resumes(tmp_path):
+    weather = os.path.join(PROJECT_DIR, "example_data/cedar_grove_NC_weather.txt")
+    beepop = PyBeePop(weather_file=weather)
+    beepop.set_parameters({"SimStart": "06/16/2014", "SimEnd": "07/16/2014"})
+    scenarios = {
+        "small": {"ICWorkerAdults": 5000},
+        "bad": {"Invalid_parameter": 1234},
+        "large": {"ICWorkerAdults": 23000},
+    }
+    path = str(tmp_path / "campaign.sqlite")
+    reducer = SummaryReducer(["final_colony_size"])
+    with Campaign(path, max_retries=1, checkpoint_every=1) as campaign:
+        status = campaign.run(beepop, scenarios, n_workers=1, reducer=reducer)
+        assert status == {"pending": 0, "done": 2, "failed": 1}
+        failures = campaign.failures()
+        assert [f.scenario_id for f in failures] == ["bad"]
+        assert "ValueError" in failures[0].error
+        outputs = dict((r.scenario_id, r.output) for r in campaign.results())
+        assert sorted(outputs) == ["large", "small"]
+        assert outputs["large"][0] > 0
+    assert attempts(path) == {'"small"': 1, '"bad"': 2, '"large"': 1}
+
+    # a rerun skips completed scenarios and failures that used up their retries
+    with Campaign(path, max_retries=1) as campaign:
+        campaign.run(beepop, scenarios, n_workers=1, reducer=reducer)
+        assert attempts(path) == {'"small"': 1, '"bad"': 2, '"large"': 1}
+        campaign.add({"medium": {"ICWorkerAdults": 10000}})
+        campaign.retry_failed()
+        assert campaign.run(beepop, n_workers=1, reducer=reducer)["done"] == 3
+        assert attempts(path) == {'"small"': 1, '"bad"': 2, '"large"': 1, '"medium"': 1}
+        assert len(campaign) == 4
+
+
+def exit_on_7777(output):
+    if output["Colony Size"].iloc[0] == 7777:
+        os._exit(1)  # the worker process dies
+    if output["Colony Size"].iloc[0] == 9000:
+        time.sleep(2)  # still running in the other worker when the first one dies
+    return output["Colony Size"].iloc[-1]
+
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_campaign_survives_worker_crash(tmp_path, n_workers):
+    weather = os.path.join(PROJECT_DIR, "example_data/cedar_grove_NC_weather.txt")
+    beepop = PyBeePop(weather_file=weather)
+    beepop.set_parameters({"SimStart": "06/16/2014", "SimEnd": "07/16/2014"})
+    scenarios = [{"ICWorkerAdults": 9000}, {"ICWorkerAdults": 7777}, {"ICWorkerAdults": 5000}]
+    path = str(tmp_path / "campaign.sqlite")
+    with Campaign(path, max_retries=1) as campaign:
+        status = campaign.run(beepop, scenarios, n_workers=n_workers, reducer=exit_on_7777)
+        assert status == {"pending": 0, "done": 2, "failed": 1}
+        failures = campaign.failures()
+        assert [f.scenario_id for f in failures] == [1]
+        assert "ChildProcessError" in failures[0].error
+        with pytest.raises(ValueError):  # scenario 0 with other parameters
+            campaign.add([{"ICWorkerAdults": 1}])
+    assert attempts(path) == {"0": 1, "1": 2, "2": 1}
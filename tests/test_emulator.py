@@ -0,0 +1,71 @@
+from pybeepop import PyBeePop
+from pybeepop.emulator import Emulator, TrajectoryReducer
+import numpy as np
+import pytest
+import os
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.abspath(os.path.join(TEST_DIR, os.pardir))
+
+
+def test_fit_quadratic_trajectories(tmp_path):
+    rng = np.random.default_rng(0)
+    samples = rng.uniform([0, 10], [100, 20], size=(40, 2))
+    days = np.arange(30)
+    trajectories = samples[:, :1] * days + (samples[:, 1:] ** 2) * np.sqrt(days)
+    bounds = {"AIAdultLD50": (0, 100), "EAppRate": (10, 20)}
+    emulator = Emulator.fit(["AIAdultLD50", "EAppRate"], samples, trajectories, bounds, seed=0)
+    assert emulator.n_components == 2
+    assert emulator.errors["relative_rmse"] < 1e-4
+    assert emulator.errors["n_test"] == 8
+    query = {"eapprate": 15, "AIAdultLD50": 50}
+    expected = 50 * days + 225 * np.sqrt(days)
+    np.testing.assert_allclose(emulator.predict(query), expected, atol=0.1)
+    assert emulator.predict(samples).shape == (40, 30)
+    assert emulator.in_domain(query)
+    assert not emulator.in_domain({"AIAdultLD50": 50})
+    assert not emulator.in_domain({"AIAdultLD50": 50, "EAppRate": 25})
+    with pytest.raises(ValueError, match="outside the training domain"):
+        emulator.query({"AIAdultLD50": 50, "EAppRate": 25})
+
+    path = str(tmp_path / "emulator.npz")
+    emulator.save(path)
+    loaded = Emulator.load(path)
+    np.testing.assert_array_equal(loaded.predict(query), emulator.predict(query))
+    assert loaded.errors["rmse"] == emulator.errors["rmse"]
+    np.testing.assert_array_equal(loaded.errors["daily_rmse"], emulator.errors["daily_rmse"])
+
+
+def test_trajectory_reducer_initial_row():
+    output = {"Date": np.array(["Initial", "06/16/2014", "06/17/2014"]), "Colony Size": [1, 2, 3]}
+    reducer = TrajectoryReducer()
+    assert reducer(output).tolist() == [2, 3]
+    windowed = {name: column[1:] for name, column in output.items()}  # e.g. start= was given
+    assert reducer(windowed).tolist() == [2, 3]
+
+
+def test_train_colony_size_emulator():
+    weather = os.path.join(PROJECT_DIR, "example_data/cedar_grove_NC_weather.txt")
+    beepop = PyBeePop(weather_file=weather)
+    beepop.set_parameters({"SimStart": "06/16/2014", "SimEnd": "08/16/2014"})
+    emulator = Emulator.train(
+        beepop,
+        ["ICWorkerAdults", "ICQueenStrength"],
+        n_samples=30,
+        bounds={"ICWorkerAdults": (5000, 25000)},
+        seed=1,
+        n_workers=2,
+    )
+    assert emulator.base_parameters == {"simstart": "06/16/2014", "simend": "08/16/2014"}
+    assert emulator.errors["relative_rmse"] < 0.05
+
+    query = {"ICWorkerAdults": 12000, "ICQueenStrength": 3}
+    emulated, rmse = emulator.query(query)
+    assert rmse == emulator.errors["rmse"]
+    beepop.set_parameters(query)
+    actual = beepop.run_model()["Colony Size"].to_numpy()[1:]
+    assert np.sqrt(np.mean((emulated - actual) ** 2)) < 0.05 * actual.mean()
+
+    simulated, rmse = emulator.query({"ICWorkerAdults": 40000, "ICQueenStrength": 3}, beepop)
+    assert rmse == 0.0
+    assert len(simulated) == len(actual)
@@ -0,0 +1,65 @@
+from pybeepop import PyBeePop, Ensemble
+from pybeepop.batch import ScenarioResult
+import numpy as np
+import pandas as pd
+import pytest
+import os
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.abspath(os.path.join(TEST_DIR, os.pardir))
+
+
+def test_ensemble_statistics():
+    weather = os.path.join(PROJECT_DIR, "example_data/cedar_grove_NC_weather.txt")
+    beepop = PyBeePop(weather_file=weather)
+    beepop.set_parameters({"SimStart": "06/16/2014", "SimEnd": "09/16/2014"})
+    scenarios = dict(("w{}".format(n), {"ICWorkerAdults": n}) for n in (500, 5000, 15000, 25000))
+    scenarios["bad"] = {"SimEnd": "bad"}
+    columns = ["Colony Size", "Adult Workers", "Forage Day"]
+    results = beepop.run_batch(scenarios, n_workers=2, columns=columns)
+
+    ensemble = Ensemble.from_results(results)
+    assert ensemble.shape == (4, 92, 2)
+    assert ensemble.variables == ["Colony Size", "Adult Workers"]
+    assert ensemble.scenario_ids == ["w500", "w5000", "w15000", "w25000"]
+    assert list(ensemble.failures) == ["bad"]
+    assert ensemble.dates[0] == np.datetime64("2014-06-16")
+
+    frames = [r.output.iloc[1:] for r in results if r.ok]
+    sizes = np.stack([frame["Colony Size"].to_numpy() for frame in frames])
+    np.testing.assert_array_equal(ensemble["Colony Size"], sizes)
+    np.testing.assert_allclose(ensemble.mean("Colony Size"), sizes.mean(axis=0))
+    np.testing.assert_allclose(
+        ensemble.quantile([0.1, 0.9], "Colony Size"), np.quantile(sizes, [0.1, 0.9], axis=0)
+    )
+    assert ensemble.quantile(0.5).shape == (92, 2)
+    np.testing.assert_allclose(
+        ensemble.exceedance(10000, "Colony Size"), (sizes > 10000).mean(axis=0)
+    )
+    threshold = sizes[1, 0] + 1
+    crossed = ensemble.time_to_threshold(threshold, "Colony Size", below=False)
+    for days, row in zip(crossed, sizes):
+        above = np.flatnonzero(row > threshold)
+        assert (np.isnan(days) and not len(above)) or days == above[0]
+
+    summary = ensemble.summary("Colony Size", quantiles=(0.5,))
+    assert list(summary.columns) == ["mean", "q0.5"]
+    assert summary.index[0] == pd.Timestamp("2014-06-16")
+
+    # streamed, single precision and label-based selection
+    stream = ((r.scenario_id, r.output) for r in results if r.ok)
+    single = Ensemble.from_results(stream, variables=["Colony Size"], dtype=np.float32)
+    assert single.data.dtype == np.float32 and single.shape == (4, 92, 1)
+    assert single.nbytes == 4 * 92 * 4
+    window = ensemble.sel(
+        "Colony Size", start="07/01/2014", end="07/31/2014", scenarios=["w25000", "w500"]
+    )
+    assert window.shape == (2, 31, 1)
+    np.testing.assert_array_equal(window["Colony Size"][0], sizes[3, 15:46])
+    with pytest.raises(KeyError):
+        ensemble["Forage Day"]
+    with pytest.raises(ValueError):
+        Ensemble.from_results(results, variables=["Forage Day"])
+    short = ScenarioResult("short", output=frames[0].iloc[:10])
+    with pytest.raises(ValueError):
+        Ensemble.from_results([results[0], short])
@@ -0,0 +1,56 @@
+from pybeepop import PyBeePop, ProcessExecutor, SocketExecutor, run_worker
+from pybeepop.sensitivity import SummaryReducer
+import multiprocessing
+import pytest
+import os
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.abspath(os.path.join(TEST_DIR, os.pardir))
+AUTHKEY = b"pybeepop-test"
+
+
+def start_workers(executor, n):
+    workers = [
+        multiprocessing.Process(target=run_worker, args=(executor.address, AUTHKEY), daemon=True)
+        for _ in range(n)
+    ]
+    for worker in workers:
+        worker.start()
+    return workers
+
+
+def test_socket_executor_matches_process_executor():
+    weather = os.path.join(PROJECT_DIR, "example_data/cedar_grove_NC_weather.txt")
+    beepop = PyBeePop(weather_file=weather)
+    beepop.set_parameters({"SimStart": "06/16/2014", "SimEnd": "07/16/2014"})
+    scenarios = {
+        "small": {"ICWorkerAdults": 5000},
+        "bad": {"Invalid_parameter": 1234},
+        "large": {"ICWorkerAdults": 23000},
+    }
+    reducer = SummaryReducer(["final_colony_size"])
+    with ProcessExecutor(n_workers=1) as executor:
+        expected = beepop.run_batch(scenarios, reducer=reducer, executor=executor)
+    with SocketExecutor(authkey=AUTHKEY) as executor:
+        workers = start_workers(executor, 2)
+        results = beepop.run_batch(scenarios, reducer=reducer, executor=executor)
+        assert len(executor) == 2
+        # the second batch reuses the weather the workers already hold
+        again = beepop.run_batch(
+            [{"ICWorkerAdults": 5000}], executor=executor, columns=["Colony Size"]
+        )
+    for worker in workers:
+        worker.join(timeout=10)
+        assert worker.exitcode == 0
+    assert [r.scenario_id for r in results] == ["small", "bad", "large"]
+    assert [r.ok for r in results] == [True, False, True]
+    assert "ValueError" in results[1].error
+    assert results[0].output == expected[0].output
+    assert results[2].output == expected[2].output
+    assert list(again[0].output.columns) == ["Date", "Colony Size"]
+    assert again[0].output["Colony Size"].iloc[-1] == results[0].output[0]
+
+
+def test_socket_executor_requires_authkey():
+    with pytest.raises(ValueError):
+        SocketExecutor()
@@ -0,0 +1,53 @@
+from pybeepop import PyBeePop, LibraryPool, tools
+import pytest
+import os
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.abspath(os.path.join(TEST_DIR, os.pardir))
+TEST_WEATHER = os.path.join(PROJECT_DIR, "example_data/cedar_grove_NC_weather.txt")
+
+
+def test_isolated_instances():
+    first = PyBeePop(weather_file=TEST_WEATHER, isolated=True)
+    second = PyBeePop(weather_file=TEST_WEATHER, isolated=True)
+    assert first.beepop.lib._handle != second.beepop.lib._handle
+    first.set_parameters({"SimStart": "06/16/2014", "SimEnd": "07/16/2014"})
+    second.set_parameters({"SimStart": "06/16/2014", "SimEnd": "08/16/2014"})
+    assert len(first.run_model()) < len(second.run_model())
+    first.exit()
+    second.exit()
+
+
+def test_reopened_isolated_copy():
+    first = PyBeePop(weather_file=TEST_WEATHER, isolated=True)
+    first.set_parameters({"SimStart": "06/16/2014", "SimEnd": "07/16/2014"})
+    closed = first.beepop.lib._name
+    first.exit()
+    # a copy the loader could not unload is kept, so that a new copy is not handed its state
+    assert tools._is_loaded(closed) == (closed in tools._retained_copies)
+    second = PyBeePop(weather_file=TEST_WEATHER, isolated=True)
+    assert second.beepop.lib._name not in tools._retained_copies
+    second.set_parameters({"SimStart": "06/16/2014", "SimEnd": "08/16/2014"})
+    assert len(second.run_model()) == 62
+    second.exit()
+
+
+def test_library_pool():
+    scenarios = {
+        "short": {"SimEnd": "07/16/2014"},
+        "long": {"SimEnd": "08/16/2014"},
+        "invalid": {"SimEnd": "not a date"},
+    }
+    with LibraryPool(size=2) as pool:
+        results = pool.map(scenarios, TEST_WEATHER, parameters={"SimStart": "06/16/2014"})
+        assert [result.scenario_id for result in results] == ["short", "long", "invalid"]
+        assert len(results[0].output) < len(results[1].output)
+        assert not results[2].ok
+        assert len(pool) <= 2
+        with pool.model() as first, pool.model() as second:
+            assert first is not second
+            with pytest.raises(TimeoutError):
+                pool.acquire(timeout=0.01)
+    assert len(pool) == 0
+    with pytest.raises(RuntimeError):
+        pool.acquire()
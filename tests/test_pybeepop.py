@@ -1,7 +1,11 @@
 from pybeepop import PyBeePop
+from pybeepop.batch import BatchWorker
+from pybeepop.results import N_HEADER_LINES
 import pytest
 import numpy as np
 import os
+import sys
+import subprocess
 import pandas as pd
 
 TEST_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -89,3 +93,197 @@ def test_run_model():
     assert results_last["Adult Drones"] == 512
     assert results_last["Average Temperature (C)"] == 16.66
     assert results_last["Rain (mm)"] == 0.0
+
+
+def test_run_batch():
+    beepop = PyBeePop()
+    weather = os.path.join(PROJECT_DIR, "example_data/cedar_grove_NC_weather.txt")
+    beepop.load_weather(weather)
+    beepop.set_parameters({"SimStart": "06/16/2014", "SimEnd": "10/10/2014"})
+    scenarios = {
+        "small": {"ICWorkerAdults": 5000},
+        "bad": {"Invalid_parameter": 1234},
+        "large": {"ICWorkerAdults": 23000},
+    }
+    results = beepop.run_batch(scenarios, n_workers=2)
+    assert [r.scenario_id for r in results] == ["small", "bad", "large"]
+    assert results[0].ok and results[2].ok
+    assert not results[1].ok
+    assert "ValueError" in results[1].error
+    assert results[0].output.iloc[0]["Colony Size"] == 5000
+    assert results[2].output.iloc[0]["Colony Size"] == 23000
+    assert results[2].output.iloc[len(results[2].output) - 1]["Date"] == "10/09/2014"
+
+
+def test_batch_worker_scenarios_do_not_leak_dates():
+    weather = os.path.join(PROJECT_DIR, "example_data/cedar_grove_NC_weather.txt")
+    worker = BatchWorker(PyBeePop().lib_file, weather)
+    dated = worker.run(0, {"SimStart": "06/16/2014", "SimEnd": "07/10/2014"})
+    undated = worker.run(1, {"ICWorkerAdults": 12000})
+    fresh = BatchWorker(PyBeePop().lib_file, weather).run(1, {"ICWorkerAdults": 12000})
+    assert len(dated.output) == 25
+    assert len(undated.output) == len(fresh.output) == 4383
+
+
+def test_weather_inputs_are_cached():
+    from pybeepop.inputs import input_cache
+
+    weather = os.path.join(PROJECT_DIR, "example_data/cedar_grove_NC_weather.txt")
+    beepop = PyBeePop()
+    beepop.set_parameters({"SimStart": "06/01/2014", "SimEnd": "07/01/2014"})
+    beepop.load_weather(weather)
+    hits = input_cache.hits
+    beepop.load_weather(weather)
+    assert input_cache.hits == hits + 1
+    from_file = beepop.run_model()
+
+    # the same weather given in memory
+    weather_df = pd.read_csv(weather, header=None)
+    beepop.load_weather(weather_df)
+    from_df = beepop.run_model()
+    assert list(from_df["Date"]) == list(from_file["Date"])
+    assert list(from_df["Max Temp (C)"]) == list(from_file["Max Temp (C)"])
+    with open(weather) as f:
+        beepop.load_weather(f.readlines())
+    assert beepop.run_model()["Rain (mm)"].equals(from_file["Rain (mm)"])
+
+
+def test_parameter_values_are_validated():
+    beepop = PyBeePop()
+    with pytest.raises(ValueError):
+        beepop.set_parameters({"ICWorkerAdults": "many"})
+    with pytest.raises(ValueError):
+        beepop.set_parameters({"SimStart": "2020-01-01"})
+    with pytest.raises(ValueError):
+        beepop.set_parameters({"RQEnableReQueen": "maybe"})
+    assert beepop.get_parameters() == {}
+    with pytest.warns(UserWarning):
+        beepop.set_parameters({"ICWorkerAdults": -5})
+
+
+def test_only_changed_parameters_are_sent():
+    beepop = PyBeePop()
+    sent = []
+    send = beepop.beepop.send_pars_to_beepop
+    beepop.beepop.send_pars_to_beepop = lambda pars, silent=False: (sent.append(pars), send(pars))
+    beepop.set_parameters({"ICWorkerAdults": 9999, "ICWorkerBrood": 8000})
+    beepop.set_parameters({"ICWorkerAdults": 9999, "ICWorkerBrood": 7000})
+    beepop.set_parameters({"icworkeradults": 9999})
+    assert sent == [["icworkeradults=9999", "icworkerbrood=8000"], ["icworkerbrood=7000"]]
+
+
+def test_reset_parameters():
+    test_weather = os.path.join(PROJECT_DIR, "example_data/cedar_grove_NC_weather.txt")
+    beepop = PyBeePop(weather_file=test_weather)
+    beepop.set_parameters(
+        {"ICWorkerAdults": 9999, "SimStart": "06/16/2014", "SimEnd": "07/16/2014"}
+    )
+    short_run = beepop.run_model()
+    beepop.reset_parameters()
+    assert beepop.get_parameters() == {}
+    assert len(beepop.run_model()) == 4383  # the dates return to the span of the weather
+    beepop.set_parameters({"SimStart": "06/16/2014", "SimEnd": "07/16/2014"})
+    assert len(beepop.run_model()) == len(short_run)
+    beepop.reset_parameters()
+    beepop.set_parameters({"SimStart": "06/16/2014", "SimEnd": "08/16/2014"})
+    longer_run = beepop.run_model()
+    assert len(longer_run) > len(short_run)
+    assert longer_run["Adult Workers"].iloc[1] != short_run["Adult Workers"].iloc[1]
+
+
+def test_instrumentation():
+    test_weather = os.path.join(PROJECT_DIR, "example_data/cedar_grove_NC_weather.txt")
+    beepop = PyBeePop()
+    assert beepop.last_run_stats() is None
+    completed = []
+    beepop.enable_instrumentation(callbacks=[completed.append])
+    beepop.load_weather(test_weather)
+    beepop.set_parameters({"SimStart": "06/16/2014", "SimEnd": "07/16/2014"})
+    beepop.run_model()
+    stats = beepop.last_run_stats()
+    for phase in ["prepare_weather", "send_parameters", "simulate", "fetch_results", "decode"]:
+        assert stats["phases"][phase] >= 0
+    assert stats["counts"]["result_lines"] == N_HEADER_LINES + len(beepop.get_output()) + 1
+    assert stats["bytes"]["fetch_results"] > 0
+    beepop.run_model()
+    second = beepop.last_run_stats()
+    assert "prepare_weather" not in second["phases"]
+    assert beepop.run_stats()["runs"] == 2 and len(completed) == 2
+    with pytest.raises(ZeroDivisionError):  # a failed run is closed with its own stats
+        beepop.run_model(reducer=lambda results: 1 / 0)
+    assert beepop.run_stats()["runs"] == 3
+    beepop.run_model()
+    assert beepop.last_run_stats()["counts"] == second["counts"]
+    beepop.disable_instrumentation()
+    beepop.run_model()
+    assert beepop.run_stats() is None
+
+
+def test_lazy_import_and_shared_library():
+    code = (
+        "import sys; from pybeepop import PyBeePop; PyBeePop(); "
+        "assert 'pandas' not in sys.modules, 'pandas imported before a DataFrame was needed'"
+    )
+    subprocess.run([sys.executable, "-c", code], cwd=PROJECT_DIR, check=True)
+    test_parameters = os.path.join(PROJECT_DIR, "example_data/example_parameters.txt")
+    with pytest.warns(UserWarning):  # the file sets a value above a parameter's maximum
+        beepop = PyBeePop(parameter_file=test_parameters)
+    assert beepop.parameter_file == test_parameters
+    assert beepop.residue_file is None
+    assert PyBeePop().beepop.lib is beepop.beepop.lib
+
+
+def test_weather_and_residue_arrays():
+    weather = os.path.join(PROJECT_DIR, "example_data/cedar_grove_NC_weather.txt")
+    residues = os.path.join(PROJECT_DIR, "example_data/example_residue_file.txt")
+    parameters = {"SimStart": "06/01/2014", "SimEnd": "09/01/2014"}
+    beepop = PyBeePop(weather_file=weather, residue_file=residues)
+    beepop.set_parameters(parameters)
+    from_files = beepop.run_model()
+
+    weather_df = pd.read_csv(weather, header=None)
+    residue_df = pd.read_csv(residues, header=None)
+    beepop = PyBeePop()
+    beepop.load_weather_array(
+        pd.to_datetime(weather_df[0], format="%m/%d/%Y").values,
+        *(weather_df[i].values for i in range(1, 7)),
+    )
+    beepop.load_residue_array(
+        pd.to_datetime(residue_df[0], format="%m/%d/%Y").values, residue_df[1], residue_df[2]
+    )
+    beepop.set_parameters(parameters)
+    from_arrays = beepop.run_model()
+    assert list(from_arrays["Date"]) == list(from_files["Date"])
+    for column in ["Max Temp (C)", "Min Temp (C)", "Rain (mm)"]:
+        assert np.allclose(from_arrays[column], from_files[column])
+    assert beepop.beepop.session()["residue"] == beepop.residue_file.key
+    rows = [line.split(b",") for line in beepop.residue_file.array]
+    assert [row[0].decode() for row in rows[:2]] == ["06/15/2014", "06/16/2014"]
+    assert np.allclose([float(row[1]) for row in rows], residue_df[1])
+    assert beepop.run_batch([{"ICWorkerAdults": 5000}], n_workers=1)[0].ok
+
+    with pytest.raises(ValueError):
+        beepop.load_weather_array(["2014-06-01", "2014-06-02"], [1, 2], [1], [1, 2], [1, 2], [1, 2])
+    with pytest.raises(ValueError):
+        beepop.load_residue_array(["2014-06-01"], [np.nan], [0])
+
+
+def test_run_model_output_options():
+    from pybeepop.sensitivity import SummaryReducer
+
+    weather = os.path.join(PROJECT_DIR, "example_data/cedar_grove_NC_weather.txt")
+    beepop = PyBeePop(weather_file=weather)
+    beepop.set_parameters({"SimStart": "06/16/2014", "SimEnd": "10/10/2014"})
+    output = beepop.run_model(columns=["Colony Size", "Adult Workers"], start="07/01/2014")
+    assert list(output.columns) == ["Date", "Colony Size", "Adult Workers"]
+    assert output["Date"].iloc[0] == "07/01/2014"
+    assert output["Date"].iloc[-1] == "10/09/2014"
+    summary = beepop.run_model(reducer=SummaryReducer(["final_colony_size", "collapsed"]))
+    assert summary.shape == (2,) and summary[0] > 0
+    with pytest.raises(ValueError):
+        beepop.run_model(columns=["Colony Size", "Not a column"])
+    results = beepop.run_batch(
+        [{"ICWorkerAdults": 5000}], n_workers=1, columns=["Colony Size"], end="06/30/2014"
+    )
+    assert list(results[0].output.columns) == ["Date", "Colony Size"]
+    assert results[0].output["Date"].iloc[-1] == "06/30/2014"
@@ -0,0 +1,47 @@
+from pybeepop import PyBeePop
+from pybeepop.results import colnames, decode_results, parse_dates, N_HEADER_LINES
+import io
+import os
+import numpy as np
+import pandas as pd
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.abspath(os.path.join(TEST_DIR, os.pardir))
+
+
+def test_decode_matches_text_parser():
+    beepop = PyBeePop()
+    beepop.load_weather(os.path.join(PROJECT_DIR, "example_data/cedar_grove_NC_weather.txt"))
+    beepop.set_parameters(
+        {"SimStart": "01/01/2012", "SimEnd": "12/31/2013", "ICWorkerAdultInfest": 10}
+    )
+    model = beepop.beepop
+    assert model.lib.RunSimulation()
+    lines = model.get_result_lines()[:-1]
+    text = io.StringIO("\n".join(line.decode("utf-8") for line in lines))
+    expected = pd.read_csv(
+        text, sep="\\s+", skiprows=N_HEADER_LINES, names=colnames, dtype={"Date": str}
+    )
+    results = decode_results(lines[N_HEADER_LINES:])
+    pd.testing.assert_frame_equal(results.to_dataframe(), expected, check_exact=True)
+    assert np.isnat(results.dates[0])
+    assert results.dates[1] == np.datetime64("2012-01-01")
+    assert len(results) == len(expected)
+
+    # only the requested columns and dates are decoded
+    columns = ["Forage Day", "Colony Size", "Colony Pollen (g)"]
+    subset = decode_results(lines[N_HEADER_LINES:], columns, "03/01/2012", "2012-03-31")
+    assert subset.names == ["Date", "Colony Size", "Colony Pollen (g)", "Forage Day"]
+    window = expected["Date"].str.match("03/../2012")
+    expected_subset = expected.loc[window, subset.names].reset_index(drop=True)
+    pd.testing.assert_frame_equal(subset.to_dataframe(), expected_subset, check_exact=True)
+    selected = results.select(columns, start=np.datetime64("2012-03-01"), end="03/31/2012")
+    pd.testing.assert_frame_equal(selected.to_dataframe(), expected_subset, check_exact=True)
+    assert len(decode_results(lines[N_HEADER_LINES:], ["Date"], end="01/05/2012")) == 5
+
+
+def test_parse_dates():
+    dates = parse_dates(np.array([b"Initial", b"02/29/2016", b"12/31/1999"]))
+    assert np.isnat(dates[0])
+    assert dates[1] == np.datetime64("2016-02-29")
+    assert dates[2] == np.datetime64("1999-12-31")
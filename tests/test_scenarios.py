@@ -0,0 +1,73 @@
+from pybeepop import ResultStore
+from pybeepop.cli import main
+from pybeepop.parameters import read_parameter_file
+from pybeepop.scenarios import scenario_parameters, validate_scenario_table
+import pandas as pd
+import pytest
+import os
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.abspath(os.path.join(TEST_DIR, os.pardir))
+
+
+def test_read_parameter_file(tmp_path):
+    path = tmp_path / "parameters.txt"
+    path.write_text("# base colony\n ICWorkerAdults = 8000 \r\n\nSimStart=06/16/2014\n")
+    assert read_parameter_file(str(path)) == {"ICWorkerAdults": "8000", "SimStart": "06/16/2014"}
+    path.write_text("ICWorkerAdults=8000\nICWorkerBrood 3000\n")
+    with pytest.raises(ValueError, match="Line 2"):
+        read_parameter_file(str(path))
+
+
+def test_validate_scenario_table():
+    table = pd.DataFrame(
+        {
+            "scenario_id": ["a", "b", "c"],
+            "ICWorkerAdults": ["5000", "lots", None],
+            "SimStart": ["06/16/2014", "13/01/2014", "06/16/2014"],
+            "RQEnableReQueen": ["true", "False", "maybe"],
+            "AIAdultLD50": ["0.05", "1e9", "0.04"],
+        }
+    )
+    with pytest.warns(UserWarning), pytest.raises(ValueError) as error:
+        validate_scenario_table(table)
+    message = str(error.value)
+    assert "ICWorkerAdults must be integer values; scenarios b are not" in message
+    assert "SimStart must be date values; scenarios b are not" in message
+    assert "RQEnableReQueen must be boolean values; scenarios c are not" in message
+    assert "AIAdultLD50" not in message
+
+    table = table.loc[[0], ["scenario_id", "ICWorkerAdults", "AIAdultLD50"]]
+    table.loc[0, "AIAdultLD50"] = "1e9"
+    with pytest.warns(UserWarning, match="AIAdultLD50 is outside"):
+        validate_scenario_table(table)
+    with pytest.raises(ValueError, match="not BeePop\\+ parameters: Colour"):
+        validate_scenario_table(pd.DataFrame({"Colour": ["red"]}))
+    with pytest.raises(ValueError, match="repeated: x, x"):
+        validate_scenario_table(pd.DataFrame({"scenario_id": ["x", "x"]}))
+
+
+def test_command_line_run(tmp_path, capsys):
+    table = tmp_path / "scenarios.csv"
+    table.write_text(
+        "scenario_id,ICWorkerAdults,SimEnd\n"
+        "small,5000,07/16/2014\n"
+        "large,25000,\n"
+    )
+    scenarios = scenario_parameters(str(table))
+    assert scenarios["large"] == {"ICWorkerAdults": "25000"}
+    parameters = tmp_path / "base.txt"
+    parameters.write_text("SimStart=06/16/2014\nSimEnd=08/16/2014\n")
+    weather = os.path.join(PROJECT_DIR, "example_data/cedar_grove_NC_weather.txt")
+    output = str(tmp_path / "results")
+    args = ["run", str(table), "--weather", weather, "--parameters", str(parameters)]
+    args += ["--output", output, "--workers", "1", "--column", "Colony Size", "--quiet"]
+    assert main(args) == 0
+    outputs = ResultStore(output).read()
+    assert list(outputs.columns) == ["scenario_id", "Date", "Colony Size"]
+    assert outputs.groupby("scenario_id").size().to_dict() == {"large": 62, "small": 31}
+
+    assert main(["validate", str(table)]) == 0
+    table.write_text("scenario_id,ICWorkerAdults\nsmall,few\n")
+    assert main(["validate", str(table)]) == 2
+    assert "ICWorkerAdults must be integer values" in capsys.readouterr().err
@@ -0,0 +1,119 @@
+from pybeepop import PyBeePop
+from pybeepop.sensitivity import (
+    SensitivityResult,
+    SummaryReducer,
+    latin_hypercube,
+    parameter_bounds,
+    run_sensitivity,
+    saltelli_design,
+    scale_samples,
+    sobol_indices,
+)
+import pytest
+import numpy as np
+import os
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.abspath(os.path.join(TEST_DIR, os.pardir))
+
+
+def test_latin_hypercube_strata():
+    sample = latin_hypercube(20, 3, seed=0)
+    assert sample.shape == (20, 3)
+    strata = np.sort(np.floor(sample * 20), axis=0)
+    assert (strata == np.arange(20)[:, np.newaxis]).all()
+
+
+def test_scale_samples():
+    with pytest.raises(ValueError):
+        parameter_bounds(["ICWorkerAdults"])  # no Max in the parameter file
+    with pytest.raises(ValueError):
+        parameter_bounds(["SimStart"])
+    unit = np.array([[0.0, 0.0], [0.5, 0.5], [0.9999, 0.9999]])
+    values = scale_samples(unit, ["ICWorkerAdults", "AIAdultLD50"], {"ICWorkerAdults": (10, 20)})
+    assert values[:, 0].tolist() == [10, 15, 20]
+    assert values[:, 1] == pytest.approx([0, 50, 99.99])
+
+
+def test_sobol_indices_ishigami():
+    x = saltelli_design(4096, 3, seed=1) * 2 * np.pi - np.pi
+    y = np.sin(x[:, 0]) + 7 * np.sin(x[:, 1]) ** 2 + 0.1 * x[:, 2] ** 4 * np.sin(x[:, 0])
+    first_order, total_order = sobol_indices(np.column_stack([y, -y]), 3)
+    assert first_order.shape == (3, 2)
+    assert first_order[:, 0] == pytest.approx([0.314, 0.442, 0.0], abs=0.05)
+    assert total_order[:, 0] == pytest.approx([0.558, 0.442, 0.244], abs=0.05)
+    assert (first_order[:, 0] == first_order[:, 1]).all()
+
+    outputs = np.column_stack([y, -y])
+    failed = [7, 4096 + 9, 2 * 4096 + 11]  # runs of three base points failed
+    outputs[failed] = np.nan
+    with_failures = sobol_indices(outputs, 3)
+    assert np.isfinite(with_failures).all()
+    np.testing.assert_array_equal(sobol_indices(outputs, 3, failed=failed), with_failures)
+    assert with_failures[0][:, 0] == pytest.approx(first_order[:, 0], abs=0.01)
+    assert with_failures[1][:, 0] == pytest.approx(total_order[:, 0], abs=0.01)
+
+
+def test_run_sensitivity():
+    test_weather = os.path.join(PROJECT_DIR, "example_data/cedar_grove_NC_weather.txt")
+    beepop = PyBeePop(weather_file=test_weather)
+    beepop.set_parameters({"SimStart": "06/16/2014", "SimEnd": "08/16/2014"})
+    metrics = ["final_colony_size", "collapsed", "collapse_day"]
+    result = run_sensitivity(
+        beepop,
+        ["ICWorkerAdults", "AIAdultLD50"],
+        n=4,
+        bounds={"ICWorkerAdults": (5000, 25000)},
+        metrics=metrics,
+        seed=0,
+        n_workers=2,
+    )
+    assert result.samples.shape == (16, 2)
+    assert result.outputs.shape == (16, 3)
+    assert not result.errors
+    assert (result.outputs[:, 0] > 0).all()
+    assert result.first_order.shape == (2, 3)
+    assert set(result.to_dataframe().columns) == {"S1", "ST"}
+    assert result.dropped_blocks == 0
+    assert np.isfinite(result.outputs).all()  # including collapse_day of surviving colonies
+
+    outputs = result.outputs.copy()
+    errors = {1: "error", 8 + 1: "error", 12 + 2: "error"}  # failed runs in base points 1 and 2
+    outputs[list(errors)] = np.nan
+    failed = SensitivityResult(result.parameters, metrics, result.samples, outputs, errors)
+    assert failed.dropped_blocks == 2
+    assert np.isfinite(failed.first_order[:, 0]).all()
+    outputs[0, 2] = np.nan  # a missing metric value is not a failed run
+    other = SensitivityResult(result.parameters, metrics, result.samples, outputs, errors)
+    assert other.dropped_blocks == 2
+    np.testing.assert_array_equal(other.first_order[:, 0], failed.first_order[:, 0])
+
+
+def test_summary_reducer():
+    output = {"Colony Size": np.array([20000, 15000, 900, 500, 800])}
+    reducer = SummaryReducer(["final_colony_size", "min_colony_size", "collapsed", "collapse_day"])
+    assert reducer(output).tolist() == [800, 500, 1, 1]
+    output["Date"] = np.array(["Initial", "06/16/2014", "06/17/2014", "06/18/2014", "06/19/2014"])
+    assert reducer(output).tolist() == [800, 500, 1, 1]
+    windowed = {name: column[1:] for name, column in output.items()}
+    assert reducer(windowed).tolist() == [800, 500, 1, 1]
+    windowed["Colony Size"] = np.array([900, 15000, 20000, 800])
+    assert reducer(windowed).tolist() == [800, 800, 1, 0]
+    surviving = {"Colony Size": np.array([20000, 15000, 12000])}
+    assert reducer(surviving).tolist() == [12000, 12000, 0, 2]  # the day after the end
+    with pytest.raises(ValueError):
+        SummaryReducer(["not_a_metric"])
+
+
+def test_summary_reducer_date_window():
+    weather = os.path.join(PROJECT_DIR, "example_data/cedar_grove_NC_weather.txt")
+    beepop = PyBeePop(weather_file=weather)
+    beepop.set_parameters({"SimStart": "06/16/2014", "SimEnd": "08/16/2014"})
+    reducer = SummaryReducer(["mean_colony_size", "max_colony_size"])
+    windowed = beepop.run_model(start="07/01/2014")
+    sizes = windowed["Colony Size"].to_numpy(dtype=np.float64)
+    assert len(sizes) == 46
+    expected = [sizes.mean(), sizes.max()]
+    np.testing.assert_allclose(reducer(windowed), expected)
+    results = beepop.run_batch([{}], reducer=reducer, start="07/01/2014", n_workers=1)
+    np.testing.assert_allclose(results[0].output, expected)
@@ -0,0 +1,61 @@
+from pybeepop import PyBeePop, ResultStore
+import pytest
+import numpy as np
+import os
+
+pytest.importorskip("pyarrow")
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.abspath(os.path.join(TEST_DIR, os.pardir))
+
+
+@pytest.fixture(scope="module")
+def output():
+    test_weather = os.path.join(PROJECT_DIR, "example_data/cedar_grove_NC_weather.txt")
+    beepop = PyBeePop(weather_file=test_weather)
+    beepop.set_parameters({"SimStart": "06/16/2014", "SimEnd": "09/16/2014"})
+    return beepop.run_model()
+
+
+def test_store_round_trip(tmp_path, output):
+    with ResultStore(tmp_path, rows_per_file=2 * len(output)) as store:
+        for scenario_id in range(5):
+            store.append(scenario_id, output)
+    store = ResultStore(tmp_path)
+    assert len(store.files()) == 3
+    stored = store.read(scenario_ids=[3])
+    assert (stored["scenario_id"] == 3).all()
+    assert len(stored) == len(output)
+    for name in output.columns:
+        if name == "Date":
+            assert stored[name].iloc[1].strftime("%m/%d/%Y") == output[name].iloc[1]
+        elif output[name].dtype.kind == "f":
+            assert np.allclose(stored[name], output[name], atol=5e-4)
+        else:
+            assert (stored[name].astype(output[name].dtype) == output[name]).all()
+    columns = store.read(columns=["Colony Size"])
+    assert list(columns.columns) == ["scenario_id", "Colony Size"]
+    assert len(columns) == 5 * len(output)
+    assert [scenario_id for scenario_id, _ in store.iter_scenarios()] == list(range(5))
+
+
+def test_store_append_reopened(tmp_path, output):
+    with ResultStore(tmp_path, background=False) as store:
+        store.append("a", output)
+        with pytest.raises(TypeError):
+            store.append(1, output)
+    with ResultStore(tmp_path) as store:
+        store.append("b", output)
+    assert set(ResultStore(tmp_path).read(columns=[])["scenario_id"]) == {"a", "b"}
+
+
+def test_run_batch_to_store(tmp_path):
+    test_weather = os.path.join(PROJECT_DIR, "example_data/cedar_grove_NC_weather.txt")
+    beepop = PyBeePop(weather_file=test_weather)
+    beepop.set_parameters({"SimStart": "06/16/2014", "SimEnd": "07/16/2014"})
+    scenarios = {"low": {"ICWorkerAdults": 5000}, "high": {"ICWorkerAdults": 25000}}
+    with ResultStore(tmp_path) as store:
+        results = beepop.run_batch(scenarios, n_workers=2, store=store)
+    assert all(result.ok and result.output is None for result in results)
+    stored = ResultStore(tmp_path).read(columns=["Colony Size"])
+    assert set(stored["scenario_id"]) == {"low", "high"}
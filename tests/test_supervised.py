@@ -0,0 +1,56 @@
+from pybeepop import PyBeePop, SupervisedExecutor
+import ctypes
+import faulthandler
+import sys
+import time
+import os
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.abspath(os.path.join(TEST_DIR, os.pardir))
+
+
+def misbehave(output):
+    """Hang on a colony of 1111 workers and crash the process on one of 2222."""
+    size = output["Colony Size"].iloc[0]
+    if size == 1111:
+        time.sleep(60)
+    if size == 2222:
+        faulthandler.disable()  # keep pytest from printing the worker's stack
+        if sys.platform == "win32":
+            # ctypes turns an access violation into an OSError on Windows, so end the process
+            # the way a native crash does
+            kernel32 = ctypes.windll.kernel32
+            kernel32.TerminateProcess(kernel32.GetCurrentProcess(), ctypes.c_uint(0xC0000005))
+        ctypes.string_at(0)  # segmentation fault
+    return os.getpid()
+
+
+def test_supervised_executor():
+    weather = os.path.join(PROJECT_DIR, "example_data/cedar_grove_NC_weather.txt")
+    beepop = PyBeePop(weather_file=weather)
+    beepop.set_parameters({"SimStart": "06/16/2014", "SimEnd": "06/30/2014"})
+    scenarios = {
+        "a": {"ICWorkerAdults": 5000},
+        "hang": {"ICWorkerAdults": 1111},
+        "b": {"ICWorkerAdults": 6000},
+        "crash": {"ICWorkerAdults": 2222},
+        "c": {"ICWorkerAdults": 7000},
+        "bad": {"SimEnd": "bad"},
+        "d": {"ICWorkerAdults": 8000},
+    }
+    with SupervisedExecutor(n_workers=2, timeout=5, max_runs=2) as executor:
+        results = beepop.run_batch(scenarios, executor=executor, reducer=misbehave)
+        assert executor.counts["timeouts"] == 1
+        assert executor.counts["crashes"] == 1
+        assert executor.counts["recycled"] >= 1
+        # the workers stay up for the next batch
+        again = beepop.run_batch([{"ICWorkerAdults": 5000}], executor=executor)
+        assert again[0].ok
+    errors = dict((r.scenario_id, r.error) for r in results if not r.ok)
+    assert sorted(errors) == ["bad", "crash", "hang"]
+    assert errors["hang"].startswith("TimeoutError")
+    crash = "STATUS_ACCESS_VIOLATION" if sys.platform == "win32" else "SIGSEGV"
+    assert crash in errors["crash"]
+    assert errors["bad"].startswith("ValueError")
+    pids = [r.output for r in results if r.ok]
+    assert len(pids) == 4 and max(pids.count(pid) for pid in pids) <= 2
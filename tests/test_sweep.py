@@ -0,0 +1,43 @@
+from pybeepop import PyBeePop
+from pybeepop.sweep import run_sweep, year_windows
+import numpy as np
+import pytest
+import os
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.abspath(os.path.join(TEST_DIR, os.pardir))
+
+
+def final_colony_size(output):
+    return float(output["Colony Size"].iloc[-1])
+
+
+def test_sweep_stations_and_windows():
+    weather = os.path.join(PROJECT_DIR, "example_data/cedar_grove_NC_weather.txt")
+    with open(weather) as f:
+        short = [line.rstrip("\n") for line in f if "/2014," in line or "/2015," in line]
+    windows = year_windows(short, "04/01", "09/30")
+    assert windows == [("04/01/2014", "09/30/2014"), ("04/01/2015", "09/30/2015")]
+    assert len(year_windows(weather, "10/01", "03/31")) == 11
+
+    beepop = PyBeePop(weather_file=weather)
+    beepop.set_parameters({"ICWorkerAdults": 12000})
+    stations = {"long": weather, "short": short}
+    with pytest.raises(ValueError, match="'short' has weather from 2014-01-01 to 2015-12-31"):
+        run_sweep(beepop, windows + [("04/01/2016", "09/30/2016")], stations)
+    with pytest.raises(ValueError, match="ends before it starts"):
+        run_sweep(beepop, [("09/30/2014", "04/01/2014")])
+
+    sweep = run_sweep(beepop, windows, stations, reducer=final_colony_size, n_workers=3)
+    assert sweep.stations == ["long", "short"]
+    assert [result.scenario_id for result in sweep["short"]] == [("short", 0), ("short", 1)]
+    array = sweep.to_array()
+    assert array.shape == (2, 2)
+    # the same weather on the same dates; BeePop+ runs can differ slightly between repeats
+    np.testing.assert_allclose(array[0], array[1], rtol=1e-3)
+
+    beepop.set_parameters({"SimStart": "04/01/2015", "SimEnd": "09/30/2015"})
+    assert array[0, 1] == pytest.approx(final_colony_size(beepop.run_model()), rel=1e-3)
+    table = sweep.to_dataframe(names=["Colony Size"])
+    assert table.loc[("short", "04/01/2014", "09/30/2014"), "Colony Size"] == array[1, 0]
+    assert sweep.errors == {}
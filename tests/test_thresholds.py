@@ -0,0 +1,42 @@
+from pybeepop import PyBeePop
+from pybeepop.thresholds import ThresholdSearch
+import pytest
+import os
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.abspath(os.path.join(TEST_DIR, os.pardir))
+
+
+def test_find_application_rate_thresholds():
+    beepop = PyBeePop(
+        weather_file=os.path.join(PROJECT_DIR, "example_data/cedar_grove_NC_weather.txt"),
+        parameter_file=os.path.join(PROJECT_DIR, "example_data/example_parameters.txt"),
+    )
+    beepop.set_parameters(
+        {
+            "SimStart": "04/01/2014",
+            "SimEnd": "09/30/2014",
+            "FoliarEnabled": True,
+            "FoliarAppDate": "06/01/2014",
+            "FoliarForageBegin": "06/01/2014",
+            "FoliarForageEnd": "07/15/2014",
+        }
+    )
+    search = ThresholdSearch(beepop, control={"EAppRate": 0}, n_workers=4)
+    ten, half = search.find("EAppRate", [0.1, 0.5], (1e-4, 10), scale="log", tol=1e-2)
+    assert ten.status == half.status == "found"
+    assert ten.bracket[0] < ten.threshold < ten.bracket[1]
+    assert ten.threshold < half.threshold
+    assert search.runs < 30  # a grid over five decades at this resolution needs hundreds
+
+    runs = search.runs
+    again = search.find("EAppRate", 0.1, (1e-4, 10), scale="log", tol=1e-2, points=2)
+    assert search.runs == runs and again.threshold == ten.threshold
+
+    beepop.set_parameters({"EAppRate": ten.threshold})
+    effect = 1 - beepop.run_model()["Colony Size"].iloc[-1] / search.control_value
+    assert effect == pytest.approx(0.1, abs=0.02)
+
+    assert search.find("EAppRate", 0.1, (20, 30)).status == "above"
+    with pytest.raises(ValueError, match="positive low bound"):
+        search.find("EAppRate", 0.1, (0, 10), scale="log")